@@ -0,0 +1,160 @@
+"""
+Pre-aggregated daily/monthly sales rollups behind the admin dashboard
+"""
+from pymongo import UpdateOne
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional, Union
+
+UNCATEGORIZED = "uncategorized"
+
+
+def _as_datetime(value: Union[str, datetime, None]) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value is None:
+        value = datetime.now(timezone.utc)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def rollup_keys(created_at: Union[str, datetime, None]) -> List[str]:
+    """Day and month rollup ids an event on ``created_at`` feeds.
+
+    There is no all-time document: every order would ``$inc`` the same one,
+    so all-time figures are summed from the month rollups on read.
+    """
+    when = _as_datetime(created_at)
+    return [f"day:{when.strftime('%Y-%m-%d')}", f"month:{when.strftime('%Y-%m')}"]
+
+
+def _category_key(category: Optional[str]) -> str:
+    # Category names become field paths, so keep them dot/dollar free
+    return (category or UNCATEGORIZED).replace(".", "_").replace("$", "_")
+
+
+def order_increments(order: Dict[str, Any], sign: int = 1) -> Dict[str, Any]:
+    """$inc document adding (sign=1) or removing (sign=-1) one order"""
+    inc: Dict[str, Any] = {
+        "orders": sign,
+        "revenue": sign * order.get('total_amount', 0),
+        "units": 0,
+    }
+    for item in order.get('items', []):
+        quantity = item.get('quantity', 0)
+        category = _category_key(item.get('category'))
+        inc["units"] += sign * quantity
+        inc[f"categories.{category}.units"] = inc.get(f"categories.{category}.units", 0) + sign * quantity
+        inc[f"categories.{category}.revenue"] = inc.get(f"categories.{category}.revenue", 0) + sign * item.get('price', 0) * quantity
+    return inc
+
+
+async def _apply(db, created_at, inc: Dict[str, Any], session=None) -> None:
+    await db.analytics_rollups.bulk_write(
+        [UpdateOne({"_id": key}, {"$inc": inc}, upsert=True) for key in rollup_keys(created_at)],
+        ordered=False,
+        session=session
+    )
+
+
+async def record_order(db, order: Dict[str, Any], session=None) -> None:
+    """Fold a newly placed order into its rollups.
+
+    Call after the order has committed, not inside its transaction, so
+    checkouts do not conflict on the shared day/month documents; if this
+    write is lost, ``rebuild_rollups`` repairs the figures.
+    """
+    await _apply(db, order.get('created_at'), order_increments(order), session)
+
+
+async def record_status_change(db, order: Dict[str, Any], old_status: str, new_status: str) -> None:
+    """Take cancelled orders out of the figures (and put reinstated ones back)"""
+    if (old_status == "cancelled") == (new_status == "cancelled"):
+        return
+    sign = -1 if new_status == "cancelled" else 1
+    inc = order_increments(order, sign)
+    inc["cancelled_orders"] = -sign
+    await _apply(db, order.get('created_at'), inc)
+
+
+async def record_customer(db, created_at, session=None) -> None:
+    await _apply(db, created_at, {"customers": 1}, session)
+
+
+async def rebuild_rollups(db) -> int:
+    """Recompute every rollup from orders and users (one pass each)"""
+    totals: Dict[str, Dict[str, float]] = {}
+
+    def add(created_at, inc):
+        for key in rollup_keys(created_at):
+            bucket = totals.setdefault(key, {})
+            for field, value in inc.items():
+                bucket[field] = bucket.get(field, 0) + value
+
+    async for order in db.orders.find({"order_status": {"$ne": "cancelled"}}, {"_id": 0}):
+        add(order.get('created_at'), order_increments(order))
+    async for user in db.users.find({"role": "customer"}, {"_id": 0, "created_at": 1}):
+        add(user.get('created_at'), {"customers": 1})
+
+    await db.analytics_rollups.delete_many({})
+    if totals:
+        await db.analytics_rollups.bulk_write(
+            [UpdateOne({"_id": key}, {"$inc": inc}, upsert=True) for key, inc in totals.items()],
+            ordered=False
+        )
+    return len(totals)
+
+
+def _add(total: Dict[str, Any], rollup: Dict[str, Any]) -> None:
+    for field, value in rollup.items():
+        if field == "_id":
+            continue
+        if isinstance(value, dict):
+            _add(total.setdefault(field, {}), value)
+        else:
+            total[field] = total.get(field, 0) + value
+
+
+def _top_categories(rollup: Dict[str, Any], limit: int = 5) -> List[Dict[str, Any]]:
+    categories = rollup.get('categories', {})
+    ranked = sorted(categories.items(), key=lambda kv: kv[1].get('revenue', 0), reverse=True)
+    return [
+        {"category": name, "units": stats.get('units', 0), "revenue": stats.get('revenue', 0)}
+        for name, stats in ranked[:limit]
+    ]
+
+
+async def load_dashboard(db, days: int = 30, months: int = 12) -> Dict[str, Any]:
+    """All-time totals (summed over the month rollups) plus the recent
+    day/month series"""
+    now = datetime.now(timezone.utc)
+    first_day = (now - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    month_index = now.year * 12 + now.month - 1 - (months - 1)
+    first_month = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}"
+
+    # Ids are "<period>:<key>"; ';' sorts right after ':' and bounds the range
+    total: Dict[str, Any] = {}
+    async for rollup in db.analytics_rollups.find({"_id": {"$gte": "month:", "$lt": "month;"}}):
+        _add(total, rollup)
+    daily = await db.analytics_rollups.find(
+        {"_id": {"$gte": f"day:{first_day}", "$lt": "day;"}}
+    ).sort("_id", 1).to_list(days)
+    monthly = await db.analytics_rollups.find(
+        {"_id": {"$gte": f"month:{first_month}", "$lt": "month;"}}
+    ).sort("_id", 1).to_list(months)
+
+    def series(docs):
+        return [{
+            "period": doc["_id"].split(":", 1)[1],
+            "orders": doc.get('orders', 0),
+            "revenue": doc.get('revenue', 0),
+            "units": doc.get('units', 0),
+            "customers": doc.get('customers', 0),
+        } for doc in docs]
+
+    return {
+        "total": total,
+        "top_categories": _top_categories(total),
+        "daily": series(daily),
+        "monthly": series(monthly),
+    }
@@ -0,0 +1,119 @@
+"""
+Compare FastAPI's default response path with the fast_json paths.
+
+Run from backend/:  python benchmarks/bench_serialization.py [--rows 1000] [--lines 8]
+
+The rows mimic what the voucher list endpoint reads from Mongo: aware
+datetimes, voucher_date stored as midnight UTC and a handful of line items.
+"""
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import copy
+import json
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from erp.accounting_models import SalesVoucher  # noqa: E402
+from fast_json import encode_list  # noqa: E402
+
+FABRICS = ["Cotton", "Silk", "Georgette", "Chiffon", "Linen", "Rayon"]
+GARMENTS = ["Kurta", "Saree", "Dupatta", "Salwar Suit", "Lehenga", "Abaya"]
+
+
+def make_vouchers(rows: int, lines: int) -> List[Dict[str, Any]]:
+    rng = random.Random(42)
+    start = datetime(2025, 4, 1, tzinfo=timezone.utc)
+    vouchers = []
+    for n in range(rows):
+        items = []
+        for _ in range(rng.randint(1, lines)):
+            quantity = rng.randint(1, 12)
+            rate = round(rng.uniform(199, 4999), 2)
+            amount = round(quantity * rate, 2)
+            tax_amount = round(amount * 0.05, 2)
+            items.append({
+                "item_id": str(uuid.uuid4()),
+                "item_name": f"{rng.choice(FABRICS)} {rng.choice(GARMENTS)}",
+                "quantity": quantity,
+                "rate": rate,
+                "amount": amount,
+                "tax_rate": 5.0,
+                "tax_amount": tax_amount,
+                "total": amount + tax_amount,
+            })
+        subtotal = sum(i["amount"] for i in items)
+        tax = sum(i["tax_amount"] for i in items)
+        vouchers.append({
+            "id": str(uuid.uuid4()),
+            "voucher_number": f"SV/2025-26/{n + 1:05d}",
+            "voucher_date": start + timedelta(days=n % 365),
+            "customer_id": str(uuid.uuid4()),
+            "customer_name": f"Customer {n % 250}",
+            "items": items,
+            "subtotal": subtotal,
+            "tax_amount": tax,
+            "discount": 0.0,
+            "total_amount": subtotal + tax,
+            "payment_status": rng.choice(["pending", "partial", "paid"]),
+            "paid_amount": 0.0,
+            "notes": None,
+            "created_by": "admin",
+            "created_at": start + timedelta(days=n % 365, hours=11),
+        })
+    return vouchers
+
+
+async def fastapi_default(field, rows) -> bytes:
+    # What FastAPI does for a plain list return with response_model set
+    content = await serialize_response(field=field, response_content=rows)
+    return JSONResponse(content).body
+
+
+async def run(rows: int, lines: int, repeat: int) -> None:
+    vouchers = make_vouchers(rows, lines)
+    field = create_response_field(name="Response_bench", type_=List[SalesVoucher])
+    payload = await fastapi_default(field, vouchers)
+    print(f"{rows} vouchers, up to {lines} lines each, {len(payload) / 1024:.0f} KiB of JSON\n")
+
+    async def fast_validate(batch):
+        return encode_list(SalesVoucher, batch, "validate")
+
+    async def fast_trust(batch):
+        return encode_list(SalesVoucher, batch, "trust")
+
+    # Each path gets fresh rows: trust mode rewrites date fields in place
+    paths = {
+        "fastapi default": lambda batch: fastapi_default(field, batch),
+        "fast_json validate": fast_validate,
+        "fast_json trust": fast_trust,
+    }
+    baseline = None
+    for name, path in paths.items():
+        batches = [copy.deepcopy(vouchers) for _ in range(repeat)]
+        started = time.perf_counter()
+        for batch in batches:
+            body = await path(batch)
+        elapsed_ms = (time.perf_counter() - started) * 1000 / repeat
+        assert json.loads(body) == json.loads(payload), f"{name} produced a different document"
+        baseline = baseline or elapsed_ms
+        print(f"{name:<20} {elapsed_ms:8.2f} ms/response  {baseline / elapsed_ms:5.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark list response serialization")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--lines", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.lines, args.repeat))
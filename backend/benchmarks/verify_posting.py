@@ -0,0 +1,124 @@
+"""
+Post many vouchers in parallel against a scratch database and check that
+account balances come out exact.
+
+Run from backend/:  python benchmarks/verify_posting.py [--vouchers 1000]
+
+Needs MONGO_URL (read from backend/.env). Uses and then drops the
+database "<DB_NAME>_posting_check". With --legacy the old find_one/$set
+routine is run the same way for comparison; it loses updates.
+"""
+from pathlib import Path
+from types import SimpleNamespace
+import argparse
+import asyncio
+import os
+import random
+import sys
+import uuid
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+from erp.posting import balance_delta, post_balances  # noqa: E402
+
+load_dotenv(Path(__file__).resolve().parent.parent / '.env')
+
+# The accounts every sale, purchase and payment fights over
+ACCOUNTS = [
+    {"code": "1001", "name": "Cash", "account_type": "asset"},
+    {"code": "1002", "name": "Bank", "account_type": "asset"},
+    {"code": "1006", "name": "GST Receivable", "account_type": "asset"},
+    {"code": "2005", "name": "GST Payable", "account_type": "liability"},
+    {"code": "4001", "name": "Sales", "account_type": "income"},
+    {"code": "5001", "name": "Purchases", "account_type": "expense"},
+]
+
+
+def line(account_id: str, debit: float = 0.0, credit: float = 0.0) -> SimpleNamespace:
+    return SimpleNamespace(account_id=account_id, debit=debit, credit=credit)
+
+
+def make_vouchers(count: int, ids: dict) -> list:
+    # Quarter-rupee amounts are exact in binary, so the expected totals do
+    # not depend on the order the increments land in
+    rng = random.Random(7)
+    vouchers = []
+    for _ in range(count):
+        amount = rng.randint(4, 40000) / 4
+        tax = rng.randint(0, 800) / 4
+        kind = rng.choice(["sale", "purchase", "contra"])
+        if kind == "sale":
+            lines = [line(str(uuid.uuid4()), debit=amount + tax),  # customer, not a ledger account
+                     line(ids["4001"], credit=amount), line(ids["2005"], credit=tax)]
+        elif kind == "purchase":
+            lines = [line(ids["5001"], debit=amount), line(ids["1006"], debit=tax),
+                     line(str(uuid.uuid4()), credit=amount + tax)]
+        else:
+            lines = [line(ids["1002"], debit=amount), line(ids["1001"], credit=amount)]
+        vouchers.append(lines)
+    return vouchers
+
+
+def expected_balances(vouchers: list, types: dict) -> dict:
+    balances = {account_id: 0.0 for account_id in types}
+    for lines in vouchers:
+        for entry in lines:
+            if entry.account_id in types:
+                balances[entry.account_id] += balance_delta(types[entry.account_id], entry.debit, entry.credit)
+    return balances
+
+
+async def legacy_post(db, lines) -> None:
+    for entry in lines:
+        account = await db.accounts.find_one({"id": entry.account_id})
+        if not account:
+            continue
+        new_balance = account["current_balance"] + balance_delta(account["account_type"], entry.debit, entry.credit)
+        await db.accounts.update_one({"id": entry.account_id}, {"$set": {"current_balance": new_balance}})
+
+
+async def check(db, name: str, post, vouchers: list, types: dict) -> bool:
+    await db.accounts.update_many({}, {"$set": {"current_balance": 0.0}})
+    await asyncio.gather(*(post(db, lines) for lines in vouchers))
+    expected = expected_balances(vouchers, types)
+    actual = {a["id"]: a["current_balance"] async for a in db.accounts.find({}, {"_id": 0})}
+    exact = actual == expected
+    print(f"{name}: {'exact' if exact else 'WRONG'}")
+    for account_id, value in expected.items():
+        if actual[account_id] != value:
+            print(f"  {account_id}: expected {value:.2f}, got {actual[account_id]:.2f}")
+    return exact
+
+
+async def run(count: int, legacy: bool) -> None:
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[f"{os.environ.get('DB_NAME', 'test_database')}_posting_check"]
+    try:
+        await client.drop_database(db.name)
+        accounts = [{**a, "id": str(uuid.uuid4()), "current_balance": 0.0} for a in ACCOUNTS]
+        await db.accounts.insert_many([dict(a) for a in accounts])
+        ids = {a["code"]: a["id"] for a in accounts}
+        types = {a["id"]: a["account_type"] for a in accounts}
+        vouchers = make_vouchers(count, ids)
+
+        print(f"{count} vouchers posted concurrently over {len(accounts)} accounts\n")
+        ok = await check(db, "post_balances ($inc bulk_write)", post_balances, vouchers, types)
+        if legacy:
+            await check(db, "legacy find_one/$set", legacy_post, vouchers, types)
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+    if not ok:
+        sys.exit(1)
+    print("\n✅ Balances are exact")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify concurrent balance posting")
+    parser.add_argument("--vouchers", type=int, default=1000)
+    parser.add_argument("--legacy", action="store_true", help="also run the old read-modify-write routine")
+    args = parser.parse_args()
+    asyncio.run(run(args.vouchers, args.legacy))
@@ -0,0 +1,135 @@
+"""
+Shared MongoDB client for the whole app, with pool sizing and pool metrics
+"""
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pathlib import Path
+from typing import Any, Dict
+import os
+import threading
+import time
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# The listener modules read their settings at import time, so load .env first
+from metrics import command_metrics  # noqa: E402
+from slow_queries import slow_query_log  # noqa: E402
+
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '10000'))
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts connections and how long operations wait to check one out.
+
+    Motor runs pymongo on executor threads and a checkout starts and
+    finishes on the same thread, so the start time lives in a thread-local.
+    """
+
+    WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.open_connections = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkouts = 0
+        self.failed_checkouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.wait_buckets = [0] * (len(self.WAIT_BUCKETS_MS) + 1)
+
+    def _observe_wait(self) -> None:
+        started = getattr(self._local, 'started', None)
+        if started is None:
+            return
+        self._local.started = None
+        waited_ms = (time.perf_counter() - started) * 1000
+        self.total_wait_ms += waited_ms
+        self.max_wait_ms = max(self.max_wait_ms, waited_ms)
+        for i, bound in enumerate(self.WAIT_BUCKETS_MS):
+            if waited_ms <= bound:
+                self.wait_buckets[i] += 1
+                return
+        self.wait_buckets[-1] += 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._observe_wait()
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._observe_wait()
+            self.failed_checkouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        labels = [f"le_{b}ms" for b in self.WAIT_BUCKETS_MS] + ["gt_%dms" % self.WAIT_BUCKETS_MS[-1]]
+        return {
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "open_connections": self.open_connections,
+            "in_use": self.in_use,
+            "max_in_use": self.max_in_use,
+            "checkouts": self.checkouts,
+            "failed_checkouts": self.failed_checkouts,
+            "avg_wait_ms": round(self.total_wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 3),
+            "wait_histogram": dict(zip(labels, self.wait_buckets)),
+        }
+
+
+pool_monitor = PoolMonitor()
+
+client = AsyncIOMotorClient(
+    os.environ['MONGO_URL'],
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    event_listeners=[pool_monitor, command_metrics, slow_query_log],
+    # Dates are stored as BSON datetimes; read them back as aware UTC values
+    tz_aware=True,
+)
+db = client[os.environ['DB_NAME']]
+
+
+def close_client() -> None:
+    client.close()
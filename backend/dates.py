@@ -0,0 +1,37 @@
+"""
+Helpers for persisting dates as native BSON datetimes
+"""
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+from typing import Dict, Optional, Union
+
+
+def to_bson_date(value: Union[date, datetime]) -> datetime:
+    """Calendar date -> midnight UTC (BSON has no date-only type)"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.combine(value, time.min, tzinfo=timezone.utc)
+
+
+def date_range(from_date: Optional[date] = None, to_date: Optional[date] = None) -> Dict[str, datetime]:
+    """Filter for an inclusive range of calendar days, e.g. {"date": date_range(a, b)}"""
+    bounds: Dict[str, datetime] = {}
+    if from_date:
+        bounds["$gte"] = to_bson_date(from_date)
+    if to_date:
+        bounds["$lt"] = to_bson_date(to_date + timedelta(days=1))
+    return bounds
+
+
+def parse_stored(value: str, naive_tz: tzinfo = timezone.utc) -> datetime:
+    """Parse a legacy ISO string (ValueError if it is not one).
+
+    Naive timestamps are read in ``naive_tz``: the old ERP code wrote local
+    ``datetime.now()``. Bare calendar dates become midnight UTC, like
+    ``to_bson_date``.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        if len(value) == 10:
+            return to_bson_date(parsed.date())
+        parsed = parsed.replace(tzinfo=naive_tz)
+    return parsed.astimezone(timezone.utc)
@@ -0,0 +1,92 @@
+"""
+Process-local chart-of-accounts cache keyed by code and id
+"""
+from typing import Any, Dict, Optional
+import asyncio
+import os
+import time
+
+ACCOUNT_CACHE_TTL_SECONDS = float(os.environ.get('ACCOUNT_CACHE_TTL_SECONDS', '300'))
+
+# Balances change with every voucher; the cache only serves static fields
+_PROJECTION = {"_id": 0, "current_balance": 0}
+
+
+class AccountCache:
+    """The whole chart of accounts, loaded at once and kept in memory.
+
+    Account endpoints invalidate this worker's copy; other workers reload
+    after ``ttl_seconds``, so only fields that are safe to serve slightly
+    stale (names for journal lines) are read from here.
+
+    Account types deliberately are not: the type picks the sign of every
+    balance change, and a type edited in another worker would be applied
+    wrongly until the reload and stay wrong in ``current_balance``.
+    Refusing type edits once an account has postings would not close this
+    for an account edited before its first voucher, so ``write_postings``
+    reads the types of a batch's accounts with one ``$in`` query inside
+    the posting transaction instead.
+    """
+
+    def __init__(self, ttl_seconds: float = ACCOUNT_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._by_code: Dict[str, Dict[str, Any]] = {}
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    async def load(self, db) -> int:
+        """(Re)read every account; called at startup and after expiry"""
+        accounts = await db.accounts.find({}, _PROJECTION).to_list(None)
+        self._by_id = {account["id"]: account for account in accounts}
+        self._by_code = {account["code"]: account for account in accounts}
+        self._expires_at = time.monotonic() + self.ttl_seconds
+        self.loads += 1
+        return len(accounts)
+
+    async def _fresh(self, db) -> None:
+        if time.monotonic() < self._expires_at:
+            return
+        async with self._lock:
+            if time.monotonic() >= self._expires_at:
+                await self.load(db)
+
+    async def by_code(self, db, code: str) -> Optional[Dict[str, Any]]:
+        """Account with this code, or None"""
+        await self._fresh(db)
+        account = self._by_code.get(code)
+        if account is not None:
+            self.hits += 1
+            return account
+        # Codes are user-chosen, so a miss may be an account another worker
+        # just created; confirm with Mongo rather than caching the absence
+        self.misses += 1
+        account = await db.accounts.find_one({"code": code}, _PROJECTION)
+        if account is not None:
+            self._remember(account)
+        return account
+
+    def _remember(self, account: Dict[str, Any]) -> None:
+        self._by_id[account["id"]] = account
+        self._by_code[account["code"]] = account
+
+    def invalidate(self) -> None:
+        """Force a reload on next use after an account was written"""
+        self._expires_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "accounts": len(self._by_id),
+            "ttl_seconds": self.ttl_seconds,
+            "loads": self.loads,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+account_cache = AccountCache()
@@ -4,7 +4,7 @@ Includes Chart of Accounts, Vouchers, Ledgers, and Tax Management
 """
 from pydantic import BaseModel, Field
 from typing import Optional, List
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 import uuid
 
 # ==================== CHART OF ACCOUNTS ====================
@@ -27,7 +27,7 @@ class Account(BaseModel):
     opening_balance: float = 0.0
     current_balance: float = 0.0
     is_system: bool = False  # System accounts (Cash, Bank, etc.)
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class AccountCreate(BaseModel):
     code: str
@@ -65,8 +65,8 @@ class Item(BaseModel):
     reorder_level: float = 0.0
     hsn_code: Optional[str] = None  # For GST
     gst_rate: float = 0.0  # GST percentage
-    created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ItemCreate(BaseModel):
     code: str
@@ -99,7 +99,7 @@ class Party(BaseModel):
     gstin: Optional[str] = None  # GST number
     opening_balance: float = 0.0
     balance_type: str = "credit"  # debit or credit
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class PartyCreate(BaseModel):
     party_type: str
@@ -146,7 +146,7 @@ class JournalEntry(BaseModel):
     voucher_type: str  # sale, purchase, payment, receipt, journal, contra, expense
     entry_date: date
     lines: List[JournalLine]
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 # ==================== VOUCHERS ====================
 
@@ -166,10 +166,10 @@ class SalesVoucher(BaseModel):
     paid_amount: float = 0.0
     notes: Optional[str] = None
     created_by: str
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class SalesVoucherCreate(BaseModel):
-    voucher_number: str
+    voucher_number: Optional[str] = None  # allocated from the series when omitted
     voucher_date: str  # YYYY-MM-DD
     customer_id: str
     customer_name: str
@@ -196,10 +196,10 @@ class PurchaseVoucher(BaseModel):
     paid_amount: float = 0.0
     notes: Optional[str] = None
     created_by: str
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class PurchaseVoucherCreate(BaseModel):
-    voucher_number: str
+    voucher_number: Optional[str] = None  # allocated from the series when omitted
     voucher_date: str
     supplier_id: str
     supplier_name: str
@@ -224,10 +224,10 @@ class PaymentVoucher(BaseModel):
     account_id: str  # Cash/Bank account
     notes: Optional[str] = None
     created_by: str
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class PaymentVoucherCreate(BaseModel):
-    voucher_number: str
+    voucher_number: Optional[str] = None  # allocated from the series when omitted
     voucher_date: str
     party_id: str
     party_name: str
@@ -252,10 +252,10 @@ class ReceiptVoucher(BaseModel):
     account_id: str
     notes: Optional[str] = None
     created_by: str
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ReceiptVoucherCreate(BaseModel):
-    voucher_number: str
+    voucher_number: Optional[str] = None  # allocated from the series when omitted
     voucher_date: str
     party_id: str
     party_name: str
@@ -278,10 +278,10 @@ class ExpenseVoucher(BaseModel):
     paid_from_account_id: str  # Cash/Bank
     notes: Optional[str] = None
     created_by: str
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ExpenseVoucherCreate(BaseModel):
-    voucher_number: str
+    voucher_number: Optional[str] = None  # allocated from the series when omitted
     voucher_date: str
     expense_account_id: str
     expense_account_name: str
@@ -300,10 +300,10 @@ class JournalVoucher(BaseModel):
     total_credit: float
     narration: Optional[str] = None
     created_by: str
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class JournalVoucherCreate(BaseModel):
-    voucher_number: str
+    voucher_number: Optional[str] = None  # allocated from the series when omitted
     voucher_date: str
     lines: List[JournalLine]
     narration: Optional[str] = None
@@ -321,10 +321,10 @@ class ContraVoucher(BaseModel):
     reference: Optional[str] = None
     notes: Optional[str] = None
     created_by: str
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ContraVoucherCreate(BaseModel):
-    voucher_number: str
+    voucher_number: Optional[str] = None  # allocated from the series when omitted
     voucher_date: str
     from_account_id: str
     from_account_name: str
@@ -334,6 +334,20 @@ class ContraVoucherCreate(BaseModel):
     reference: Optional[str] = None
     notes: Optional[str] = None
 
+# ==================== DAY BOOK ====================
+
+class DayBookEntry(BaseModel):
+    """One voucher of any type, as listed in the day book"""
+    id: str  # id of the voucher itself
+    voucher_type: str  # sales, purchase, payment, receipt, expense, journal, contra
+    voucher_number: str
+    voucher_date: date
+    party_id: Optional[str] = None
+    party_name: Optional[str] = None
+    amount: float
+    narration: Optional[str] = None
+    created_at: Optional[datetime] = None
+
 # ==================== LEDGER ====================
 
 class LedgerEntry(BaseModel):
@@ -351,7 +365,7 @@ class LedgerEntry(BaseModel):
     quantity_in: float = 0.0  # For item ledger
     quantity_out: float = 0.0  # For item ledger
     balance: float = 0.0
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 # ==================== REPORTS ====================
 
@@ -385,3 +399,28 @@ class BalanceSheet(BaseModel):
     total_assets: float
     total_liabilities: float
     total_capital: float
+
+class TrialBalanceAccount(BaseModel):
+    """One account's (or party's) line in the trial balance"""
+    account_id: str  # Account id, or party id for customer/supplier lines
+    account_code: str
+    account_name: str
+    account_type: str  # asset, liability, ..., or customer/supplier
+    opening_debit: float = 0.0
+    opening_credit: float = 0.0
+    debit: float = 0.0  # Movement within the period
+    credit: float = 0.0
+    closing_debit: float = 0.0
+    closing_credit: float = 0.0
+
+class TrialBalance(BaseModel):
+    """Trial Balance"""
+    period_from: Optional[date] = None
+    period_to: Optional[date] = None
+    accounts: List[TrialBalanceAccount]
+    total_opening_debit: float
+    total_opening_credit: float
+    total_debit: float
+    total_credit: float
+    total_closing_debit: float
+    total_closing_credit: float
@@ -0,0 +1,127 @@
+"""
+Day book: every voucher of every type in one register collection
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import date
+import logging
+
+from dates import date_range
+from pagination import fetch_page
+
+logger = logging.getLogger(__name__)
+
+REGISTER_COLLECTION = "voucher_register"
+
+# voucher collection -> (voucher type, party id field, party name field, amount field, narration field)
+DAY_BOOK_SOURCES = {
+    "sales_vouchers": ("sales", "customer_id", "customer_name", "total_amount", "notes"),
+    "purchase_vouchers": ("purchase", "supplier_id", "supplier_name", "total_amount", "notes"),
+    "payment_vouchers": ("payment", "party_id", "party_name", "amount", "notes"),
+    "receipt_vouchers": ("receipt", "party_id", "party_name", "amount", "notes"),
+    "expense_vouchers": ("expense", None, None, "amount", "notes"),
+    "journal_vouchers": ("journal", None, None, "total_debit", "narration"),
+    "contra_vouchers": ("contra", None, None, "amount", "notes"),
+}
+
+DAY_BOOK_TYPES = tuple(source[0] for source in DAY_BOOK_SOURCES.values())
+
+# Chronological, then by number; id breaks ties between series
+DAY_BOOK_SORT = [("voucher_date", 1), ("voucher_number", 1), ("id", 1)]
+
+
+def register_entry(collection: str, voucher: Dict[str, Any]) -> Dict[str, Any]:
+    """Register row for a voucher document about to be inserted"""
+    voucher_type, party_id, party_name, amount, narration = DAY_BOOK_SOURCES[collection]
+    return {
+        "id": voucher["id"],
+        "voucher_type": voucher_type,
+        "voucher_number": voucher["voucher_number"],
+        "voucher_date": voucher["voucher_date"],
+        "party_id": voucher.get(party_id) if party_id else None,
+        "party_name": voucher.get(party_name) if party_name else None,
+        "amount": voucher.get(amount, 0.0),
+        "narration": voucher.get(narration),
+        "created_at": voucher.get("created_at"),
+    }
+
+
+# Day-book date filters only match BSON dates; string dates need migrate_dates.py
+_DATED = {"voucher_date": {"$type": "date"}}
+
+
+def _stages(collection: str) -> List[Dict[str, Any]]:
+    """Stages producing ``register_entry`` inside the server"""
+    voucher_type, party_id, party_name, amount, narration = DAY_BOOK_SOURCES[collection]
+    return [{"$match": _DATED}, {"$project": {
+        "_id": 0,
+        "id": 1,
+        "voucher_type": {"$literal": voucher_type},
+        "voucher_number": 1,
+        "voucher_date": 1,
+        "party_id": f"${party_id}" if party_id else {"$literal": None},
+        "party_name": f"${party_name}" if party_name else {"$literal": None},
+        "amount": {"$ifNull": [f"${amount}", 0.0]},
+        "narration": f"${narration}",
+        "created_at": 1,
+    }}]
+
+
+async def rebuild_register(db) -> int:
+    """Copy every voucher into the register with one ``$unionWith`` pipeline.
+
+    Rows already present are kept, so this is safe to run at any time and
+    only fills in what is missing. Vouchers whose date is still an ISO
+    string are skipped and logged; run migrate_dates.py first. Returns the
+    register size afterwards.
+    """
+    collections = list(DAY_BOOK_SOURCES)
+    for collection in collections:
+        skipped = await db[collection].count_documents({"voucher_date": {"$not": {"$type": "date"}}})
+        if skipped:
+            logger.warning("%d %s have no BSON voucher_date and were left out of the day book; "
+                           "run migrate_dates.py", skipped, collection)
+    pipeline: List[Dict[str, Any]] = _stages(collections[0])
+    for collection in collections[1:]:
+        pipeline.append({"$unionWith": {"coll": collection, "pipeline": _stages(collection)}})
+    pipeline.append({"$merge": {
+        "into": REGISTER_COLLECTION,
+        "on": "id",
+        "whenMatched": "keepExisting",
+        "whenNotMatched": "insert",
+    }})
+    await db[collections[0]].aggregate(pipeline).to_list(None)
+    return await db[REGISTER_COLLECTION].count_documents({})
+
+
+async def ensure_register(db) -> Optional[int]:
+    """Backfill the register at startup when it has fewer rows than there
+    are vouchers (first run, or vouchers restored from a backup)"""
+    vouchers = 0
+    for collection in DAY_BOOK_SOURCES:
+        vouchers += await db[collection].estimated_document_count()
+    registered = await db[REGISTER_COLLECTION].estimated_document_count()
+    if registered >= vouchers:
+        return None
+    count = await rebuild_register(db)
+    logger.info("Voucher register backfilled: %d rows", count)
+    return count
+
+
+async def day_book_page(
+    db,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    voucher_type: Optional[str] = None,
+    party_id: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One keyset page of the day book, oldest first"""
+    query: Dict[str, Any] = {}
+    if voucher_type:
+        query["voucher_type"] = voucher_type
+    if party_id:
+        query["party_id"] = party_id
+    if from_date or to_date:
+        query["voucher_date"] = date_range(from_date, to_date)
+    return await fetch_page(db[REGISTER_COLLECTION], query, DAY_BOOK_SORT, limit, cursor)
@@ -64,9 +64,9 @@ async def init_chart_of_accounts():
         {"id": str(uuid.uuid4()), "code": "5099", "name": "Miscellaneous Expenses", "group_id": "expenses", "account_type": "expense", "opening_balance": 0.0, "current_balance": 0.0, "is_system": False},
     ]
     
-    from datetime import datetime
+    from datetime import datetime, timezone
     for account in accounts:
-        account['created_at'] = datetime.now().isoformat()
+        account['created_at'] = datetime.now(timezone.utc)
     
     await db.accounts.insert_many(accounts)
     print(f"✅ Created {len(accounts)} default accounts")
@@ -0,0 +1,200 @@
+"""
+Ledger reads with opening balances from monthly checkpoints
+"""
+from pymongo import UpdateOne
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from dates import date_range, to_bson_date
+from pagination import decode_cursor, encode_cursor, keyset_filter
+from erp.postings import POSTINGS_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_COLLECTION = "ledger_checkpoints"
+
+# ledger key field -> (source collection, field that raises the balance, field that lowers it)
+LEDGER_FIELDS = {
+    "account_id": (POSTINGS_COLLECTION, "debit", "credit"),
+    "party_id": ("ledger_entries", "debit", "credit"),
+    "item_id": ("ledger_entries", "quantity_in", "quantity_out"),
+}
+
+# Sorting on _id keeps insertion order within a day
+LEDGER_SORT = [("date", 1), ("_id", 1)]
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def checkpoint_updates(collection: str, entries: List[Dict[str, Any]]) -> List[UpdateOne]:
+    """``$inc`` upserts adding rows of ``collection`` to their monthly checkpoints.
+
+    A checkpoint holds one month's total movement (not a running balance),
+    so a back-dated voucher only touches its own month.
+    """
+    totals: Dict[Tuple[str, str, datetime], Tuple[float, float]] = {}
+    for entry in entries:
+        for field, (source, increase, decrease) in LEDGER_FIELDS.items():
+            if source != collection or entry.get(field) is None:
+                continue
+            key = (field, entry[field], month_start(entry["date"]))
+            up, down = totals.get(key, (0.0, 0.0))
+            totals[key] = (up + entry.get(increase, 0.0), down + entry.get(decrease, 0.0))
+    return [
+        UpdateOne(
+            {"field": field, "entity_id": entity_id, "month": month},
+            {"$inc": {"increase": up, "decrease": down}},
+            upsert=True,
+        )
+        for (field, entity_id, month), (up, down) in totals.items()
+    ]
+
+
+async def _movement(collection, match: Dict[str, Any], increase: str, decrease: str) -> float:
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": None, "up": {"$sum": f"${increase}"}, "down": {"$sum": f"${decrease}"}}},
+    ]
+    result = await collection.aggregate(pipeline).to_list(1)
+    return result[0]["up"] - result[0]["down"] if result else 0.0
+
+
+async def opening_balance(db, field: str, entity_id: str, from_date: Optional[date]) -> float:
+    """Balance before ``from_date``: whole months from checkpoints, plus the
+    rows between the start of that month and ``from_date``"""
+    if not from_date:
+        return 0.0
+    source, increase, decrease = LEDGER_FIELDS[field]
+    month = to_bson_date(from_date.replace(day=1))
+    balance = await _movement(
+        db[CHECKPOINT_COLLECTION],
+        {"field": field, "entity_id": entity_id, "month": {"$lt": month}},
+        "increase", "decrease"
+    )
+    if from_date.day > 1:
+        balance += await _movement(
+            db[source],
+            {field: entity_id, "date": {"$gte": month, "$lt": to_bson_date(from_date)}},
+            increase, decrease
+        )
+    return balance
+
+
+def _ledger_query(field: str, entity_id: str, from_date: Optional[date], to_date: Optional[date]) -> Dict[str, Any]:
+    query: Dict[str, Any] = {field: entity_id}
+    if from_date or to_date:
+        query["date"] = date_range(from_date, to_date)
+    return query
+
+
+async def ledger_page(
+    db,
+    field: str,
+    entity_id: str,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    limit: int = 1000,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of a ledger, oldest first, with running balances.
+
+    The first page starts from the opening balance at ``from_date``; the
+    cursor carries the balance forward so later pages never re-read history.
+    """
+    source, increase, decrease = LEDGER_FIELDS[field]
+    query = _ledger_query(field, entity_id, from_date, to_date)
+    if cursor:
+        values, extra = decode_cursor(cursor)
+        query = {"$and": [query, keyset_filter(LEDGER_SORT, values)]}
+        balance = float(extra.get("balance", 0.0))
+    else:
+        balance = await opening_balance(db, field, entity_id, from_date)
+
+    entries = await db[source].find(query).sort(LEDGER_SORT).limit(limit + 1).to_list(limit + 1)
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    for entry in entries:
+        balance += entry.get(increase, 0.0) - entry.get(decrease, 0.0)
+        entry['balance'] = balance
+    next_cursor = None
+    if has_more:
+        last = entries[-1]
+        next_cursor = encode_cursor([last["date"], last["_id"]], {"balance": balance})
+    for entry in entries:
+        del entry["_id"]
+    return entries, next_cursor
+
+
+async def ledger_stream(db, field: str, entity_id: str, from_date: Optional[date], to_date: Optional[date],
+                        batch_size: int) -> AsyncIterator[Dict[str, Any]]:
+    """Every ledger row in the window with running balances, for exports"""
+    source, increase, decrease = LEDGER_FIELDS[field]
+    balance = await opening_balance(db, field, entity_id, from_date)
+    cursor = db[source].find(_ledger_query(field, entity_id, from_date, to_date), {"_id": 0}) \
+        .sort(LEDGER_SORT).batch_size(batch_size)
+    async for entry in cursor:
+        balance += entry.get(increase, 0.0) - entry.get(decrease, 0.0)
+        entry['balance'] = balance
+        yield entry
+
+
+async def rebuild_checkpoints(db, fields: Iterable[str] = tuple(LEDGER_FIELDS)) -> int:
+    """Recompute checkpoints from the ledger rows (one pipeline per key
+    field, each ``$merge``-d over the existing rows). Returns the count.
+
+    Requires migrate_dates.py to have been run: rows whose ``date`` is
+    still an ISO string are skipped (and logged), since neither the
+    checkpoints nor the ledger's date filters can place them.
+    """
+    for field in fields:
+        source, increase, decrease = LEDGER_FIELDS[field]
+        keyed = {field: {"$exists": True, "$ne": None}}
+        skipped = await db[source].count_documents({**keyed, "date": {"$not": {"$type": "date"}}})
+        if skipped:
+            logger.warning("%d %s rows with %s have no BSON date and were left out of the "
+                           "checkpoints; run migrate_dates.py", skipped, source, field)
+        pipeline = [
+            {"$match": {**keyed, "date": {"$type": "date"}}},
+            {"$group": {
+                "_id": {
+                    "entity_id": f"${field}",
+                    "month": {"$dateFromParts": {"year": {"$year": "$date"}, "month": {"$month": "$date"}}},
+                },
+                "increase": {"$sum": f"${increase}"},
+                "decrease": {"$sum": f"${decrease}"},
+            }},
+            {"$project": {
+                "_id": 0,
+                "field": {"$literal": field},
+                "entity_id": "$_id.entity_id",
+                "month": "$_id.month",
+                "increase": 1,
+                "decrease": 1,
+            }},
+            {"$merge": {
+                "into": CHECKPOINT_COLLECTION,
+                "on": ["field", "entity_id", "month"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert",
+            }},
+        ]
+        await db[source].aggregate(pipeline).to_list(None)
+    return await db[CHECKPOINT_COLLECTION].count_documents({})
+
+
+async def ensure_checkpoints(db) -> Optional[int]:
+    """Build checkpoints at startup for ledgers written before they existed"""
+    missing = []
+    for field, (source, _, _) in LEDGER_FIELDS.items():
+        if await db[CHECKPOINT_COLLECTION].find_one({"field": field}, {"_id": 1}):
+            continue
+        if await db[source].find_one({field: {"$exists": True, "$ne": None}}, {"_id": 1}):
+            missing.append(field)
+    if not missing:
+        return None
+    count = await rebuild_checkpoints(db, missing)
+    logger.info("Ledger checkpoints built: %d months", count)
+    return count
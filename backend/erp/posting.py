@@ -0,0 +1,365 @@
+"""
+Voucher posting: every write a voucher makes, committed as one batch
+"""
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from transactions import run_in_transaction
+from sequences import sequence_allocator
+from dates import to_bson_date
+from erp.account_cache import account_cache
+from erp.day_book import REGISTER_COLLECTION, register_entry
+from erp.ledger import CHECKPOINT_COLLECTION, checkpoint_updates
+from erp.postings import POSTINGS_COLLECTION, posting_rows
+from erp.trial_balance import mark_postings
+from erp.accounting_models import (
+    SalesVoucher, SalesVoucherCreate,
+    PurchaseVoucher, PurchaseVoucherCreate,
+    JournalEntry, JournalLine
+)
+
+# Debit increases these; credit increases liability, capital and income
+DEBIT_NORMAL_TYPES = ("asset", "expense")
+
+
+def balance_delta(account_type: str, debit: float, credit: float) -> float:
+    """Change in ``current_balance`` for a debit/credit on an account of this type"""
+    if account_type in DEBIT_NORMAL_TYPES:
+        return debit - credit
+    return credit - debit
+
+
+def net_lines(lines: Iterable) -> Dict[str, Tuple[float, float]]:
+    """Total debit and credit per account_id (a voucher may hit one account twice)"""
+    totals: Dict[str, Tuple[float, float]] = {}
+    for line in lines:
+        debit, credit = totals.get(line.account_id, (0.0, 0.0))
+        totals[line.account_id] = (debit + line.debit, credit + line.credit)
+    return totals
+
+
+async def account_types(db, account_ids: List[str], session=None) -> Dict[str, str]:
+    cursor = db.accounts.find(
+        {"id": {"$in": account_ids}}, {"_id": 0, "id": 1, "account_type": 1}, session=session
+    )
+    return {account["id"]: account.get("account_type") async for account in cursor}
+
+
+async def post_balances(db, lines: Iterable, session=None, types: Optional[Dict[str, str]] = None) -> int:
+    """Apply a voucher's journal lines to account balances.
+
+    Every touched account gets one ``$inc`` and all of them go out in a
+    single ``bulk_write``, so concurrent vouchers on the same account
+    (Cash, Sales, GST) cannot overwrite each other. Lines whose account_id
+    is not a ledger account (customer/supplier lines) are skipped, as before.
+    ``types`` (account_id -> account_type) skips the lookup when the caller
+    already has it. Returns the number of accounts updated.
+    """
+    totals = net_lines(lines)
+    if not totals:
+        return 0
+    if types is None:
+        types = await account_types(db, list(totals), session=session)
+    operations = []
+    for account_id, (debit, credit) in totals.items():
+        if account_id not in types:
+            continue
+        delta = balance_delta(types[account_id], debit, credit)
+        if delta:
+            operations.append(UpdateOne({"id": account_id}, {"$inc": {"current_balance": delta}}))
+    if not operations:
+        return 0
+    result = await db.accounts.bulk_write(operations, ordered=False, session=session)
+    return result.modified_count
+
+
+class VoucherPosting:
+    """Collects the writes for one voucher before anything is sent.
+
+    Endpoints describe the voucher, its stock movements, ledger rows and
+    journal entry; ``commit`` then issues a fixed number of batched writes
+    however many lines the voucher has.
+    """
+
+    def __init__(self, collection: str, voucher: Dict[str, Any]):
+        self.collection = collection
+        self.voucher = voucher
+        self.stock: Dict[str, float] = {}
+        self.ledger_entries: List[Dict[str, Any]] = []
+        self.journal: Optional[Dict[str, Any]] = None
+        self.lines: List[Any] = []
+
+    def move_stock(self, item_id: str, quantity_in: float = 0.0, quantity_out: float = 0.0) -> None:
+        self.stock[item_id] = self.stock.get(item_id, 0.0) + quantity_in - quantity_out
+
+    def add_ledger_entry(self, entry: Dict[str, Any]) -> None:
+        entry.setdefault('created_at', datetime.now(timezone.utc))
+        self.ledger_entries.append(entry)
+
+    def set_journal(self, journal: Dict[str, Any], lines: Iterable) -> None:
+        """Journal entry document plus the lines that move account balances"""
+        self.journal = journal
+        self.lines = list(lines)
+
+    async def commit(self, client, db) -> None:
+        """Apply every write in one transaction (sequentially on a standalone server)"""
+        await commit_postings(client, db, [self])
+
+
+async def write_postings(db, postings: List[VoucherPosting], session=None) -> None:
+    """Issue the writes of many postings as one set of batched commands.
+
+    Stock moves and balance lines are netted across all postings, so a
+    batch costs the same handful of round trips as a single voucher.
+    """
+    # Vouchers go first so a duplicate number stops everything else
+    by_collection: Dict[str, List[Dict[str, Any]]] = {}
+    for posting in postings:
+        by_collection.setdefault(posting.collection, []).append(posting.voucher)
+    for collection, vouchers in by_collection.items():
+        try:
+            await db[collection].insert_many(vouchers, session=session)
+        except BulkWriteError as e:
+            # Surface a taken voucher number the same way insert_one would
+            duplicate = next((err for err in e.details.get("writeErrors", []) if err.get("code") == 11000), None)
+            if duplicate is None:
+                raise
+            raise DuplicateKeyError(duplicate.get("errmsg", "duplicate key"), 11000, duplicate) from e
+    # Day book row for every voucher, whatever its type
+    await db[REGISTER_COLLECTION].insert_many(
+        [register_entry(posting.collection, posting.voucher) for posting in postings], session=session
+    )
+
+    stock: Dict[str, float] = {}
+    for posting in postings:
+        for item_id, delta in posting.stock.items():
+            stock[item_id] = stock.get(item_id, 0.0) + delta
+    if stock:
+        now = datetime.now(timezone.utc)
+        await db.items.bulk_write([
+            UpdateOne({"id": item_id}, {"$inc": {"current_stock": delta}, "$set": {"updated_at": now}})
+            for item_id, delta in stock.items()
+        ], ordered=False, session=session)
+
+    lines = [line for posting in postings for line in posting.lines]
+    # Read inside the transaction, never from the cache: the type decides the
+    # sign of every balance change and may have just been edited elsewhere
+    types = await account_types(db, list(net_lines(lines)), session=session)
+
+    ledger_entries = [entry for posting in postings for entry in posting.ledger_entries]
+    if ledger_entries:
+        await db.ledger_entries.insert_many(ledger_entries, session=session)
+    journals = [posting.journal for posting in postings if posting.journal is not None]
+    if journals:
+        await db.journal_entries.insert_many(journals, session=session)
+    # One flat row per journal line for account reports
+    rows = [
+        row for posting in postings if posting.journal is not None
+        for row in posting_rows(posting.journal, posting.voucher["voucher_number"], types)
+    ]
+    if rows:
+        await db[POSTINGS_COLLECTION].insert_many(rows, session=session)
+
+    checkpoints = checkpoint_updates("ledger_entries", ledger_entries) + checkpoint_updates(POSTINGS_COLLECTION, rows)
+    if checkpoints:
+        await db[CHECKPOINT_COLLECTION].bulk_write(checkpoints, ordered=False, session=session)
+    await post_balances(db, lines, session=session, types=types)
+
+
+async def commit_postings(client, db, postings: List[VoucherPosting]) -> None:
+    async def callback(session):
+        await write_postings(db, postings, session=session)
+    try:
+        await run_in_transaction(client, callback)
+    finally:
+        # Outside the transaction so vouchers never conflict on the markers;
+        # after a failure it only costs cached trial balances a recompute
+        await mark_postings(db, [posting.journal["entry_date"] for posting in postings
+                                 if posting.journal is not None])
+
+
+def journal_document(journal_entry: JournalEntry) -> Dict[str, Any]:
+    journal_dict = journal_entry.model_dump()
+    journal_dict['entry_date'] = to_bson_date(journal_dict['entry_date'])
+    return journal_dict
+
+
+# ==================== INVOICES ====================
+# Sales and purchase vouchers are built here rather than in the endpoints
+# because the bulk importer posts exactly the same documents.
+
+async def build_sales_posting(db, voucher: SalesVoucherCreate, created_by: str) -> Tuple[SalesVoucher, VoucherPosting]:
+    """Sales invoice: stock out, Sales/GST Payable credited, customer debited"""
+    # Manual numbers are checked by the unique voucher_number index on insert
+    if not voucher.voucher_number:
+        voucher.voucher_number = await sequence_allocator.next(
+            db, "sales_voucher", date.fromisoformat(voucher.voucher_date)
+        )
+    
+    voucher_data = SalesVoucher(**voucher.model_dump(), created_by=created_by)
+    voucher_data.voucher_date = date.fromisoformat(voucher.voucher_date)
+    
+    voucher_dict = voucher_data.model_dump()
+    voucher_dict['voucher_date'] = to_bson_date(voucher_dict['voucher_date'])
+    posting = VoucherPosting("sales_vouchers", voucher_dict)
+    
+    # Update item stock (reduce)
+    for item in voucher.items:
+        posting.move_stock(item.item_id, quantity_out=item.quantity)
+        
+        # Create item ledger entry
+        posting.add_ledger_entry({
+            "date": to_bson_date(voucher_data.voucher_date),
+            "item_id": item.item_id,
+            "voucher_type": "sales",
+            "voucher_number": voucher.voucher_number,
+            "particulars": f"Sales to {voucher.customer_name}",
+            "quantity_out": item.quantity,
+            "balance": 0.0  # Will be calculated
+        })
+    
+    # Create journal entries (Double-entry)
+    journal_lines = []
+    
+    # Debit: Customer Account (Sundry Debtors) or Cash if paid
+    journal_lines.append(JournalLine(
+        account_id=voucher.customer_id,
+        account_name=voucher.customer_name,
+        debit=voucher.total_amount,
+        credit=0.0,
+        narration="Sales invoice"
+    ))
+    
+    # Credit: Sales Account
+    sales_account = await account_cache.by_code(db, "4001")  # Sales account
+    if sales_account:
+        journal_lines.append(JournalLine(
+            account_id=sales_account['id'],
+            account_name=sales_account['name'],
+            debit=0.0,
+            credit=voucher.subtotal,
+            narration="Sales revenue"
+        ))
+    
+    # Credit: Tax Account (if applicable)
+    if voucher.tax_amount > 0:
+        tax_account = await account_cache.by_code(db, "2005")  # GST Payable
+        if tax_account:
+            journal_lines.append(JournalLine(
+                account_id=tax_account['id'],
+                account_name=tax_account['name'],
+                debit=0.0,
+                credit=voucher.tax_amount,
+                narration="GST collected"
+            ))
+    
+    # Journal entry and account balances
+    journal_entry = JournalEntry(
+        voucher_id=voucher_data.id,
+        voucher_type="sales",
+        entry_date=voucher_data.voucher_date,
+        lines=journal_lines
+    )
+    posting.set_journal(journal_document(journal_entry), journal_lines)
+    
+    # Create customer ledger entry
+    posting.add_ledger_entry({
+        "date": to_bson_date(voucher_data.voucher_date),
+        "party_id": voucher.customer_id,
+        "voucher_type": "sales",
+        "voucher_number": voucher.voucher_number,
+        "particulars": "Sales invoice",
+        "debit": voucher.total_amount,
+        "credit": 0.0,
+        "balance": 0.0
+    })
+    
+    return voucher_data, posting
+
+
+async def build_purchase_posting(db, voucher: PurchaseVoucherCreate, created_by: str) -> Tuple[PurchaseVoucher, VoucherPosting]:
+    """Purchase bill: stock in, Purchases/GST Receivable debited, supplier credited"""
+    if not voucher.voucher_number:
+        voucher.voucher_number = await sequence_allocator.next(
+            db, "purchase_voucher", date.fromisoformat(voucher.voucher_date)
+        )
+    
+    voucher_data = PurchaseVoucher(**voucher.model_dump(), created_by=created_by)
+    voucher_data.voucher_date = date.fromisoformat(voucher.voucher_date)
+    
+    voucher_dict = voucher_data.model_dump()
+    voucher_dict['voucher_date'] = to_bson_date(voucher_dict['voucher_date'])
+    posting = VoucherPosting("purchase_vouchers", voucher_dict)
+    
+    # Update item stock (increase)
+    for item in voucher.items:
+        posting.move_stock(item.item_id, quantity_in=item.quantity)
+        
+        posting.add_ledger_entry({
+            "date": to_bson_date(voucher_data.voucher_date),
+            "item_id": item.item_id,
+            "voucher_type": "purchase",
+            "voucher_number": voucher.voucher_number,
+            "particulars": f"Purchase from {voucher.supplier_name}",
+            "quantity_in": item.quantity,
+            "balance": 0.0
+        })
+    
+    # Create journal entries
+    journal_lines = []
+    
+    # Debit: Purchase Account
+    purchase_account = await account_cache.by_code(db, "5001")  # Purchase account
+    if purchase_account:
+        journal_lines.append(JournalLine(
+            account_id=purchase_account['id'],
+            account_name=purchase_account['name'],
+            debit=voucher.subtotal,
+            credit=0.0,
+            narration="Purchase of goods"
+        ))
+    
+    # Debit: Tax Account (if applicable)
+    if voucher.tax_amount > 0:
+        tax_account = await account_cache.by_code(db, "1006")  # GST Receivable
+        if tax_account:
+            journal_lines.append(JournalLine(
+                account_id=tax_account['id'],
+                account_name=tax_account['name'],
+                debit=voucher.tax_amount,
+                credit=0.0,
+                narration="GST paid"
+            ))
+    
+    # Credit: Supplier Account (Sundry Creditors)
+    journal_lines.append(JournalLine(
+        account_id=voucher.supplier_id,
+        account_name=voucher.supplier_name,
+        debit=0.0,
+        credit=voucher.total_amount,
+        narration="Purchase bill"
+    ))
+    
+    journal_entry = JournalEntry(
+        voucher_id=voucher_data.id,
+        voucher_type="purchase",
+        entry_date=voucher_data.voucher_date,
+        lines=journal_lines
+    )
+    posting.set_journal(journal_document(journal_entry), journal_lines)
+    
+    # Create supplier ledger entry
+    posting.add_ledger_entry({
+        "date": to_bson_date(voucher_data.voucher_date),
+        "party_id": voucher.supplier_id,
+        "voucher_type": "purchase",
+        "voucher_number": voucher.voucher_number,
+        "particulars": "Purchase bill",
+        "debit": 0.0,
+        "credit": voucher.total_amount,
+        "balance": 0.0
+    })
+    
+    return voucher_data, posting
@@ -0,0 +1,96 @@
+"""
+Flat journal postings: one indexed row per journal line
+"""
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+POSTINGS_COLLECTION = "postings"
+
+
+def posting_rows(journal: Dict[str, Any], voucher_number: str, account_types: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Rows for a journal entry document.
+
+    A line whose account_id is a ledger account gets ``account_id``;
+    customer/supplier lines get ``party_id`` instead, so account reports
+    never have to skip them. Row ids are ``<journal id>:<line index>``,
+    which lets a rebuild recognise rows that already exist.
+    """
+    rows = []
+    for index, line in enumerate(journal["lines"]):
+        key = "account_id" if line["account_id"] in account_types else "party_id"
+        rows.append({
+            "id": f"{journal['id']}:{index}",
+            "journal_id": journal["id"],
+            "voucher_id": journal["voucher_id"],
+            "voucher_type": journal["voucher_type"],
+            "voucher_number": voucher_number,
+            "date": journal["entry_date"],
+            key: line["account_id"],
+            "account_name": line["account_name"],
+            "particulars": line.get("narration") or journal["voucher_type"],
+            "debit": line.get("debit", 0.0),
+            "credit": line.get("credit", 0.0),
+            "created_at": journal.get("created_at"),
+        })
+    return rows
+
+
+async def rebuild_postings(db) -> int:
+    """Flatten every journal entry into postings with one pipeline.
+
+    Voucher numbers come from the day-book register, falling back to the
+    voucher id for a voucher missing from it; rows that already exist are
+    kept. Journals whose entry_date is still an ISO string are skipped and
+    logged (run migrate_dates.py first), as date filters could never match
+    their postings. Returns the number of postings afterwards.
+    """
+    skipped = await db.journal_entries.count_documents({"entry_date": {"$not": {"$type": "date"}}})
+    if skipped:
+        logger.warning("%d journal entries have no BSON entry_date and were not posted; "
+                       "run migrate_dates.py", skipped)
+    pipeline = [
+        {"$match": {"entry_date": {"$type": "date"}}},
+        {"$unwind": {"path": "$lines", "includeArrayIndex": "line"}},
+        {"$lookup": {"from": "accounts", "localField": "lines.account_id", "foreignField": "id", "as": "account"}},
+        {"$lookup": {"from": "voucher_register", "localField": "voucher_id", "foreignField": "id", "as": "voucher"}},
+        {"$project": {
+            "_id": 0,
+            "id": {"$concat": ["$id", ":", {"$toString": "$line"}]},
+            "journal_id": "$id",
+            "voucher_id": 1,
+            "voucher_type": 1,
+            "voucher_number": {"$ifNull": [{"$arrayElemAt": ["$voucher.voucher_number", 0]}, "$voucher_id"]},
+            "date": "$entry_date",
+            "account_id": {"$cond": [{"$gt": [{"$size": "$account"}, 0]}, "$lines.account_id", "$$REMOVE"]},
+            "party_id": {"$cond": [{"$gt": [{"$size": "$account"}, 0]}, "$$REMOVE", "$lines.account_id"]},
+            "account_name": "$lines.account_name",
+            "particulars": {"$ifNull": ["$lines.narration", "$voucher_type"]},
+            "debit": {"$ifNull": ["$lines.debit", 0.0]},
+            "credit": {"$ifNull": ["$lines.credit", 0.0]},
+            "created_at": 1,
+        }},
+        {"$merge": {
+            "into": POSTINGS_COLLECTION,
+            "on": "id",
+            "whenMatched": "keepExisting",
+            "whenNotMatched": "insert",
+        }},
+    ]
+    await db.journal_entries.aggregate(pipeline).to_list(None)
+    return await db[POSTINGS_COLLECTION].count_documents({})
+
+
+async def ensure_postings(db) -> Optional[int]:
+    """Backfill postings at startup for journals written before they existed.
+
+    Run after the day-book register is filled, which supplies voucher numbers.
+    """
+    if await db[POSTINGS_COLLECTION].estimated_document_count():
+        return None
+    if not await db.journal_entries.estimated_document_count():
+        return None
+    count = await rebuild_postings(db)
+    logger.info("Journal postings backfilled: %d rows", count)
+    return count
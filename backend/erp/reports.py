@@ -1,14 +1,9 @@
 from fastapi import APIRouter
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import db
 from datetime import datetime, timezone
-import os
 
 router = APIRouter(prefix="/erp/reports", tags=["ERP-Reports"])
 
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
 @router.get("/sales-summary")
 async def get_sales_summary(start_date: str = None, end_date: str = None):
     query = {}
@@ -1,13 +1,19 @@
 """
 Reports APIs - Ledgers, Outstanding, P&L, Balance Sheet
 """
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from typing import List, Optional
-from datetime import datetime, date
+from datetime import date
 from erp.accounting_models import (
-    LedgerEntry, OutstandingReport, ProfitLossStatement, BalanceSheet
+    LedgerEntry, OutstandingReport, ProfitLossStatement, BalanceSheet,
+    TrialBalance, TrialBalanceAccount
 )
 from server import get_current_admin, User, db
+from dates import date_range
+from exports import EXPORT_BATCH_SIZE, export_response
+from pagination import set_next_cursor
+from erp.ledger import ledger_page, ledger_stream
+from erp.trial_balance import trial_balance_cache
 
 router = APIRouter()
 
@@ -16,102 +22,94 @@ router = APIRouter()
 @router.get("/erp/ledgers/account/{account_id}", response_model=List[LedgerEntry])
 async def get_account_ledger(
     account_id: str,
-    from_date: Optional[str] = None,
-    to_date: Optional[str] = None,
+    response: Response,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_admin)
 ):
-    """Get account ledger"""
-    query = {"account_id": account_id}
-    
-    if from_date:
-        query["date"] = {"$gte": from_date}
-    if to_date:
-        if "date" in query:
-            query["date"]["$lte"] = to_date
-        else:
-            query["date"] = {"$lte": to_date}
-    
-    entries = await db.ledger_entries.find(query, {"_id": 0}).sort("date", 1).to_list(1000)
-    
-    # Calculate running balance
-    balance = 0.0
-    for entry in entries:
-        if isinstance(entry.get('date'), str):
-            entry['date'] = date.fromisoformat(entry['date'])
-        if isinstance(entry.get('created_at'), str):
-            entry['created_at'] = datetime.fromisoformat(entry['created_at'])
-        
-        balance += entry.get('debit', 0.0) - entry.get('credit', 0.0)
-        entry['balance'] = balance
-    
+    """Get account ledger, balance carried from before from_date (keyset paginated)"""
+    entries, next_cursor = await ledger_page(db, "account_id", account_id, from_date, to_date, limit, cursor)
+    set_next_cursor(response, next_cursor)
     return entries
 
 @router.get("/erp/ledgers/party/{party_id}", response_model=List[LedgerEntry])
 async def get_party_ledger(
     party_id: str,
-    from_date: Optional[str] = None,
-    to_date: Optional[str] = None,
+    response: Response,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_admin)
 ):
-    """Get party ledger (customer/supplier)"""
-    query = {"party_id": party_id}
-    
-    if from_date:
-        query["date"] = {"$gte": from_date}
-    if to_date:
-        if "date" in query:
-            query["date"]["$lte"] = to_date
-        else:
-            query["date"] = {"$lte": to_date}
-    
-    entries = await db.ledger_entries.find(query, {"_id": 0}).sort("date", 1).to_list(1000)
-    
-    # Calculate running balance
-    balance = 0.0
-    for entry in entries:
-        if isinstance(entry.get('date'), str):
-            entry['date'] = date.fromisoformat(entry['date'])
-        if isinstance(entry.get('created_at'), str):
-            entry['created_at'] = datetime.fromisoformat(entry['created_at'])
-        
-        balance += entry.get('debit', 0.0) - entry.get('credit', 0.0)
-        entry['balance'] = balance
-    
+    """Get party ledger (customer/supplier), balance carried from before from_date"""
+    entries, next_cursor = await ledger_page(db, "party_id", party_id, from_date, to_date, limit, cursor)
+    set_next_cursor(response, next_cursor)
     return entries
 
 @router.get("/erp/ledgers/item/{item_id}", response_model=List[LedgerEntry])
 async def get_item_ledger(
     item_id: str,
-    from_date: Optional[str] = None,
-    to_date: Optional[str] = None,
+    response: Response,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_admin)
 ):
-    """Get item ledger (stock movement)"""
-    query = {"item_id": item_id}
-    
-    if from_date:
-        query["date"] = {"$gte": from_date}
-    if to_date:
-        if "date" in query:
-            query["date"]["$lte"] = to_date
-        else:
-            query["date"] = {"$lte": to_date}
-    
-    entries = await db.ledger_entries.find(query, {"_id": 0}).sort("date", 1).to_list(1000)
-    
-    # Calculate running stock balance
-    balance = 0.0
-    for entry in entries:
-        if isinstance(entry.get('date'), str):
-            entry['date'] = date.fromisoformat(entry['date'])
-        if isinstance(entry.get('created_at'), str):
-            entry['created_at'] = datetime.fromisoformat(entry['created_at'])
-        
-        balance += entry.get('quantity_in', 0.0) - entry.get('quantity_out', 0.0)
-        entry['balance'] = balance
-    
+    """Get item ledger (stock movement), stock carried from before from_date"""
+    entries, next_cursor = await ledger_page(db, "item_id", item_id, from_date, to_date, limit, cursor)
+    set_next_cursor(response, next_cursor)
     return entries
 
+LEDGER_EXPORT_COLUMNS = ["date", "voucher_type", "voucher_number", "particulars", "debit", "credit", "balance"]
+ITEM_LEDGER_EXPORT_COLUMNS = ["date", "voucher_type", "voucher_number", "particulars", "quantity_in", "quantity_out", "balance"]
+
+async def ledger_rows(field: str, entity_id: str, from_date: Optional[date], to_date: Optional[date], columns: List[str]):
+    """Ledger rows oldest first with the running balance filled in"""
+    async for entry in ledger_stream(db, field, entity_id, from_date, to_date, EXPORT_BATCH_SIZE):
+        yield [entry.get(column) for column in columns]
+
+def ledger_export(field: str, entity_id: str, from_date: Optional[date], to_date: Optional[date], format: str):
+    columns = ITEM_LEDGER_EXPORT_COLUMNS if field == "item_id" else LEDGER_EXPORT_COLUMNS
+    rows = ledger_rows(field, entity_id, from_date, to_date, columns)
+    return export_response(rows, columns, format, f"{field[:-3]}-ledger-{entity_id}")
+
+@router.get("/erp/ledgers/account/{account_id}/export")
+async def export_account_ledger(
+    account_id: str,
+    format: str = Query("csv", description="csv or xlsx"),
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Stream the full account ledger as CSV or XLSX"""
+    return ledger_export("account_id", account_id, from_date, to_date, format)
+
+@router.get("/erp/ledgers/party/{party_id}/export")
+async def export_party_ledger(
+    party_id: str,
+    format: str = Query("csv", description="csv or xlsx"),
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Stream the full party ledger as CSV or XLSX"""
+    return ledger_export("party_id", party_id, from_date, to_date, format)
+
+@router.get("/erp/ledgers/item/{item_id}/export")
+async def export_item_ledger(
+    item_id: str,
+    format: str = Query("csv", description="csv or xlsx"),
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Stream the full item (stock movement) ledger as CSV or XLSX"""
+    return ledger_export("item_id", item_id, from_date, to_date, format)
+
 # ==================== OUTSTANDING REPORTS ====================
 
 @router.get("/erp/reports/outstanding/receivables", response_model=List[OutstandingReport])
@@ -182,66 +180,67 @@ async def get_payables_report(current_user: User = Depends(get_current_admin)):
 
 # ==================== PROFIT & LOSS STATEMENT ====================
 
+PURCHASES_ACCOUNT_CODE = "5001"
+
 @router.get("/erp/reports/profit-loss", response_model=ProfitLossStatement)
 async def get_profit_loss_statement(
-    from_date: str = Query(...),
-    to_date: str = Query(...),
+    from_date: date = Query(...),
+    to_date: date = Query(...),
     current_user: User = Depends(get_current_admin)
 ):
     """Get Profit & Loss statement"""
     
-    # Get all income accounts
-    income_accounts = await db.accounts.find({"account_type": "income"}, {"_id": 0}).to_list(100)
-    income_list = []
-    total_income = 0.0
-    
-    for account in income_accounts:
-        # Get ledger entries for this account
-        entries = await db.ledger_entries.find({
-            "account_id": account['id'],
-            "date": {"$gte": from_date, "$lte": to_date}
-        }, {"_id": 0}).to_list(1000)
-        
-        account_total = sum(e.get('credit', 0.0) - e.get('debit', 0.0) for e in entries)
-        if account_total > 0:
-            income_list.append({
-                "account_name": account['name'],
-                "amount": account_total
-            })
-            total_income += account_total
+    # Period debit/credit of every income and expense account in one pass
+    accounts = await db.accounts.find(
+        {"account_type": {"$in": ["income", "expense"]}}, {"_id": 0, "id": 1, "code": 1, "name": 1, "account_type": 1}
+    ).sort("code", 1).to_list(None)
+    totals = {
+        row['_id']: row async for row in db.postings.aggregate([
+            {"$match": {
+                "account_id": {"$in": [account['id'] for account in accounts]},
+                "date": date_range(from_date, to_date)
+            }},
+            {"$group": {"_id": "$account_id", "debit": {"$sum": "$debit"}, "credit": {"$sum": "$credit"}}}
+        ])
+    }
     
-    # Get all expense accounts
-    expense_accounts = await db.accounts.find({"account_type": "expense"}, {"_id": 0}).to_list(100)
+    income_list = []
     expense_list = []
+    total_income = 0.0
     total_expenses = 0.0
-    
-    for account in expense_accounts:
-        entries = await db.ledger_entries.find({
-            "account_id": account['id'],
-            "date": {"$gte": from_date, "$lte": to_date}
-        }, {"_id": 0}).to_list(1000)
-        
-        account_total = sum(e.get('debit', 0.0) - e.get('credit', 0.0) for e in entries)
-        if account_total > 0:
-            expense_list.append({
-                "account_name": account['name'],
-                "amount": account_total
-            })
-            total_expenses += account_total
-    
-    # Calculate COGS (Cost of Goods Sold)
-    purchases = await db.purchase_vouchers.find({
-        "voucher_date": {"$gte": from_date, "$lte": to_date}
-    }, {"_id": 0}).to_list(1000)
-    cost_of_goods_sold = sum(p.get('subtotal', 0.0) for p in purchases)
+    cost_of_goods_sold = 0.0
+    
+    for account in accounts:
+        row = totals.get(account['id'])
+        if not row:
+            continue
+        if account.get('code') == PURCHASES_ACCOUNT_CODE:
+            # Cost of goods sold: the Purchases account debited by every bill
+            cost_of_goods_sold += row['debit'] - row['credit']
+        elif account['account_type'] == "income":
+            account_total = row['credit'] - row['debit']
+            if account_total > 0:
+                income_list.append({
+                    "account_name": account['name'],
+                    "amount": account_total
+                })
+                total_income += account_total
+        else:
+            account_total = row['debit'] - row['credit']
+            if account_total > 0:
+                expense_list.append({
+                    "account_name": account['name'],
+                    "amount": account_total
+                })
+                total_expenses += account_total
     
     # Calculate profits
     gross_profit = total_income - cost_of_goods_sold
     net_profit = gross_profit - total_expenses
     
     return ProfitLossStatement(
-        period_from=date.fromisoformat(from_date),
-        period_to=date.fromisoformat(to_date),
+        period_from=from_date,
+        period_to=to_date,
         total_income=total_income,
         total_expenses=total_expenses,
         cost_of_goods_sold=cost_of_goods_sold,
@@ -251,11 +250,75 @@ async def get_profit_loss_statement(
         expense_accounts=expense_list
     )
 
+# ==================== TRIAL BALANCE ====================
+
+def _debit_credit(balance: float):
+    """Net balance as (debit, credit) columns"""
+    return (balance, 0.0) if balance > 0 else (0.0, -balance)
+
+@router.get("/erp/reports/trial-balance", response_model=TrialBalance)
+async def get_trial_balance(
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Get Trial Balance: opening, period movement and closing per account and party"""
+    if from_date and to_date and from_date > to_date:
+        raise HTTPException(status_code=400, detail="from_date must not be after to_date")
+    
+    totals = await trial_balance_cache.totals(db, from_date, to_date)
+    accounts = await db.accounts.find(
+        {"id": {"$in": list(totals)}}, {"_id": 0, "id": 1, "code": 1, "name": 1, "account_type": 1}
+    ).sort("code", 1).to_list(None)
+    # Customer/supplier lines are posted to the party itself
+    known = {account['id'] for account in accounts}
+    parties = await db.parties.find(
+        {"id": {"$in": [entity_id for entity_id in totals if entity_id not in known]}},
+        {"_id": 0, "id": 1, "code": 1, "name": 1, "party_type": 1}
+    ).sort("name", 1).to_list(None)
+    entries = [(a['id'], a['code'], a['name'], a['account_type']) for a in accounts]
+    entries += [(p['id'], p['code'], p['name'], p['party_type']) for p in parties]
+    known.update(p['id'] for p in parties)
+    entries += [(entity_id, "", row['name'], "unknown") for entity_id, row in totals.items() if entity_id not in known]
+    
+    rows = []
+    for entity_id, code, name, entity_type in entries:
+        row = totals[entity_id]
+        opening_balance = row['opening_debit'] - row['opening_credit']
+        if not (opening_balance or row['debit'] or row['credit']):
+            continue
+        opening = _debit_credit(opening_balance)
+        closing = _debit_credit(opening_balance + row['debit'] - row['credit'])
+        rows.append(TrialBalanceAccount(
+            account_id=entity_id,
+            account_code=code,
+            account_name=name,
+            account_type=entity_type,
+            opening_debit=opening[0],
+            opening_credit=opening[1],
+            debit=row['debit'],
+            credit=row['credit'],
+            closing_debit=closing[0],
+            closing_credit=closing[1]
+        ))
+    
+    return TrialBalance(
+        period_from=from_date,
+        period_to=to_date,
+        accounts=rows,
+        total_opening_debit=sum(r.opening_debit for r in rows),
+        total_opening_credit=sum(r.opening_credit for r in rows),
+        total_debit=sum(r.debit for r in rows),
+        total_credit=sum(r.credit for r in rows),
+        total_closing_debit=sum(r.closing_debit for r in rows),
+        total_closing_credit=sum(r.closing_credit for r in rows)
+    )
+
 # ==================== BALANCE SHEET ====================
 
 @router.get("/erp/reports/balance-sheet", response_model=BalanceSheet)
 async def get_balance_sheet(
-    as_on_date: str = Query(...),
+    as_on_date: date = Query(...),
     current_user: User = Depends(get_current_admin)
 ):
     """Get Balance Sheet"""
@@ -303,7 +366,7 @@ async def get_balance_sheet(
             total_capital += balance
     
     return BalanceSheet(
-        as_on_date=date.fromisoformat(as_on_date),
+        as_on_date=as_on_date,
         assets=assets_list,
         liabilities=liabilities_list,
         capital=capital_list,
@@ -314,50 +377,72 @@ async def get_balance_sheet(
 
 # ==================== STOCK REPORT ====================
 
+STOCK_REPORT_COLUMNS = [
+    "item_code", "item_name", "category", "unit", "current_stock", "reorder_level",
+    "purchase_rate", "sale_rate", "stock_value", "alert"
+]
+
+async def stock_lookups():
+    """Category names and unit symbols by id (both collections are small)"""
+    categories = {c['id']: c.get('name') async for c in db.item_categories.find({}, {"_id": 0, "id": 1, "name": 1})}
+    units = {u['id']: u.get('symbol') async for u in db.item_units.find({}, {"_id": 0, "id": 1, "symbol": 1})}
+    return categories, units
+
+def stock_row(item: dict, categories: dict, units: dict) -> dict:
+    return {
+        "item_code": item.get('code'),
+        "item_name": item.get('name'),
+        "category": categories.get(item.get('category_id')) or "N/A",
+        "unit": units.get(item.get('unit_id')) or "N/A",
+        "current_stock": item.get('current_stock', 0.0),
+        "reorder_level": item.get('reorder_level', 0.0),
+        "purchase_rate": item.get('purchase_rate', 0.0),
+        "sale_rate": item.get('sale_rate', 0.0),
+        "stock_value": item.get('current_stock', 0.0) * item.get('purchase_rate', 0.0),
+        "alert": item.get('current_stock', 0.0) <= item.get('reorder_level', 0.0)
+    }
+
 @router.get("/erp/reports/stock")
 async def get_stock_report(current_user: User = Depends(get_current_admin)):
     """Get current stock report"""
     items = await db.items.find({}, {"_id": 0}).sort("name", 1).to_list(1000)
+    categories, units = await stock_lookups()
     
-    report = []
-    for item in items:
-        # Get category and unit names
-        category = await db.item_categories.find_one({"id": item.get('category_id')}, {"_id": 0})
-        unit = await db.item_units.find_one({"id": item.get('unit_id')}, {"_id": 0})
-        
-        report.append({
-            "item_code": item.get('code'),
-            "item_name": item.get('name'),
-            "category": category.get('name') if category else "N/A",
-            "unit": unit.get('symbol') if unit else "N/A",
-            "current_stock": item.get('current_stock', 0.0),
-            "reorder_level": item.get('reorder_level', 0.0),
-            "purchase_rate": item.get('purchase_rate', 0.0),
-            "sale_rate": item.get('sale_rate', 0.0),
-            "stock_value": item.get('current_stock', 0.0) * item.get('purchase_rate', 0.0),
-            "alert": item.get('current_stock', 0.0) <= item.get('reorder_level', 0.0)
-        })
-    
-    return report
+    return [stock_row(item, categories, units) for item in items]
+
+@router.get("/erp/reports/stock/export")
+async def export_stock_report(
+    format: str = Query("csv", description="csv or xlsx"),
+    current_user: User = Depends(get_current_admin)
+):
+    """Stream the stock report for every item as CSV or XLSX"""
+    async def rows():
+        categories, units = await stock_lookups()
+        cursor = db.items.find({}, {"_id": 0}).sort("name", 1).batch_size(EXPORT_BATCH_SIZE)
+        async for item in cursor:
+            row = stock_row(item, categories, units)
+            yield [row[column] for column in STOCK_REPORT_COLUMNS]
+    
+    return export_response(rows(), STOCK_REPORT_COLUMNS, format, "stock-report")
 
 # ==================== GST REPORT ====================
 
 @router.get("/erp/reports/gst")
 async def get_gst_report(
-    from_date: str = Query(...),
-    to_date: str = Query(...),
+    from_date: date = Query(...),
+    to_date: date = Query(...),
     current_user: User = Depends(get_current_admin)
 ):
     """Get GST report"""
     
     # Sales with GST
     sales = await db.sales_vouchers.find({
-        "voucher_date": {"$gte": from_date, "$lte": to_date}
+        "voucher_date": date_range(from_date, to_date)
     }, {"_id": 0}).to_list(1000)
     
     # Purchases with GST
     purchases = await db.purchase_vouchers.find({
-        "voucher_date": {"$gte": from_date, "$lte": to_date}
+        "voucher_date": date_range(from_date, to_date)
     }, {"_id": 0}).to_list(1000)
     
     total_output_gst = sum(s.get('tax_amount', 0.0) for s in sales)
@@ -375,3 +460,36 @@ async def get_gst_report(
         "sales_invoices": len(sales),
         "purchase_bills": len(purchases)
     }
+
+GST_EXPORT_COLUMNS = [
+    "voucher_type", "voucher_number", "voucher_date", "party_id", "party_name",
+    "taxable_value", "discount", "gst", "total_amount"
+]
+
+@router.get("/erp/reports/gst/export")
+async def export_gst_report(
+    from_date: date = Query(...),
+    to_date: date = Query(...),
+    format: str = Query("csv", description="csv or xlsx"),
+    current_user: User = Depends(get_current_admin)
+):
+    """Stream every sales invoice (output GST) and purchase bill (input GST) in the period"""
+    async def rows():
+        period = {"voucher_date": date_range(from_date, to_date)}
+        for voucher_type, collection, party in (("sales", "sales_vouchers", "customer"),
+                                                ("purchase", "purchase_vouchers", "supplier")):
+            cursor = db[collection].find(period, {"_id": 0, "items": 0}).sort([("voucher_date", 1), ("id", 1)])
+            async for voucher in cursor.batch_size(EXPORT_BATCH_SIZE):
+                yield [
+                    voucher_type,
+                    voucher.get('voucher_number'),
+                    voucher.get('voucher_date'),
+                    voucher.get(f'{party}_id'),
+                    voucher.get(f'{party}_name'),
+                    voucher.get('subtotal', 0.0),
+                    voucher.get('discount', 0.0),
+                    voucher.get('tax_amount', 0.0),
+                    voucher.get('total_amount', 0.0)
+                ]
+    
+    return export_response(rows(), GST_EXPORT_COLUMNS, format, f"gst-{from_date}-to-{to_date}")
@@ -1,17 +1,10 @@
 from fastapi import APIRouter, HTTPException
-from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime, timezone
+from database import db
 from .models import SaleEntry, SaleEntryCreate, SaleItem
-import os
-import random
+from sequences import sequence_allocator
 
 router = APIRouter(prefix="/erp/sales", tags=["ERP-Sales"])
 
-# Get DB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
 @router.post("/", response_model=SaleEntry)
 async def create_sale(sale_data: SaleEntryCreate):
     # Calculate amounts
@@ -20,7 +13,7 @@ async def create_sale(sale_data: SaleEntryCreate):
     total_amount = subtotal + tax_amount
     
     # Generate invoice number
-    invoice_number = f"INV{random.randint(1000, 9999)}"
+    invoice_number = await sequence_allocator.next(db, "erp_sale")
     
     sale = SaleEntry(
         invoice_number=invoice_number,
@@ -36,8 +29,6 @@ async def create_sale(sale_data: SaleEntryCreate):
     
     # Save to database
     sale_doc = sale.model_dump()
-    sale_doc['date'] = sale_doc['date'].isoformat()
-    sale_doc['created_at'] = sale_doc['created_at'].isoformat()
     
     await db.erp_sales.insert_one(sale_doc)
     
@@ -54,12 +45,6 @@ async def create_sale(sale_data: SaleEntryCreate):
 async def get_sales(limit: int = 50):
     sales = await db.erp_sales.find({}, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(limit)
     
-    for sale in sales:
-        if isinstance(sale.get('date'), str):
-            sale['date'] = datetime.fromisoformat(sale['date'])
-        if isinstance(sale.get('created_at'), str):
-            sale['created_at'] = datetime.fromisoformat(sale['created_at'])
-    
     return sales
 
 @router.get("/{sale_id}", response_model=SaleEntry)
@@ -68,11 +53,6 @@ async def get_sale(sale_id: str):
     if not sale:
         raise HTTPException(status_code=404, detail="Sale not found")
     
-    if isinstance(sale.get('date'), str):
-        sale['date'] = datetime.fromisoformat(sale['date'])
-    if isinstance(sale.get('created_at'), str):
-        sale['created_at'] = datetime.fromisoformat(sale['created_at'])
-    
     return SaleEntry(**sale)
 
 @router.patch("/{sale_id}/payment")
@@ -0,0 +1,143 @@
+"""
+Trial balance totals from one aggregation over postings, cached per period
+"""
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Optional, Tuple
+import logging
+import os
+import time
+
+from dates import to_bson_date
+from erp.postings import POSTINGS_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+TRIAL_BALANCE_CACHE_TTL_SECONDS = float(os.environ.get('TRIAL_BALANCE_CACHE_TTL_SECONDS', '600'))
+TRIAL_BALANCE_CACHE_SIZE = int(os.environ.get('TRIAL_BALANCE_CACHE_SIZE', '64'))
+
+# One marker per month, "trial_balance:<YYYY-MM>"; ';' sorts right after ':'
+MARKER_COLLECTION = "cache_markers"
+MARKER_PREFIX = "trial_balance:"
+MARKER_END = "trial_balance;"
+
+Period = Tuple[Optional[date], Optional[date]]
+
+# account or party id -> {"name", "opening_debit", "opening_credit", "debit", "credit"}
+Totals = Dict[str, Dict[str, Any]]
+
+
+def _sum_if(condition: Any, field: str) -> Dict[str, Any]:
+    return {"$sum": {"$cond": [condition, f"${field}", 0]}}
+
+
+async def period_totals(db, from_date: Optional[date], to_date: Optional[date]) -> Totals:
+    """Opening and in-period debit/credit for every account and party in one
+    ``$group`` (party rows stand for the debtors/creditors control accounts)"""
+    match: Dict[str, Any] = {}
+    if to_date:
+        match["date"] = {"$lt": to_bson_date(to_date + timedelta(days=1))}
+    before = {"$lt": ["$date", to_bson_date(from_date)]} if from_date else False
+    within = {"$gte": ["$date", to_bson_date(from_date)]} if from_date else True
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"$ifNull": ["$account_id", "$party_id"]},
+            "name": {"$last": "$account_name"},
+            "opening_debit": _sum_if(before, "debit"),
+            "opening_credit": _sum_if(before, "credit"),
+            "debit": _sum_if(within, "debit"),
+            "credit": _sum_if(within, "credit"),
+        }},
+    ]
+    return {row.pop("_id"): row async for row in db[POSTINGS_COLLECTION].aggregate(pipeline)}
+
+
+def _marker_id(value: date) -> str:
+    return f"{MARKER_PREFIX}{value:%Y-%m}"
+
+
+async def mark_postings(db, dates: Iterable[datetime]) -> None:
+    """Bump the marker of every month that postings dated ``dates`` fall in.
+
+    Called once the posting transaction has committed, so concurrent
+    vouchers never conflict on a marker. A bump lost in between (the
+    process dying, or this write failing) leaves cached periods stale
+    for at most the cache TTL.
+    """
+    months = sorted({_marker_id(value) for value in dates})
+    if not months:
+        return
+    try:
+        await db[MARKER_COLLECTION].bulk_write(
+            [UpdateOne({"_id": month}, {"$inc": {"generation": 1}}, upsert=True) for month in months],
+            ordered=False,
+        )
+    except PyMongoError:
+        logger.exception("Could not mark trial balance months %s", ", ".join(months))
+
+
+async def _stamp(db, to_date: Optional[date]) -> int:
+    """Sum of the marker generations of every month up to ``to_date``; it
+    grows whenever something is posted on or before that month"""
+    months = {"$gte": MARKER_PREFIX, "$lte": _marker_id(to_date)} if to_date \
+        else {"$gte": MARKER_PREFIX, "$lt": MARKER_END}
+    result = await db[MARKER_COLLECTION].aggregate([
+        {"$match": {"_id": months}},
+        {"$group": {"_id": None, "stamp": {"$sum": "$generation"}}},
+    ]).to_list(1)
+    return result[0]["stamp"] if result else 0
+
+
+class TrialBalanceCache:
+    """Per-worker cache of ``period_totals`` keyed by (from_date, to_date).
+
+    Every lookup first sums the month markers written by ``mark_postings``
+    up to the period's end, so a voucher posted by any worker is seen at
+    once. Postings in later months leave the sum, and the cached period,
+    untouched; earlier ones change it (they move opening balances too) and
+    force a recompute. ``ttl_seconds`` bounds how long an entry is kept.
+    """
+
+    def __init__(self, ttl_seconds: float = TRIAL_BALANCE_CACHE_TTL_SECONDS,
+                 max_periods: int = TRIAL_BALANCE_CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_periods = max_periods
+        # period -> (expires at, marker stamp it reflects, totals)
+        self._periods: Dict[Period, Tuple[float, int, Totals]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def totals(self, db, from_date: Optional[date], to_date: Optional[date]) -> Totals:
+        key = (from_date, to_date)
+        # Read before computing, so a posting that lands meanwhile bumps past it
+        stamp = await _stamp(db, to_date)
+        cached = self._periods.get(key)
+        if cached is not None and time.monotonic() < cached[0]:
+            if cached[1] == stamp:
+                self.hits += 1
+                return cached[2]
+            self.invalidations += 1
+        self.misses += 1
+        totals = await period_totals(db, from_date, to_date)
+        if len(self._periods) >= self.max_periods and key not in self._periods:
+            # Drop the entry closest to expiry
+            del self._periods[min(self._periods, key=lambda k: self._periods[k][0])]
+        self._periods[key] = (time.monotonic() + self.ttl_seconds, stamp, totals)
+        return totals
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "periods": len(self._periods),
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+trial_balance_cache = TrialBalanceCache()
@@ -0,0 +1,260 @@
+"""
+Bulk import of sales and purchase vouchers from CSV or JSONL
+"""
+from pydantic import ValidationError
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from datetime import date
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+import csv
+import json
+import os
+import time
+
+from transactions import transactions_supported
+from sequences import fiscal_year, sequence_allocator
+from erp.accounting_models import PurchaseVoucherCreate, SalesVoucherCreate
+from erp.posting import build_purchase_posting, build_sales_posting, commit_postings
+
+VOUCHER_IMPORT_BATCH_SIZE = int(os.environ.get('VOUCHER_IMPORT_BATCH_SIZE', '500'))
+
+# voucher type -> (create model, posting builder, collection, number series, CSV party prefix)
+IMPORT_TYPES = {
+    "sales": (SalesVoucherCreate, build_sales_posting, "sales_vouchers", "sales_voucher", "customer"),
+    "purchase": (PurchaseVoucherCreate, build_purchase_posting, "purchase_vouchers", "purchase_voucher", "supplier"),
+}
+
+IMPORT_FORMATS = ("csv", "jsonl")
+
+# CSV columns copied onto each VoucherItem
+_ITEM_COLUMNS = ("item_id", "item_name", "quantity", "rate", "amount", "tax_rate", "tax_amount", "total")
+
+Record = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+def format_for(filename: Optional[str], explicit: Optional[str] = None) -> str:
+    """``csv`` or ``jsonl``, from the explicit value or the file extension"""
+    fmt = explicit or (filename or "").rsplit(".", 1)[-1].lower()
+    if fmt == "ndjson":
+        fmt = "jsonl"
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unsupported import format {fmt!r}; use one of {IMPORT_FORMATS}")
+    return fmt
+
+
+def parse_jsonl(lines: Iterable[str]) -> Iterator[Record]:
+    """One voucher per line, shaped like the create endpoint's body"""
+    for row, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield row, json.loads(line), None
+        except json.JSONDecodeError as e:
+            yield row, None, f"Invalid JSON: {e.msg}"
+
+
+def _number(value: str) -> float:
+    return float(value) if value not in (None, "") else 0.0
+
+
+def parse_csv(lines: Iterable[str], party: str) -> Iterator[Record]:
+    """One item per row; consecutive rows with the same ``voucher_ref``
+    (or ``voucher_number``) form one voucher.
+
+    Voucher columns: voucher_ref, voucher_number, voucher_date,
+    <party>_id, <party>_name, discount, notes. Item columns are those of
+    VoucherItem; subtotal, tax and total are summed from the items.
+    """
+    reader = csv.DictReader(lines)
+    current_key = None
+    voucher: Optional[Dict[str, Any]] = None
+    first_row = 0
+    for row_number, row in enumerate(reader, start=2):
+        key = row.get("voucher_ref") or row.get("voucher_number") or f"row-{row_number}"
+        if key != current_key:
+            if voucher is not None:
+                yield first_row, _finish_csv_voucher(voucher), None
+            current_key = key
+            first_row = row_number
+            voucher = {
+                "voucher_number": row.get("voucher_number") or None,
+                "voucher_date": row.get("voucher_date"),
+                f"{party}_id": row.get(f"{party}_id"),
+                f"{party}_name": row.get(f"{party}_name"),
+                "discount": row.get("discount") or 0.0,
+                "notes": row.get("notes") or None,
+                "items": [],
+            }
+        # Blank cells fall back to the model defaults
+        voucher["items"].append({
+            column: row[column] for column in _ITEM_COLUMNS if row.get(column) not in (None, "")
+        })
+    if voucher is not None:
+        yield first_row, _finish_csv_voucher(voucher), None
+
+
+def _finish_csv_voucher(voucher: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        subtotal = sum(_number(item.get("amount")) for item in voucher["items"])
+        tax = sum(_number(item.get("tax_amount")) for item in voucher["items"])
+        discount = _number(voucher["discount"])
+    except ValueError:
+        # Leave it to validation, which names the bad field
+        return voucher
+    voucher["subtotal"] = subtotal
+    voucher["tax_amount"] = tax
+    voucher["total_amount"] = subtotal + tax - discount
+    return voucher
+
+
+def parse_records(lines: Iterable[str], fmt: str, voucher_type: str) -> Iterator[Record]:
+    if fmt == "jsonl":
+        return parse_jsonl(lines)
+    return parse_csv(lines, IMPORT_TYPES[voucher_type][4])
+
+
+def describe(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()
+    )
+
+
+class VoucherImport:
+    """Validates and posts vouchers in batches, reporting as it goes.
+
+    Each batch is validated row by row, checked for taken or repeated
+    voucher numbers with one query, then committed with ``commit_postings``
+    as a single transaction. If the commit fails anyway (a number taken
+    concurrently) the batch was rolled back and is retried one voucher at a
+    time, so only the offending rows are rejected.
+    """
+
+    def __init__(self, client, db, voucher_type: str, created_by: str,
+                 batch_size: int = VOUCHER_IMPORT_BATCH_SIZE):
+        if voucher_type not in IMPORT_TYPES:
+            raise ValueError(f"Unsupported voucher type {voucher_type!r}; use one of {tuple(IMPORT_TYPES)}")
+        self.client = client
+        self.db = db
+        self.voucher_type = voucher_type
+        self.model, self.build, self.collection, self.series, _ = IMPORT_TYPES[voucher_type]
+        self.created_by = created_by
+        self.batch_size = max(1, batch_size)
+        self.posted = 0
+        self.failed = 0
+        self.batches = 0
+
+    async def run(self, records: Iterable[Record]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield a progress report per batch and a final summary"""
+        started = time.perf_counter()
+        batch: List[Record] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                yield await self._post_batch(batch, started)
+                batch = []
+        if batch:
+            yield await self._post_batch(batch, started)
+        yield {"done": True, **self._totals(started)}
+
+    def _totals(self, started: float) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - started
+        return {
+            "voucher_type": self.voucher_type,
+            "batches": self.batches,
+            "posted": self.posted,
+            "failed": self.failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "vouchers_per_second": round(self.posted / elapsed, 1) if elapsed else 0.0,
+        }
+
+    async def _post_batch(self, batch: List[Record], started: float) -> Dict[str, Any]:
+        self.batches += 1
+        errors: List[Dict[str, Any]] = []
+        valid = []
+        for row, data, error in batch:
+            if error is None:
+                try:
+                    voucher = self.model.model_validate(data)
+                    date.fromisoformat(voucher.voucher_date)
+                    valid.append((row, voucher))
+                    continue
+                except ValidationError as e:
+                    error = describe(e)
+                except ValueError as e:
+                    error = f"voucher_date: {e}"
+            errors.append({"row": row, "error": error})
+
+        valid = await self._drop_taken_numbers(valid, errors)
+        await self._allocate_numbers([voucher for _, voucher in valid])
+
+        postings = []
+        for row, voucher in valid:
+            _, posting = await self.build(self.db, voucher, self.created_by)
+            postings.append((row, posting))
+
+        posted = await self._commit(postings, errors)
+        self.posted += posted
+        self.failed += len(batch) - posted
+        errors.sort(key=lambda e: e["row"])
+        return {
+            "batch": self.batches,
+            "batch_posted": posted,
+            "batch_failed": len(batch) - posted,
+            "errors": errors,
+            **self._totals(started),
+        }
+
+    async def _drop_taken_numbers(self, valid, errors: List[Dict[str, Any]]):
+        numbers = [voucher.voucher_number for _, voucher in valid if voucher.voucher_number]
+        if not numbers:
+            return valid
+        taken = {
+            doc["voucher_number"] async for doc in self.db[self.collection].find(
+                {"voucher_number": {"$in": numbers}}, {"_id": 0, "voucher_number": 1}
+            )
+        }
+        seen = set()
+        kept = []
+        for row, voucher in valid:
+            number = voucher.voucher_number
+            if number and (number in taken or number in seen):
+                errors.append({"row": row, "voucher_number": number, "error": "Voucher number already exists"})
+                continue
+            if number:
+                seen.add(number)
+            kept.append((row, voucher))
+        return kept
+
+    async def _allocate_numbers(self, vouchers) -> None:
+        """Number the batch with one counter update per fiscal year"""
+        by_year: Dict[str, list] = {}
+        for voucher in vouchers:
+            if not voucher.voucher_number:
+                on = date.fromisoformat(voucher.voucher_date)
+                by_year.setdefault(fiscal_year(on), []).append((on, voucher))
+        for pending in by_year.values():
+            numbers = await sequence_allocator.reserve(self.db, self.series, len(pending), pending[0][0])
+            for (_, voucher), number in zip(pending, numbers):
+                voucher.voucher_number = number
+
+    async def _commit(self, postings, errors: List[Dict[str, Any]]) -> int:
+        if not postings:
+            return 0
+        try:
+            await commit_postings(self.client, self.db, [posting for _, posting in postings])
+            return len(postings)
+        except PyMongoError:
+            # Without transactions part of the batch may already be written,
+            # so retrying voucher by voucher would post some of it twice
+            if not await transactions_supported(self.client):
+                raise
+        posted = 0
+        for row, posting in postings:
+            try:
+                await posting.commit(self.client, self.db)
+                posted += 1
+            except DuplicateKeyError:
+                errors.append({"row": row, "voucher_number": posting.voucher["voucher_number"],
+                               "error": "Voucher number already exists"})
+            except PyMongoError as e:
+                errors.append({"row": row, "error": str(e)})
+        return posted
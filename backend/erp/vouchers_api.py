@@ -1,9 +1,14 @@
 """
 Voucher APIs with Double-Entry Accounting Integration
 """
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
-from datetime import datetime, date
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
+from pymongo.errors import DuplicateKeyError
+from typing import List, Optional
+from datetime import date
+import io
+import json
+import tempfile
 from erp.accounting_models import (
     SalesVoucher, SalesVoucherCreate,
     PurchaseVoucher, PurchaseVoucherCreate,
@@ -12,266 +17,73 @@ from erp.accounting_models import (
     ExpenseVoucher, ExpenseVoucherCreate,
     JournalVoucher, JournalVoucherCreate,
     ContraVoucher, ContraVoucherCreate,
-    JournalEntry, JournalLine, LedgerEntry
+    JournalEntry, JournalLine, LedgerEntry,
+    DayBookEntry
 )
-from server import get_current_admin, User, db
+from server import get_current_admin, User, client, db
+from pagination import fetch_page, set_next_cursor
+from fast_json import list_response
+from sequences import sequence_allocator
+from dates import date_range, to_bson_date
+from exports import cursor_rows, export_response, headers_of
+from erp.posting import VoucherPosting, build_purchase_posting, build_sales_posting, journal_document
+from erp.day_book import DAY_BOOK_TYPES, day_book_page, rebuild_register
+from erp.voucher_import import VOUCHER_IMPORT_BATCH_SIZE, VoucherImport, format_for, parse_records
 
 router = APIRouter()
 
+VOUCHER_SORT = [("voucher_date", -1), ("id", -1)]
+
 # ==================== HELPER FUNCTIONS ====================
 
-async def create_ledger_entry(entry_data: dict):
-    """Create ledger entry"""
-    entry_data['created_at'] = entry_data.get('created_at', datetime.now()).isoformat()
-    await db.ledger_entries.insert_one(entry_data)
-
-async def update_account_balance(account_id: str, debit: float = 0.0, credit: float = 0.0):
-    """Update account balance"""
-    account = await db.accounts.find_one({"id": account_id})
-    if not account:
-        return
-    
-    account_type = account.get('account_type')
-    current_balance = account.get('current_balance', 0.0)
-    
-    # For assets and expenses: debit increases, credit decreases
-    # For liabilities, capital, and income: credit increases, debit decreases
-    if account_type in ['asset', 'expense']:
-        new_balance = current_balance + debit - credit
-    else:  # liability, capital, income
-        new_balance = current_balance + credit - debit
-    
-    await db.accounts.update_one({"id": account_id}, {"$set": {"current_balance": new_balance}})
-
-async def update_item_stock(item_id: str, quantity_in: float = 0.0, quantity_out: float = 0.0):
-    """Update item stock"""
-    item = await db.items.find_one({"id": item_id})
-    if not item:
-        return
-    
-    current_stock = item.get('current_stock', 0.0)
-    new_stock = current_stock + quantity_in - quantity_out
-    
-    await db.items.update_one(
-        {"id": item_id}, 
-        {"$set": {"current_stock": new_stock, "updated_at": datetime.now().isoformat()}}
-    )
+async def commit_posting(posting: VoucherPosting):
+    """Write the voucher and everything it posts in one transaction"""
+    try:
+        await posting.commit(client, db)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Voucher number already exists")
 
 # ==================== SALES VOUCHER ====================
 
 @router.post("/erp/vouchers/sales", response_model=SalesVoucher)
 async def create_sales_voucher(voucher: SalesVoucherCreate, current_user: User = Depends(get_current_admin)):
     """Create sales invoice with accounting integration"""
-    
-    # Check if voucher number already exists
-    existing = await db.sales_vouchers.find_one({"voucher_number": voucher.voucher_number})
-    if existing:
-        raise HTTPException(status_code=400, detail="Voucher number already exists")
-    
-    # Create sales voucher
-    voucher_data = SalesVoucher(**voucher.model_dump(), created_by=current_user.id)
-    voucher_data.voucher_date = date.fromisoformat(voucher.voucher_date)
-    
-    voucher_dict = voucher_data.model_dump()
-    voucher_dict['voucher_date'] = voucher_dict['voucher_date'].isoformat()
-    voucher_dict['created_at'] = voucher_dict['created_at'].isoformat()
-    
-    await db.sales_vouchers.insert_one(voucher_dict)
-    
-    # Update item stock (reduce)
-    for item in voucher.items:
-        await update_item_stock(item.item_id, quantity_out=item.quantity)
-        
-        # Create item ledger entry
-        await create_ledger_entry({
-            "date": voucher.voucher_date,
-            "item_id": item.item_id,
-            "voucher_type": "sales",
-            "voucher_number": voucher.voucher_number,
-            "particulars": f"Sales to {voucher.customer_name}",
-            "quantity_out": item.quantity,
-            "balance": 0.0  # Will be calculated
-        })
-    
-    # Create journal entries (Double-entry)
-    journal_lines = []
-    
-    # Debit: Customer Account (Sundry Debtors) or Cash if paid
-    journal_lines.append(JournalLine(
-        account_id=voucher.customer_id,
-        account_name=voucher.customer_name,
-        debit=voucher.total_amount,
-        credit=0.0,
-        narration="Sales invoice"
-    ))
-    
-    # Credit: Sales Account
-    sales_account = await db.accounts.find_one({"code": "4001"})  # Sales account
-    if sales_account:
-        journal_lines.append(JournalLine(
-            account_id=sales_account['id'],
-            account_name=sales_account['name'],
-            debit=0.0,
-            credit=voucher.subtotal,
-            narration="Sales revenue"
-        ))
-        await update_account_balance(sales_account['id'], credit=voucher.subtotal)
-    
-    # Credit: Tax Account (if applicable)
-    if voucher.tax_amount > 0:
-        tax_account = await db.accounts.find_one({"code": "2005"})  # GST Payable
-        if tax_account:
-            journal_lines.append(JournalLine(
-                account_id=tax_account['id'],
-                account_name=tax_account['name'],
-                debit=0.0,
-                credit=voucher.tax_amount,
-                narration="GST collected"
-            ))
-            await update_account_balance(tax_account['id'], credit=voucher.tax_amount)
-    
-    # Save journal entry
-    journal_entry = JournalEntry(
-        voucher_id=voucher_data.id,
-        voucher_type="sales",
-        entry_date=voucher_data.voucher_date,
-        lines=journal_lines
-    )
-    journal_dict = journal_entry.model_dump()
-    journal_dict['entry_date'] = journal_dict['entry_date'].isoformat()
-    journal_dict['created_at'] = journal_dict['created_at'].isoformat()
-    await db.journal_entries.insert_one(journal_dict)
-    
-    # Create customer ledger entry
-    await create_ledger_entry({
-        "date": voucher.voucher_date,
-        "party_id": voucher.customer_id,
-        "voucher_type": "sales",
-        "voucher_number": voucher.voucher_number,
-        "particulars": "Sales invoice",
-        "debit": voucher.total_amount,
-        "credit": 0.0,
-        "balance": 0.0
-    })
-    
+    voucher_data, posting = await build_sales_posting(db, voucher, current_user.id)
+    await commit_posting(posting)
     return voucher_data
 
 @router.get("/erp/vouchers/sales", response_model=List[SalesVoucher])
-async def get_sales_vouchers(current_user: User = Depends(get_current_admin)):
-    """Get all sales vouchers"""
-    vouchers = await db.sales_vouchers.find({}, {"_id": 0}).sort("voucher_date", -1).to_list(1000)
-    for v in vouchers:
-        if isinstance(v.get('voucher_date'), str):
-            v['voucher_date'] = date.fromisoformat(v['voucher_date'])
-        if isinstance(v.get('created_at'), str):
-            v['created_at'] = datetime.fromisoformat(v['created_at'])
-    return vouchers
+async def get_sales_vouchers(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Get sales vouchers, newest first (keyset paginated)"""
+    vouchers, next_cursor = await fetch_page(db.sales_vouchers, {}, VOUCHER_SORT, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return list_response(response, SalesVoucher, vouchers)
 
 # ==================== PURCHASE VOUCHER ====================
 
 @router.post("/erp/vouchers/purchase", response_model=PurchaseVoucher)
 async def create_purchase_voucher(voucher: PurchaseVoucherCreate, current_user: User = Depends(get_current_admin)):
     """Create purchase bill with accounting integration"""
-    
-    existing = await db.purchase_vouchers.find_one({"voucher_number": voucher.voucher_number})
-    if existing:
-        raise HTTPException(status_code=400, detail="Voucher number already exists")
-    
-    voucher_data = PurchaseVoucher(**voucher.model_dump(), created_by=current_user.id)
-    voucher_data.voucher_date = date.fromisoformat(voucher.voucher_date)
-    
-    voucher_dict = voucher_data.model_dump()
-    voucher_dict['voucher_date'] = voucher_dict['voucher_date'].isoformat()
-    voucher_dict['created_at'] = voucher_dict['created_at'].isoformat()
-    
-    await db.purchase_vouchers.insert_one(voucher_dict)
-    
-    # Update item stock (increase)
-    for item in voucher.items:
-        await update_item_stock(item.item_id, quantity_in=item.quantity)
-        
-        await create_ledger_entry({
-            "date": voucher.voucher_date,
-            "item_id": item.item_id,
-            "voucher_type": "purchase",
-            "voucher_number": voucher.voucher_number,
-            "particulars": f"Purchase from {voucher.supplier_name}",
-            "quantity_in": item.quantity,
-            "balance": 0.0
-        })
-    
-    # Create journal entries
-    journal_lines = []
-    
-    # Debit: Purchase Account
-    purchase_account = await db.accounts.find_one({"code": "5001"})  # Purchase account
-    if purchase_account:
-        journal_lines.append(JournalLine(
-            account_id=purchase_account['id'],
-            account_name=purchase_account['name'],
-            debit=voucher.subtotal,
-            credit=0.0,
-            narration="Purchase of goods"
-        ))
-        await update_account_balance(purchase_account['id'], debit=voucher.subtotal)
-    
-    # Debit: Tax Account (if applicable)
-    if voucher.tax_amount > 0:
-        tax_account = await db.accounts.find_one({"code": "1006"})  # GST Receivable
-        if tax_account:
-            journal_lines.append(JournalLine(
-                account_id=tax_account['id'],
-                account_name=tax_account['name'],
-                debit=voucher.tax_amount,
-                credit=0.0,
-                narration="GST paid"
-            ))
-            await update_account_balance(tax_account['id'], debit=voucher.tax_amount)
-    
-    # Credit: Supplier Account (Sundry Creditors)
-    journal_lines.append(JournalLine(
-        account_id=voucher.supplier_id,
-        account_name=voucher.supplier_name,
-        debit=0.0,
-        credit=voucher.total_amount,
-        narration="Purchase bill"
-    ))
-    
-    journal_entry = JournalEntry(
-        voucher_id=voucher_data.id,
-        voucher_type="purchase",
-        entry_date=voucher_data.voucher_date,
-        lines=journal_lines
-    )
-    journal_dict = journal_entry.model_dump()
-    journal_dict['entry_date'] = journal_dict['entry_date'].isoformat()
-    journal_dict['created_at'] = journal_dict['created_at'].isoformat()
-    await db.journal_entries.insert_one(journal_dict)
-    
-    # Create supplier ledger entry
-    await create_ledger_entry({
-        "date": voucher.voucher_date,
-        "party_id": voucher.supplier_id,
-        "voucher_type": "purchase",
-        "voucher_number": voucher.voucher_number,
-        "particulars": "Purchase bill",
-        "debit": 0.0,
-        "credit": voucher.total_amount,
-        "balance": 0.0
-    })
-    
+    voucher_data, posting = await build_purchase_posting(db, voucher, current_user.id)
+    await commit_posting(posting)
     return voucher_data
 
 @router.get("/erp/vouchers/purchase", response_model=List[PurchaseVoucher])
-async def get_purchase_vouchers(current_user: User = Depends(get_current_admin)):
-    """Get all purchase vouchers"""
-    vouchers = await db.purchase_vouchers.find({}, {"_id": 0}).sort("voucher_date", -1).to_list(1000)
-    for v in vouchers:
-        if isinstance(v.get('voucher_date'), str):
-            v['voucher_date'] = date.fromisoformat(v['voucher_date'])
-        if isinstance(v.get('created_at'), str):
-            v['created_at'] = datetime.fromisoformat(v['created_at'])
-    return vouchers
+async def get_purchase_vouchers(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Get purchase vouchers, newest first (keyset paginated)"""
+    vouchers, next_cursor = await fetch_page(db.purchase_vouchers, {}, VOUCHER_SORT, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return list_response(response, PurchaseVoucher, vouchers)
 
 # ==================== PAYMENT VOUCHER ====================
 
@@ -279,18 +91,17 @@ async def get_purchase_vouchers(current_user: User = Depends(get_current_admin))
 async def create_payment_voucher(voucher: PaymentVoucherCreate, current_user: User = Depends(get_current_admin)):
     """Create payment voucher"""
     
-    existing = await db.payment_vouchers.find_one({"voucher_number": voucher.voucher_number})
-    if existing:
-        raise HTTPException(status_code=400, detail="Voucher number already exists")
+    if not voucher.voucher_number:
+        voucher.voucher_number = await sequence_allocator.next(
+            db, "payment_voucher", date.fromisoformat(voucher.voucher_date)
+        )
     
     voucher_data = PaymentVoucher(**voucher.model_dump(), created_by=current_user.id)
     voucher_data.voucher_date = date.fromisoformat(voucher.voucher_date)
     
     voucher_dict = voucher_data.model_dump()
-    voucher_dict['voucher_date'] = voucher_dict['voucher_date'].isoformat()
-    voucher_dict['created_at'] = voucher_dict['created_at'].isoformat()
-    
-    await db.payment_vouchers.insert_one(voucher_dict)
+    voucher_dict['voucher_date'] = to_bson_date(voucher_dict['voucher_date'])
+    posting = VoucherPosting("payment_vouchers", voucher_dict)
     
     # Create journal entries
     journal_lines = []
@@ -312,7 +123,6 @@ async def create_payment_voucher(voucher: PaymentVoucherCreate, current_user: Us
         credit=voucher.amount,
         narration="Payment"
     ))
-    await update_account_balance(voucher.account_id, credit=voucher.amount)
     
     journal_entry = JournalEntry(
         voucher_id=voucher_data.id,
@@ -320,14 +130,11 @@ async def create_payment_voucher(voucher: PaymentVoucherCreate, current_user: Us
         entry_date=voucher_data.voucher_date,
         lines=journal_lines
     )
-    journal_dict = journal_entry.model_dump()
-    journal_dict['entry_date'] = journal_dict['entry_date'].isoformat()
-    journal_dict['created_at'] = journal_dict['created_at'].isoformat()
-    await db.journal_entries.insert_one(journal_dict)
+    posting.set_journal(journal_document(journal_entry), journal_lines)
     
     # Create party ledger entry
-    await create_ledger_entry({
-        "date": voucher.voucher_date,
+    posting.add_ledger_entry({
+        "date": to_bson_date(voucher_data.voucher_date),
         "party_id": voucher.party_id,
         "voucher_type": "payment",
         "voucher_number": voucher.voucher_number,
@@ -337,18 +144,20 @@ async def create_payment_voucher(voucher: PaymentVoucherCreate, current_user: Us
         "balance": 0.0
     })
     
+    await commit_posting(posting)
     return voucher_data
 
 @router.get("/erp/vouchers/payment", response_model=List[PaymentVoucher])
-async def get_payment_vouchers(current_user: User = Depends(get_current_admin)):
-    """Get all payment vouchers"""
-    vouchers = await db.payment_vouchers.find({}, {"_id": 0}).sort("voucher_date", -1).to_list(1000)
-    for v in vouchers:
-        if isinstance(v.get('voucher_date'), str):
-            v['voucher_date'] = date.fromisoformat(v['voucher_date'])
-        if isinstance(v.get('created_at'), str):
-            v['created_at'] = datetime.fromisoformat(v['created_at'])
-    return vouchers
+async def get_payment_vouchers(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Get payment vouchers, newest first (keyset paginated)"""
+    vouchers, next_cursor = await fetch_page(db.payment_vouchers, {}, VOUCHER_SORT, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return list_response(response, PaymentVoucher, vouchers)
 
 # ==================== RECEIPT VOUCHER ====================
 
@@ -356,18 +165,17 @@ async def get_payment_vouchers(current_user: User = Depends(get_current_admin)):
 async def create_receipt_voucher(voucher: ReceiptVoucherCreate, current_user: User = Depends(get_current_admin)):
     """Create receipt voucher"""
     
-    existing = await db.receipt_vouchers.find_one({"voucher_number": voucher.voucher_number})
-    if existing:
-        raise HTTPException(status_code=400, detail="Voucher number already exists")
+    if not voucher.voucher_number:
+        voucher.voucher_number = await sequence_allocator.next(
+            db, "receipt_voucher", date.fromisoformat(voucher.voucher_date)
+        )
     
     voucher_data = ReceiptVoucher(**voucher.model_dump(), created_by=current_user.id)
     voucher_data.voucher_date = date.fromisoformat(voucher.voucher_date)
     
     voucher_dict = voucher_data.model_dump()
-    voucher_dict['voucher_date'] = voucher_dict['voucher_date'].isoformat()
-    voucher_dict['created_at'] = voucher_dict['created_at'].isoformat()
-    
-    await db.receipt_vouchers.insert_one(voucher_dict)
+    voucher_dict['voucher_date'] = to_bson_date(voucher_dict['voucher_date'])
+    posting = VoucherPosting("receipt_vouchers", voucher_dict)
     
     # Create journal entries
     journal_lines = []
@@ -380,7 +188,6 @@ async def create_receipt_voucher(voucher: ReceiptVoucherCreate, current_user: Us
         credit=0.0,
         narration="Receipt"
     ))
-    await update_account_balance(voucher.account_id, debit=voucher.amount)
     
     # Credit: Party Account
     journal_lines.append(JournalLine(
@@ -397,14 +204,11 @@ async def create_receipt_voucher(voucher: ReceiptVoucherCreate, current_user: Us
         entry_date=voucher_data.voucher_date,
         lines=journal_lines
     )
-    journal_dict = journal_entry.model_dump()
-    journal_dict['entry_date'] = journal_dict['entry_date'].isoformat()
-    journal_dict['created_at'] = journal_dict['created_at'].isoformat()
-    await db.journal_entries.insert_one(journal_dict)
+    posting.set_journal(journal_document(journal_entry), journal_lines)
     
     # Create party ledger entry
-    await create_ledger_entry({
-        "date": voucher.voucher_date,
+    posting.add_ledger_entry({
+        "date": to_bson_date(voucher_data.voucher_date),
         "party_id": voucher.party_id,
         "voucher_type": "receipt",
         "voucher_number": voucher.voucher_number,
@@ -414,18 +218,20 @@ async def create_receipt_voucher(voucher: ReceiptVoucherCreate, current_user: Us
         "balance": 0.0
     })
     
+    await commit_posting(posting)
     return voucher_data
 
 @router.get("/erp/vouchers/receipt", response_model=List[ReceiptVoucher])
-async def get_receipt_vouchers(current_user: User = Depends(get_current_admin)):
-    """Get all receipt vouchers"""
-    vouchers = await db.receipt_vouchers.find({}, {"_id": 0}).sort("voucher_date", -1).to_list(1000)
-    for v in vouchers:
-        if isinstance(v.get('voucher_date'), str):
-            v['voucher_date'] = date.fromisoformat(v['voucher_date'])
-        if isinstance(v.get('created_at'), str):
-            v['created_at'] = datetime.fromisoformat(v['created_at'])
-    return vouchers
+async def get_receipt_vouchers(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Get receipt vouchers, newest first (keyset paginated)"""
+    vouchers, next_cursor = await fetch_page(db.receipt_vouchers, {}, VOUCHER_SORT, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return list_response(response, ReceiptVoucher, vouchers)
 
 # ==================== EXPENSE VOUCHER ====================
 
@@ -433,18 +239,17 @@ async def get_receipt_vouchers(current_user: User = Depends(get_current_admin)):
 async def create_expense_voucher(voucher: ExpenseVoucherCreate, current_user: User = Depends(get_current_admin)):
     """Create expense voucher"""
     
-    existing = await db.expense_vouchers.find_one({"voucher_number": voucher.voucher_number})
-    if existing:
-        raise HTTPException(status_code=400, detail="Voucher number already exists")
+    if not voucher.voucher_number:
+        voucher.voucher_number = await sequence_allocator.next(
+            db, "expense_voucher", date.fromisoformat(voucher.voucher_date)
+        )
     
     voucher_data = ExpenseVoucher(**voucher.model_dump(), created_by=current_user.id)
     voucher_data.voucher_date = date.fromisoformat(voucher.voucher_date)
     
     voucher_dict = voucher_data.model_dump()
-    voucher_dict['voucher_date'] = voucher_dict['voucher_date'].isoformat()
-    voucher_dict['created_at'] = voucher_dict['created_at'].isoformat()
-    
-    await db.expense_vouchers.insert_one(voucher_dict)
+    voucher_dict['voucher_date'] = to_bson_date(voucher_dict['voucher_date'])
+    posting = VoucherPosting("expense_vouchers", voucher_dict)
     
     # Create journal entries
     journal_lines = []
@@ -457,7 +262,6 @@ async def create_expense_voucher(voucher: ExpenseVoucherCreate, current_user: Us
         credit=0.0,
         narration="Expense"
     ))
-    await update_account_balance(voucher.expense_account_id, debit=voucher.amount)
     
     # Credit: Cash/Bank Account
     journal_lines.append(JournalLine(
@@ -467,7 +271,6 @@ async def create_expense_voucher(voucher: ExpenseVoucherCreate, current_user: Us
         credit=voucher.amount,
         narration="Expense payment"
     ))
-    await update_account_balance(voucher.paid_from_account_id, credit=voucher.amount)
     
     journal_entry = JournalEntry(
         voucher_id=voucher_data.id,
@@ -475,23 +278,22 @@ async def create_expense_voucher(voucher: ExpenseVoucherCreate, current_user: Us
         entry_date=voucher_data.voucher_date,
         lines=journal_lines
     )
-    journal_dict = journal_entry.model_dump()
-    journal_dict['entry_date'] = journal_dict['entry_date'].isoformat()
-    journal_dict['created_at'] = journal_dict['created_at'].isoformat()
-    await db.journal_entries.insert_one(journal_dict)
+    posting.set_journal(journal_document(journal_entry), journal_lines)
     
+    await commit_posting(posting)
     return voucher_data
 
 @router.get("/erp/vouchers/expense", response_model=List[ExpenseVoucher])
-async def get_expense_vouchers(current_user: User = Depends(get_current_admin)):
-    """Get all expense vouchers"""
-    vouchers = await db.expense_vouchers.find({}, {"_id": 0}).sort("voucher_date", -1).to_list(1000)
-    for v in vouchers:
-        if isinstance(v.get('voucher_date'), str):
-            v['voucher_date'] = date.fromisoformat(v['voucher_date'])
-        if isinstance(v.get('created_at'), str):
-            v['created_at'] = datetime.fromisoformat(v['created_at'])
-    return vouchers
+async def get_expense_vouchers(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Get expense vouchers, newest first (keyset paginated)"""
+    vouchers, next_cursor = await fetch_page(db.expense_vouchers, {}, VOUCHER_SORT, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return list_response(response, ExpenseVoucher, vouchers)
 
 # ==================== JOURNAL VOUCHER ====================
 
@@ -506,9 +308,10 @@ async def create_journal_voucher(voucher: JournalVoucherCreate, current_user: Us
     if abs(total_debit - total_credit) > 0.01:
         raise HTTPException(status_code=400, detail="Total debit must equal total credit")
     
-    existing = await db.journal_vouchers.find_one({"voucher_number": voucher.voucher_number})
-    if existing:
-        raise HTTPException(status_code=400, detail="Voucher number already exists")
+    if not voucher.voucher_number:
+        voucher.voucher_number = await sequence_allocator.next(
+            db, "journal_voucher", date.fromisoformat(voucher.voucher_date)
+        )
     
     voucher_data = JournalVoucher(
         **voucher.model_dump(), 
@@ -519,39 +322,32 @@ async def create_journal_voucher(voucher: JournalVoucherCreate, current_user: Us
     voucher_data.voucher_date = date.fromisoformat(voucher.voucher_date)
     
     voucher_dict = voucher_data.model_dump()
-    voucher_dict['voucher_date'] = voucher_dict['voucher_date'].isoformat()
-    voucher_dict['created_at'] = voucher_dict['created_at'].isoformat()
-    
-    await db.journal_vouchers.insert_one(voucher_dict)
+    voucher_dict['voucher_date'] = to_bson_date(voucher_dict['voucher_date'])
+    posting = VoucherPosting("journal_vouchers", voucher_dict)
     
-    # Update account balances
-    for line in voucher.lines:
-        await update_account_balance(line.account_id, debit=line.debit, credit=line.credit)
-    
-    # Create journal entry
+    # Create journal entry (its lines update account balances)
     journal_entry = JournalEntry(
         voucher_id=voucher_data.id,
         voucher_type="journal",
         entry_date=voucher_data.voucher_date,
         lines=voucher.lines
     )
-    journal_dict = journal_entry.model_dump()
-    journal_dict['entry_date'] = journal_dict['entry_date'].isoformat()
-    journal_dict['created_at'] = journal_dict['created_at'].isoformat()
-    await db.journal_entries.insert_one(journal_dict)
+    posting.set_journal(journal_document(journal_entry), voucher.lines)
     
+    await commit_posting(posting)
     return voucher_data
 
 @router.get("/erp/vouchers/journal", response_model=List[JournalVoucher])
-async def get_journal_vouchers(current_user: User = Depends(get_current_admin)):
-    """Get all journal vouchers"""
-    vouchers = await db.journal_vouchers.find({}, {"_id": 0}).sort("voucher_date", -1).to_list(1000)
-    for v in vouchers:
-        if isinstance(v.get('voucher_date'), str):
-            v['voucher_date'] = date.fromisoformat(v['voucher_date'])
-        if isinstance(v.get('created_at'), str):
-            v['created_at'] = datetime.fromisoformat(v['created_at'])
-    return vouchers
+async def get_journal_vouchers(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Get journal vouchers, newest first (keyset paginated)"""
+    vouchers, next_cursor = await fetch_page(db.journal_vouchers, {}, VOUCHER_SORT, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return list_response(response, JournalVoucher, vouchers)
 
 # ==================== CONTRA VOUCHER ====================
 
@@ -559,18 +355,17 @@ async def get_journal_vouchers(current_user: User = Depends(get_current_admin)):
 async def create_contra_voucher(voucher: ContraVoucherCreate, current_user: User = Depends(get_current_admin)):
     """Create contra voucher (Cash to Bank or Bank to Cash)"""
     
-    existing = await db.contra_vouchers.find_one({"voucher_number": voucher.voucher_number})
-    if existing:
-        raise HTTPException(status_code=400, detail="Voucher number already exists")
+    if not voucher.voucher_number:
+        voucher.voucher_number = await sequence_allocator.next(
+            db, "contra_voucher", date.fromisoformat(voucher.voucher_date)
+        )
     
     voucher_data = ContraVoucher(**voucher.model_dump(), created_by=current_user.id)
     voucher_data.voucher_date = date.fromisoformat(voucher.voucher_date)
     
     voucher_dict = voucher_data.model_dump()
-    voucher_dict['voucher_date'] = voucher_dict['voucher_date'].isoformat()
-    voucher_dict['created_at'] = voucher_dict['created_at'].isoformat()
-    
-    await db.contra_vouchers.insert_one(voucher_dict)
+    voucher_dict['voucher_date'] = to_bson_date(voucher_dict['voucher_date'])
+    posting = VoucherPosting("contra_vouchers", voucher_dict)
     
     # Create journal entries
     journal_lines = [
@@ -590,30 +385,147 @@ async def create_contra_voucher(voucher: ContraVoucherCreate, current_user: User
         )
     ]
     
-    # Update balances
-    await update_account_balance(voucher.to_account_id, debit=voucher.amount)
-    await update_account_balance(voucher.from_account_id, credit=voucher.amount)
-    
     journal_entry = JournalEntry(
         voucher_id=voucher_data.id,
         voucher_type="contra",
         entry_date=voucher_data.voucher_date,
         lines=journal_lines
     )
-    journal_dict = journal_entry.model_dump()
-    journal_dict['entry_date'] = journal_dict['entry_date'].isoformat()
-    journal_dict['created_at'] = journal_dict['created_at'].isoformat()
-    await db.journal_entries.insert_one(journal_dict)
+    posting.set_journal(journal_document(journal_entry), journal_lines)
     
+    await commit_posting(posting)
     return voucher_data
 
 @router.get("/erp/vouchers/contra", response_model=List[ContraVoucher])
-async def get_contra_vouchers(current_user: User = Depends(get_current_admin)):
-    """Get all contra vouchers"""
-    vouchers = await db.contra_vouchers.find({}, {"_id": 0}).sort("voucher_date", -1).to_list(1000)
-    for v in vouchers:
-        if isinstance(v.get('voucher_date'), str):
-            v['voucher_date'] = date.fromisoformat(v['voucher_date'])
-        if isinstance(v.get('created_at'), str):
-            v['created_at'] = datetime.fromisoformat(v['created_at'])
-    return vouchers
+async def get_contra_vouchers(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Get contra vouchers, newest first (keyset paginated)"""
+    vouchers, next_cursor = await fetch_page(db.contra_vouchers, {}, VOUCHER_SORT, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return list_response(response, ContraVoucher, vouchers)
+
+# ==================== DAY BOOK ====================
+
+@router.get("/erp/day-book", response_model=List[DayBookEntry])
+async def get_day_book(
+    response: Response,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    voucher_type: Optional[str] = None,
+    party_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Vouchers of every type by date and number (keyset paginated)"""
+    if voucher_type and voucher_type not in DAY_BOOK_TYPES:
+        raise HTTPException(status_code=404, detail="Unknown voucher type")
+    entries, next_cursor = await day_book_page(db, from_date, to_date, voucher_type, party_id, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return list_response(response, DayBookEntry, entries)
+
+@router.post("/erp/day-book/rebuild")
+async def rebuild_day_book(current_user: User = Depends(get_current_admin)):
+    """Add any voucher missing from the day book register"""
+    return {"entries": await rebuild_register(db)}
+
+# ==================== BULK IMPORT ====================
+
+@router.post("/erp/vouchers/import/{voucher_type}")
+async def import_vouchers(
+    voucher_type: str,
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, description="csv or jsonl; taken from the file name when omitted"),
+    batch_size: int = Query(VOUCHER_IMPORT_BATCH_SIZE, ge=1, le=5000),
+    current_user: User = Depends(get_current_admin)
+):
+    """Import sales or purchase vouchers from CSV/JSONL.
+
+    Responds with NDJSON: one progress line per batch (with per-row errors)
+    and a final summary line.
+    """
+    try:
+        fmt = format_for(file.filename, format)
+        job = VoucherImport(client, db, voucher_type, current_user.id, batch_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # FastAPI closes the upload once this handler returns, before the
+    # response is streamed, so the rows are read from our own spool
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    while chunk := await file.read(1024 * 1024):
+        spool.write(chunk)
+    spool.seek(0)
+    
+    async def progress():
+        lines = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+        try:
+            async for report in job.run(parse_records(lines, fmt, voucher_type)):
+                yield json.dumps(report) + "\n"
+        finally:
+            lines.close()
+    
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+# ==================== EXPORT ====================
+
+_ITEM_EXPORT_COLUMNS = ["item_id", "item_name", "quantity", "rate", "amount", "tax_rate", "tax_amount", "total"]
+
+# voucher type -> (collection, voucher columns, line field, line columns)
+# Sales/purchase exports use the bulk import's CSV layout, so they re-import as-is
+VOUCHER_EXPORTS = {
+    "sales": ("sales_vouchers",
+              ["voucher_number", "voucher_date", "customer_id", "customer_name", "discount", "notes"],
+              "items", _ITEM_EXPORT_COLUMNS),
+    "purchase": ("purchase_vouchers",
+                 ["voucher_number", "voucher_date", "supplier_id", "supplier_name", "discount", "notes"],
+                 "items", _ITEM_EXPORT_COLUMNS),
+    "payment": ("payment_vouchers",
+                ["voucher_number", "voucher_date", "party_id", "party_name", "party_type", "amount",
+                 "payment_mode", "reference", "account_id", "notes"],
+                None, []),
+    "receipt": ("receipt_vouchers",
+                ["voucher_number", "voucher_date", "party_id", "party_name", "party_type", "amount",
+                 "payment_mode", "reference", "account_id", "notes"],
+                None, []),
+    "expense": ("expense_vouchers",
+                ["voucher_number", "voucher_date", "expense_account_id", "expense_account_name", "amount",
+                 "payment_mode", "paid_from_account_id", "notes"],
+                None, []),
+    "journal": ("journal_vouchers",
+                ["voucher_number", "voucher_date", "narration"],
+                "lines", ["account_id", "account_name", "debit", "credit", ("line_narration", "narration")]),
+    "contra": ("contra_vouchers",
+               ["voucher_number", "voucher_date", "from_account_id", "from_account_name", "to_account_id",
+                "to_account_name", "amount", "reference", "notes"],
+               None, []),
+}
+
+@router.get("/erp/vouchers/{voucher_type}/export")
+async def export_vouchers(
+    voucher_type: str,
+    format: str = Query("csv", description="csv or xlsx"),
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Stream every voucher of a type, oldest first, as CSV or XLSX"""
+    if voucher_type not in VOUCHER_EXPORTS:
+        raise HTTPException(status_code=404, detail="Unknown voucher type")
+    collection, columns, lines_field, line_columns = VOUCHER_EXPORTS[voucher_type]
+    
+    query = {}
+    if from_date or to_date:
+        query["voucher_date"] = date_range(from_date, to_date)
+    cursor = db[collection].find(query, {"_id": 0}).sort([("voucher_date", 1), ("id", 1)])
+    
+    return export_response(
+        cursor_rows(cursor, columns, lines_field, line_columns),
+        headers_of(list(columns) + list(line_columns)),
+        format,
+        f"{voucher_type}-vouchers"
+    )
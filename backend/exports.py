@@ -0,0 +1,128 @@
+"""
+Streaming CSV/XLSX exports fed from Mongo cursors
+"""
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import asyncio
+import csv
+import io
+import os
+import tempfile
+
+import xlsxwriter
+
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+EXPORT_FORMATS = ("csv", "xlsx")
+
+# Flush the CSV buffer to the client once it holds this much text
+CSV_CHUNK_BYTES = 64 * 1024
+XLSX_CHUNK_BYTES = 256 * 1024
+
+# A column is a field name, or (header, field name) when they differ
+Column = Union[str, Tuple[str, str]]
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def headers_of(columns: Sequence[Column]) -> List[str]:
+    return [column if isinstance(column, str) else column[0] for column in columns]
+
+
+def _field(column: Column) -> str:
+    return column if isinstance(column, str) else column[1]
+
+
+def document_rows(doc: Dict[str, Any], columns: Sequence[Column], lines_field: Optional[str] = None,
+                  line_columns: Sequence[Column] = ()) -> Iterable[List[Any]]:
+    """One row per document, or one per entry of ``lines_field`` with the
+    document's columns repeated (invoice items, journal lines)"""
+    head = [doc.get(_field(column)) for column in columns]
+    if not lines_field:
+        yield head
+        return
+    for line in doc.get(lines_field) or [{}]:
+        yield head + [line.get(_field(column)) for column in line_columns]
+
+
+async def cursor_rows(cursor, columns: Sequence[Column], lines_field: Optional[str] = None,
+                      line_columns: Sequence[Column] = ()) -> AsyncIterator[List[Any]]:
+    """Rows from a cursor read ``EXPORT_BATCH_SIZE`` documents at a time"""
+    async for doc in cursor.batch_size(EXPORT_BATCH_SIZE):
+        for row in document_rows(doc, columns, lines_field, line_columns):
+            yield row
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        # Calendar dates are stored as midnight UTC
+        if value.hour == value.minute == value.second == value.microsecond == 0:
+            return value.date().isoformat()
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+async def csv_chunks(rows: AsyncIterator[Sequence[Any]], headers: Sequence[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    # BOM so Excel opens the file as UTF-8
+    buffer.write("\ufeff")
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    async for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        if buffer.tell() >= CSV_CHUNK_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+async def xlsx_chunks(rows: AsyncIterator[Sequence[Any]], headers: Sequence[str], sheet: str) -> AsyncIterator[bytes]:
+    """Write the sheet in constant-memory mode, then stream the file.
+
+    XLSX is a zip whose directory comes last, so bytes can only be sent
+    once the workbook is closed; rows are spooled to disk as they arrive.
+    """
+    with tempfile.TemporaryFile() as output:
+        workbook = xlsxwriter.Workbook(output, {
+            "constant_memory": True,
+            "remove_timezone": True,
+            "default_date_format": "yyyy-mm-dd",
+        })
+        worksheet = workbook.add_worksheet(sheet[:31])
+        bold = workbook.add_format({"bold": True})
+        worksheet.write_row(0, 0, headers, bold)
+        row_number = 0
+        async for row in rows:
+            row_number += 1
+            for column, value in enumerate(row):
+                if isinstance(value, datetime):
+                    worksheet.write_datetime(row_number, column, value)
+                elif value is not None:
+                    worksheet.write(row_number, column, value)
+        # Zipping can take a while for a full year; keep the event loop free
+        await asyncio.to_thread(workbook.close)
+        output.seek(0)
+        while chunk := output.read(XLSX_CHUNK_BYTES):
+            yield chunk
+
+
+def export_response(rows: AsyncIterator[Sequence[Any]], headers: Sequence[str], fmt: str, name: str) -> StreamingResponse:
+    """StreamingResponse serving ``rows`` as ``name``.csv or ``name``.xlsx"""
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format; use one of {EXPORT_FORMATS}")
+    if fmt == "xlsx":
+        body = xlsx_chunks(rows, headers, name)
+    else:
+        body = csv_chunks(rows, headers)
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
@@ -0,0 +1,64 @@
+"""
+Opt-in fast serialization for large list responses
+"""
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Type, Union
+import os
+import typing
+
+import orjson
+
+# off      - return rows and let FastAPI validate/serialize them (default)
+# validate - validate once with a cached TypeAdapter, encode in pydantic-core
+# trust    - rows were validated on write; encode them straight with orjson
+FAST_RESPONSE_MODE = os.environ.get('FAST_RESPONSE_MODE', 'off')
+FAST_RESPONSE_MODES = ("off", "validate", "trust")
+
+if FAST_RESPONSE_MODE not in FAST_RESPONSE_MODES:
+    raise ValueError(f"FAST_RESPONSE_MODE must be one of {FAST_RESPONSE_MODES}")
+
+
+@lru_cache(maxsize=None)
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    """Build (once per model) the validator/serializer for List[model]"""
+    return TypeAdapter(List[model])
+
+
+@lru_cache(maxsize=None)
+def date_fields(model: Type[BaseModel]) -> Tuple[str, ...]:
+    """Top-level ``date`` fields, which Mongo hands back as midnight datetimes"""
+    fields = []
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        if annotation is date or date in typing.get_args(annotation):
+            fields.append(name)
+    return tuple(fields)
+
+
+def encode_list(model: Type[BaseModel], rows: List[Dict[str, Any]], mode: str = FAST_RESPONSE_MODE) -> bytes:
+    if mode == "trust":
+        for name in date_fields(model):
+            for row in rows:
+                value = row.get(name)
+                if isinstance(value, datetime):
+                    row[name] = value.date()
+        return orjson.dumps(rows, option=orjson.OPT_UTC_Z)
+    adapter = list_adapter(model)
+    return adapter.dump_json(adapter.validate_python(rows))
+
+
+def list_response(response: Response, model: Type[BaseModel], rows: List[Dict[str, Any]]) -> Union[Response, List[Dict[str, Any]]]:
+    """Return value for a ``response_model=List[model]`` endpoint.
+
+    With the fast path off the rows are returned unchanged. Otherwise they
+    are encoded here and FastAPI's own validation is skipped. Headers set on
+    the injected ``response`` (e.g. X-Next-Cursor) are carried over.
+    """
+    if FAST_RESPONSE_MODE == "off":
+        return rows
+    fast = Response(encode_list(model, rows), media_type="application/json")
+    fast.headers.raw.extend(response.headers.raw)
+    return fast
@@ -0,0 +1,46 @@
+"""
+Bulk-import sales or purchase vouchers from a CSV or JSONL file.
+
+Run from backend/:  python import_vouchers.py sales invoices-2024.csv [--batch-size 500]
+
+JSONL lines have the same shape as the POST /api/erp/vouchers/<type> body.
+CSV files have one item per row; consecutive rows sharing a voucher_ref
+(or voucher_number) form one voucher. See erp/voucher_import.py.
+"""
+import argparse
+import asyncio
+
+from database import client, db, close_client
+from erp.voucher_import import IMPORT_TYPES, VOUCHER_IMPORT_BATCH_SIZE, VoucherImport, format_for, parse_records
+
+
+async def main(voucher_type: str, path: str, fmt: str, batch_size: int, created_by: str, max_errors: int) -> None:
+    job = VoucherImport(client, db, voucher_type, created_by, batch_size)
+    shown = 0
+    with open(path, encoding="utf-8-sig", newline="") as lines:
+        async for report in job.run(parse_records(lines, format_for(path, fmt), voucher_type)):
+            if report.get("done"):
+                break
+            print(f"✓ batch {report['batch']}: {report['batch_posted']} posted, {report['batch_failed']} failed "
+                  f"({report['posted']} total, {report['vouchers_per_second']:.0f} vouchers/s)")
+            for error in report["errors"]:
+                if shown < max_errors:
+                    print(f"  row {error['row']}: {error['error']}")
+                shown += 1
+    if shown > max_errors:
+        print(f"  ... {shown - max_errors} more errors")
+    print(f"\n✅ Imported {report['posted']} {voucher_type} vouchers ({report['failed']} failed) "
+          f"in {report['elapsed_seconds']:.1f}s")
+    close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-import vouchers from CSV or JSONL")
+    parser.add_argument("voucher_type", choices=sorted(IMPORT_TYPES))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=VOUCHER_IMPORT_BATCH_SIZE)
+    parser.add_argument("--created-by", default="import", help="stored as created_by on every voucher")
+    parser.add_argument("--max-errors", type=int, default=50, help="row errors to print")
+    args = parser.parse_args()
+    asyncio.run(main(args.voucher_type, args.path, args.format, args.batch_size, args.created_by, args.max_errors))
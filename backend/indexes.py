@@ -0,0 +1,367 @@
+"""
+Declarative MongoDB index registry, bootstrap and usage report
+
+Run from backend/:  python indexes.py          (create anything missing)
+                    python indexes.py --check  (report only)
+                    python indexes.py --dedupe (renumber duplicate legacy
+                                                numbers, then create)
+"""
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import logging
+
+from database import db as default_db, close_client
+from product_search import SEARCH_INDEX_NAME, SEARCH_WEIGHTS
+
+logger = logging.getLogger(__name__)
+
+
+def _unique_id() -> IndexModel:
+    return IndexModel([("id", ASCENDING)], unique=True)
+
+
+def _voucher_indexes(*extra: IndexModel) -> List[IndexModel]:
+    return [
+        _unique_id(),
+        IndexModel([("voucher_number", ASCENDING)], unique=True),
+        IndexModel([("voucher_date", DESCENDING), ("id", DESCENDING)]),
+        *extra,
+    ]
+
+
+def _ledger_index(field: str) -> IndexModel:
+    # Each ledger row belongs to a party or an item, so index
+    # only the rows that carry the field
+    return IndexModel(
+        [(field, ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)],
+        partialFilterExpression={field: {"$exists": True}},
+    )
+
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    # ---- storefront ----
+    "users": [
+        _unique_id(),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "products": [
+        _unique_id(),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("category", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("is_trending", ASCENDING)]),
+        IndexModel([("is_featured", ASCENDING)]),
+        IndexModel(
+            [(field, TEXT) for field in SEARCH_WEIGHTS],
+            name=SEARCH_INDEX_NAME,
+            weights=SEARCH_WEIGHTS,
+            default_language="english",
+        ),
+    ],
+    "carts": [IndexModel([("user_id", ASCENDING)], unique=True)],
+    "wishlists": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+        IndexModel([("updated_at", ASCENDING)]),
+    ],
+    "orders": [
+        _unique_id(),
+        IndexModel([("order_number", ASCENDING)], unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "stock_reservations": [
+        IndexModel([("user_id", ASCENDING), ("product_id", ASCENDING)]),
+        IndexModel([("expires_at", ASCENDING)]),
+        IndexModel([("claimed_by", ASCENDING)]),
+    ],
+    "marketing_designs": [
+        _unique_id(),
+        IndexModel([("created_at", DESCENDING)]),
+    ],
+    # ---- accounting ----
+    "accounts": [
+        _unique_id(),
+        IndexModel([("code", ASCENDING)], unique=True),
+        IndexModel([("account_type", ASCENDING)]),
+    ],
+    "items": [
+        _unique_id(),
+        IndexModel([("code", ASCENDING)], unique=True),
+        IndexModel([("name", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "item_units": [_unique_id()],
+    "item_categories": [_unique_id()],
+    "parties": [
+        _unique_id(),
+        IndexModel([("code", ASCENDING), ("party_type", ASCENDING)], unique=True),
+        IndexModel([("name", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("party_type", ASCENDING), ("name", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "sales_vouchers": _voucher_indexes(IndexModel([("customer_id", ASCENDING)])),
+    "purchase_vouchers": _voucher_indexes(IndexModel([("supplier_id", ASCENDING)])),
+    "payment_vouchers": _voucher_indexes(IndexModel([("party_id", ASCENDING), ("party_type", ASCENDING)])),
+    "receipt_vouchers": _voucher_indexes(IndexModel([("party_id", ASCENDING), ("party_type", ASCENDING)])),
+    "expense_vouchers": _voucher_indexes(),
+    "journal_vouchers": _voucher_indexes(),
+    "contra_vouchers": _voucher_indexes(),
+    "voucher_register": [
+        _unique_id(),
+        IndexModel([("voucher_date", ASCENDING), ("voucher_number", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("voucher_type", ASCENDING), ("voucher_date", ASCENDING),
+                    ("voucher_number", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("party_id", ASCENDING), ("voucher_date", ASCENDING),
+                    ("voucher_number", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "journal_entries": [
+        _unique_id(),
+        IndexModel([("voucher_id", ASCENDING)]),
+        IndexModel([("entry_date", ASCENDING)]),
+    ],
+    "ledger_entries": [
+        _ledger_index("party_id"),
+        _ledger_index("item_id"),
+    ],
+    "postings": [
+        _unique_id(),
+        IndexModel([("account_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)],
+                    partialFilterExpression={"account_id": {"$exists": True}}),
+        IndexModel([("party_id", ASCENDING), ("date", ASCENDING)],
+                    partialFilterExpression={"party_id": {"$exists": True}}),
+        IndexModel([("date", ASCENDING), ("account_id", ASCENDING)]),
+        IndexModel([("voucher_id", ASCENDING)]),
+    ],
+    "ledger_checkpoints": [
+        IndexModel([("field", ASCENDING), ("entity_id", ASCENDING), ("month", ASCENDING)], unique=True),
+    ],
+    # ---- simple ERP ----
+    "erp_sales": [
+        _unique_id(),
+        IndexModel([("invoice_number", ASCENDING)], unique=True),
+        IndexModel([("created_at", DESCENDING)]),
+        IndexModel([("party_id", ASCENDING)]),
+    ],
+    "erp_purchases": [
+        _unique_id(),
+        IndexModel([("bill_number", ASCENDING)], unique=True),
+        IndexModel([("created_at", DESCENDING)]),
+        IndexModel([("supplier_id", ASCENDING)]),
+    ],
+    "erp_payments": [
+        _unique_id(),
+        IndexModel([("created_at", DESCENDING)]),
+        IndexModel([("party_id", ASCENDING)]),
+    ],
+    "erp_parties": [_unique_id()],
+}
+
+
+# Numbers the old code drew at random (four-digit INV/BILL suffixes, six-digit
+# FTC order numbers) and that may therefore repeat in existing data
+RENUMBERABLE = {
+    "orders": "order_number",
+    "erp_sales": "invoice_number",
+    "erp_purchases": "bill_number",
+}
+
+
+def index_name(index: IndexModel) -> str:
+    return index.document["name"]
+
+
+async def create_indexes(db) -> Dict[str, Any]:
+    """Create every registered index that is missing (idempotent).
+
+    A collection whose indexes cannot be built (e.g. duplicates blocking a
+    unique index) is logged and skipped so the others still get theirs.
+    """
+    created: Dict[str, List[str]] = {}
+    failed: Dict[str, str] = {}
+    for collection, indexes in INDEXES.items():
+        try:
+            created[collection] = await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            failed[collection] = str(e)
+            logger.error("Could not create indexes on %s: %s", collection, e)
+    return {"created": created, "failed": failed}
+
+
+async def find_duplicates(db, collection: str, index: IndexModel, limit: int = 20) -> List[Dict[str, Any]]:
+    """Key values of ``index`` held by more than one document"""
+    fields = list(index.document["key"])
+    pipeline = [
+        {"$group": {"_id": {field: f"${field}" for field in fields}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ]
+    return [{"key": row["_id"], "count": row["count"]}
+            async for row in db[collection].aggregate(pipeline, allowDiskUse=True)]
+
+
+async def missing_unique_indexes(db) -> List[Dict[str, Any]]:
+    """Registered unique indexes that do not exist, each with the duplicate
+    keys that keep it from being built"""
+    missing = []
+    for collection, indexes in INDEXES.items():
+        unique = [index for index in indexes if index.document.get("unique")]
+        if not unique:
+            continue
+        existing = await _existing_indexes(db, collection)
+        for index in unique:
+            if index_name(index) not in existing:
+                missing.append({
+                    "collection": collection,
+                    "index": index_name(index),
+                    "duplicates": await find_duplicates(db, collection, index),
+                })
+    return missing
+
+
+async def check_unique_indexes(db) -> List[Dict[str, Any]]:
+    """Log every registered unique index that is missing.
+
+    Codes and numbers rely on these indexes alone to reject duplicates, so
+    while one is missing duplicates are accepted. Startup carries on; the
+    admin index report and ``python indexes.py --check`` list the blocking
+    keys, and ``python indexes.py --dedupe`` renumbers legacy order,
+    invoice and bill numbers.
+    """
+    missing = await missing_unique_indexes(db)
+    for row in missing:
+        logger.error(
+            "Unique index %s.%s is missing, duplicates are not rejected; blocking keys: %s",
+            row["collection"], row["index"],
+            ", ".join(f"{dup['key']} x{dup['count']}" for dup in row["duplicates"]) or "none",
+        )
+    return missing
+
+
+async def renumber_duplicates(db) -> Dict[str, int]:
+    """Suffix repeated legacy numbers with ``-2``, ``-3``... so their unique
+    indexes can be built; the oldest document keeps the original number"""
+    renumbered: Dict[str, int] = {}
+    for collection, field in RENUMBERABLE.items():
+        count = 0
+        groups = await db[collection].aggregate([
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ], allowDiskUse=True).to_list(None)
+        for group in groups:
+            number = group["_id"]
+            docs = await db[collection].find({field: number}, {"_id": 1}) \
+                .sort([("created_at", ASCENDING), ("_id", ASCENDING)]).to_list(None)
+            suffix = 1
+            for doc in docs[1:]:
+                suffix += 1
+                while await db[collection].find_one({field: f"{number}-{suffix}"}, {"_id": 1}):
+                    suffix += 1
+                await db[collection].update_one({"_id": doc["_id"]}, {"$set": {field: f"{number}-{suffix}"}})
+                count += 1
+        renumbered[collection] = count
+    return renumbered
+
+
+async def _existing_indexes(db, collection: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        return await db[collection].index_information()
+    except OperationFailure:
+        # Collection does not exist yet
+        return {}
+
+
+async def _index_usage(db, collection: str) -> Dict[str, Dict[str, Any]]:
+    usage = {}
+    try:
+        async for stat in db[collection].aggregate([{"$indexStats": {}}]):
+            usage[stat["name"]] = {
+                "ops": stat.get("accesses", {}).get("ops", 0),
+                "since": stat.get("accesses", {}).get("since"),
+            }
+    except OperationFailure as e:
+        logger.warning("$indexStats failed on %s: %s", collection, e)
+    return usage
+
+
+async def index_report(db) -> Dict[str, Any]:
+    """Compare the registry with what exists and how often it is used.
+
+    ``$indexStats`` counters are per mongod and reset on restart, so an
+    index only counts as unused once the server has been up a while.
+    """
+    collections = set(INDEXES) | set(await db.list_collection_names())
+    missing, unused, unregistered = [], [], []
+    usage_by_collection = {}
+
+    for collection in sorted(collections):
+        existing = await _existing_indexes(db, collection)
+        registered = {index_name(index): index for index in INDEXES.get(collection, [])}
+        for name in sorted(set(registered) - set(existing)):
+            row: Dict[str, Any] = {"collection": collection, "index": name}
+            if registered[name].document.get("unique"):
+                # Usually why a unique index is missing
+                row["duplicates"] = await find_duplicates(db, collection, registered[name])
+            missing.append(row)
+        for name in sorted(set(existing) - registered - {"_id_"}):
+            unregistered.append({"collection": collection, "index": name, "key": existing[name].get("key")})
+
+        if not existing:
+            continue
+        usage = await _index_usage(db, collection)
+        usage_by_collection[collection] = usage
+        for name, stats in sorted(usage.items()):
+            if name != "_id_" and stats["ops"] == 0:
+                unused.append({"collection": collection, "index": name, "since": stats["since"]})
+
+    # Queries the slow log saw scanning whole collections point at missing indexes
+    collscans = await db.slow_queries.aggregate([
+        {"$match": {"explain.plan": "COLLSCAN"}},
+        {"$group": {
+            "_id": {"collection": "$collection", "filter_shape": "$filter_shape", "sort_shape": "$sort_shape"},
+            "count": {"$sum": 1},
+            "max_ms": {"$max": "$duration_ms"},
+        }},
+        {"$sort": {"count": -1}},
+        {"$limit": 50},
+    ]).to_list(50)
+
+    return {
+        "missing": missing,
+        "unused": unused,
+        "unregistered": unregistered,
+        "collscans": [{**row["_id"], "count": row["count"], "max_ms": row["max_ms"]} for row in collscans],
+        "usage": usage_by_collection,
+    }
+
+
+async def main(check: bool, dedupe: bool) -> None:
+    db = default_db
+    if dedupe and not check:
+        for collection, count in (await renumber_duplicates(db)).items():
+            print(f"✓ {collection}: renumbered {count} duplicate {RENUMBERABLE[collection]}s")
+    if not check:
+        result = await create_indexes(db)
+        for collection, names in result["created"].items():
+            print(f"✓ {collection}: {', '.join(names)}")
+        for collection, error in result["failed"].items():
+            print(f"✗ {collection}: {error}")
+    report = await index_report(db)
+    for row in report["missing"]:
+        print(f"missing     {row['collection']}.{row['index']}")
+        for dup in row.get("duplicates", []):
+            print(f"  duplicate {dup['key']} x{dup['count']}")
+    for row in report["unused"]:
+        print(f"unused      {row['collection']}.{row['index']} (no ops since {row['since']})")
+    for row in report["unregistered"]:
+        print(f"unregistered {row['collection']}.{row['index']} {row['key']}")
+    close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create registered indexes and report index usage")
+    parser.add_argument("--check", action="store_true", help="only report, do not create anything")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="renumber duplicate order, invoice and bill numbers before creating indexes")
+    args = parser.parse_args()
+    asyncio.run(main(args.check, args.dedupe))
@@ -0,0 +1,182 @@
+"""
+Prometheus metrics for HTTP routes and the Mongo commands each request issues
+"""
+from pymongo import monitoring
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+import threading
+import time
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition layout"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        sep = "," if labels else ""
+        lines = []
+        running = 0
+        for bound, count in zip(self.bounds, self.counts):
+            running += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound:g}"}} {running}')
+        running += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {running}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {running}")
+        return lines
+
+
+class MongoUsage:
+    """Mongo round trips made while serving one request"""
+
+    __slots__ = ("path", "commands", "seconds")
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.commands = 0
+        self.seconds = 0.0
+
+
+# Motor runs commands on executor threads with a copy of the caller's
+# context, so listener callbacks can find the request they belong to.
+current_usage: ContextVar[Optional[MongoUsage]] = ContextVar("mongo_usage", default=None)
+
+
+def _labels(**values: str) -> str:
+    def escape(value: str) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{key}="{escape(value)}"' for key, value in values.items())
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.request_latency: Dict[Tuple[str, str], Histogram] = {}
+        self.request_mongo_commands: Dict[Tuple[str, str], Histogram] = {}
+        self.request_mongo_seconds: Dict[Tuple[str, str], Histogram] = {}
+        self.responses: Dict[Tuple[str, str, int], int] = {}
+        self.command_latency: Dict[str, Histogram] = {}
+        self.commands: Dict[Tuple[str, str], int] = {}
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, usage: MongoUsage) -> None:
+        key = (method, route)
+        with self._lock:
+            self.request_latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.request_mongo_commands.setdefault(key, Histogram(COMMAND_COUNT_BUCKETS)).observe(usage.commands)
+            self.request_mongo_seconds.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(usage.seconds)
+            self.responses[(method, route, status)] = self.responses.get((method, route, status), 0) + 1
+
+    def observe_command(self, command: str, seconds: float, failed: bool) -> None:
+        outcome = "failed" if failed else "succeeded"
+        with self._lock:
+            self.command_latency.setdefault(command, Histogram(MONGO_LATENCY_BUCKETS)).observe(seconds)
+            self.commands[(command, outcome)] = self.commands.get((command, outcome), 0) + 1
+            usage = current_usage.get()
+            if usage is not None:
+                usage.commands += 1
+                usage.seconds += seconds
+
+    def render(self) -> str:
+        out = [
+            "# HELP http_requests_in_flight Requests currently being served by this worker",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+        ]
+        with self._lock:
+            families = (
+                ("http_request_duration_seconds", "Request latency by route template", self.request_latency),
+                ("http_request_mongo_commands", "Mongo commands issued per request", self.request_mongo_commands),
+                ("http_request_mongo_seconds", "Time spent in Mongo commands per request", self.request_mongo_seconds),
+            )
+            for name, help_text, histograms in families:
+                out += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (method, route), histogram in sorted(histograms.items()):
+                    out += histogram.render(name, _labels(method=method, route=route))
+
+            out += ["# HELP http_responses_total Responses by route template and status", "# TYPE http_responses_total counter"]
+            for (method, route, status), count in sorted(self.responses.items()):
+                out.append(f"http_responses_total{{{_labels(method=method, route=route, status=str(status))}}} {count}")
+
+            out += ["# HELP mongo_command_duration_seconds Mongo command latency", "# TYPE mongo_command_duration_seconds histogram"]
+            for command, histogram in sorted(self.command_latency.items()):
+                out += histogram.render("mongo_command_duration_seconds", _labels(command=command))
+
+            out += ["# HELP mongo_commands_total Mongo commands by name and outcome", "# TYPE mongo_commands_total counter"]
+            for (command, outcome), count in sorted(self.commands.items()):
+                out.append(f"mongo_commands_total{{{_labels(command=command, outcome=outcome)}}} {count}")
+        return "\n".join(out) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Feeds pymongo command events into the registry"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics.observe_command(event.command_name, event.duration_micros / 1e6, False)
+
+    def failed(self, event):
+        metrics.observe_command(event.command_name, event.duration_micros / 1e6, True)
+
+
+command_metrics = CommandMetrics()
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request against its route template.
+
+    Labels use the matched route's path (``/api/products/{product_id}``), so
+    cardinality stays bounded; anything unrouted is reported as "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        usage = MongoUsage(scope["path"])
+        token = current_usage.set(usage)
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.in_flight -= 1
+            current_usage.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            metrics.observe_request(scope["method"], route, status_code, elapsed, usage)
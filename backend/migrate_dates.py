@@ -0,0 +1,139 @@
+"""
+One-off migration: rewrite ISO-string date fields as native BSON datetimes.
+
+Run from backend/:  python migrate_dates.py [--batch-size 1000] [--collection orders]
+                                           [--naive-tz Asia/Kolkata]
+
+Each collection is scanned in _id order and rewritten with one unordered
+bulk_write per batch. The last _id written is checkpointed in the
+``migrations`` collection, so an interrupted run resumes where it stopped;
+the per-field ``$type: "string"`` guard makes re-running a batch harmless.
+
+Timestamps stored without an offset are read in ``--naive-tz`` (default
+NAIVE_DATES_TZ, else UTC). Values that do not parse are reported by _id
+and left as strings.
+"""
+from pymongo import UpdateOne
+from datetime import tzinfo
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import argparse
+import asyncio
+import os
+
+from database import db, close_client
+from dates import parse_stored
+
+MIGRATION_ID = "native_bson_dates"
+
+# Zone the old code's naive datetime.now() values were written in
+NAIVE_DATES_TZ = os.environ.get('NAIVE_DATES_TZ', 'UTC')
+
+DATE_FIELDS: Dict[str, List[str]] = {
+    "users": ["created_at"],
+    "products": ["created_at", "updated_at"],
+    "carts": ["updated_at"],
+    "wishlists": ["updated_at"],
+    "orders": ["created_at", "updated_at"],
+    "marketing_designs": ["created_at"],
+    "accounts": ["created_at"],
+    "items": ["created_at", "updated_at"],
+    "parties": ["created_at"],
+    "sales_vouchers": ["voucher_date", "created_at"],
+    "purchase_vouchers": ["voucher_date", "created_at"],
+    "payment_vouchers": ["voucher_date", "created_at"],
+    "receipt_vouchers": ["voucher_date", "created_at"],
+    "expense_vouchers": ["voucher_date", "created_at"],
+    "journal_vouchers": ["voucher_date", "created_at"],
+    "contra_vouchers": ["voucher_date", "created_at"],
+    "journal_entries": ["entry_date", "created_at"],
+    "ledger_entries": ["date", "created_at"],
+    "erp_sales": ["date", "created_at"],
+    "erp_purchases": ["date", "created_at"],
+    "erp_payments": ["date", "created_at"],
+    "erp_parties": ["created_at"],
+}
+
+
+async def migrate_collection(name: str, fields: List[str], batch_size: int, naive_tz: tzinfo) -> int:
+    checkpoint_id = f"{MIGRATION_ID}:{name}"
+    checkpoint = await db.migrations.find_one({"_id": checkpoint_id}) or {}
+    if checkpoint.get("done"):
+        print(f"- {name}: already migrated")
+        return 0
+
+    collection = db[name]
+    stale = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {field: 1 for field in fields}
+    last_id = checkpoint.get("last_id")
+    converted = checkpoint.get("converted", 0)
+    skipped = checkpoint.get("skipped", 0)
+
+    while True:
+        query = dict(stale)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await collection.find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        ops = []
+        for doc in batch:
+            update = {}
+            for f in fields:
+                if not isinstance(doc.get(f), str):
+                    continue
+                try:
+                    update[f] = parse_stored(doc[f], naive_tz)
+                except ValueError:
+                    print(f"  ! {name} {doc['_id']}: {f} {doc[f]!r} is not an ISO date, skipped")
+                    skipped += 1
+            if update:
+                guard = {f: {"$type": "string"} for f in update}
+                ops.append(UpdateOne({"_id": doc["_id"], **guard}, {"$set": update}))
+        if ops:
+            result = await collection.bulk_write(ops, ordered=False)
+            converted += result.modified_count
+
+        last_id = batch[-1]["_id"]
+        await db.migrations.update_one(
+            {"_id": checkpoint_id},
+            {"$set": {"last_id": last_id, "converted": converted, "skipped": skipped}},
+            upsert=True
+        )
+        print(f"  {name}: {converted} documents converted")
+
+    await db.migrations.update_one({"_id": checkpoint_id}, {"$set": {"done": True}}, upsert=True)
+    print(f"✓ {name}: {converted} documents converted" + (f", {skipped} values skipped" if skipped else ""))
+    return converted
+
+
+def _timezone(name: str) -> tzinfo:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise argparse.ArgumentTypeError(f"unknown time zone {name!r}")
+
+
+async def migrate_dates(batch_size: int, only: Optional[str] = None, rescan: bool = False,
+                        naive_tz: Optional[tzinfo] = None):
+    collections = {only: DATE_FIELDS[only]} if only else DATE_FIELDS
+    naive_tz = naive_tz or _timezone(NAIVE_DATES_TZ)
+    if rescan:
+        await db.migrations.delete_many({"_id": {"$in": [f"{MIGRATION_ID}:{name}" for name in collections]}})
+    total = 0
+    for name, fields in collections.items():
+        total += await migrate_collection(name, fields, batch_size, naive_tz)
+    print(f"\n✅ Converted {total} documents")
+    close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert ISO-string dates to BSON datetimes")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--collection", choices=sorted(DATE_FIELDS))
+    parser.add_argument("--rescan", action="store_true", help="ignore checkpoints and scan everything again")
+    parser.add_argument("--naive-tz", type=_timezone, default=NAIVE_DATES_TZ,
+                        help="IANA zone for timestamps stored without an offset (default: %(default)s)")
+    args = parser.parse_args()
+    asyncio.run(migrate_dates(args.batch_size, args.collection, args.rescan, args.naive_tz))
@@ -0,0 +1,115 @@
+"""
+Opaque-cursor keyset pagination helpers
+"""
+from fastapi import HTTPException, Response
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import base64
+import json
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+SortSpec = Sequence[Tuple[str, int]]
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"$d": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "$dt" in value:
+            return datetime.fromisoformat(value["$dt"])
+        if "$d" in value:
+            return date.fromisoformat(value["$d"])
+        if "$oid" in value:
+            return ObjectId(value["$oid"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any], extra: Optional[Dict[str, Any]] = None) -> str:
+    """Pack the sort-key values of the last returned row into an opaque token"""
+    payload: Dict[str, Any] = {"k": [_encode_value(v) for v in values]}
+    if extra:
+        payload["x"] = extra
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[List[Any], Dict[str, Any]]:
+    """Unpack a token produced by encode_cursor; 400 on anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = [_decode_value(v) for v in payload["k"]]
+        return values, payload.get("x") or {}
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(sort: SortSpec, values: Sequence[Any]) -> Dict[str, Any]:
+    """Filter selecting rows strictly after ``values`` in ``sort`` order.
+
+    For sort keys (k1, k2, ..., id) this expands to
+    k1 > v1 OR (k1 = v1 AND k2 > v2) OR ..., with > flipped to < for
+    descending keys, so a compound index on the sort keys serves every page.
+    """
+    if len(values) != len(sort):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {sort[j][0]: values[j] for j in range(i)}
+        clause[field] = {"$gt" if direction > 0 else "$lt": values[i]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def with_cursor(query: Dict[str, Any], sort: SortSpec, cursor: Optional[str]) -> Dict[str, Any]:
+    """AND the keyset condition for ``cursor`` into ``query``"""
+    if not cursor:
+        return query
+    values, _ = decode_cursor(cursor)
+    after = keyset_filter(sort, values)
+    return {"$and": [query, after]} if query else after
+
+
+def _sort_values(doc: Dict[str, Any], sort: SortSpec) -> List[Any]:
+    return [doc.get(field) for field, _ in sort]
+
+
+def page_from_rows(rows: List[Dict[str, Any]], sort: SortSpec, limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Trim a limit+1 fetch to ``limit`` rows and derive the next cursor"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(_sort_values(rows[-1], sort))
+
+
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    sort: SortSpec,
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Fetch one keyset page; ``sort`` must end with a unique tie-breaker (id)"""
+    if projection is None:
+        projection = {"_id": 0}
+    rows = await collection.find(with_cursor(query, sort, cursor), projection) \
+        .sort(list(sort)).limit(limit + 1).to_list(limit + 1)
+    return page_from_rows(rows, sort, limit)
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    """Advertise the next page token; absent header means last page"""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
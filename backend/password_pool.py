@@ -0,0 +1,108 @@
+"""
+Bounded thread pool for bcrypt hashing/verification off the event loop
+"""
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from typing import Any, Dict
+import asyncio
+import os
+import threading
+import time
+
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', '64'))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class OperationStats:
+    """Latency counters for one kind of password operation"""
+
+    BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500)
+
+    def __init__(self):
+        self.count = 0
+        self.rejected = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(self.BUCKETS_MS) + 1)
+
+    def observe(self, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{b}ms" for b in self.BUCKETS_MS] + ["gt_%dms" % self.BUCKETS_MS[-1]]
+        return {
+            "count": self.count,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "histogram": dict(zip(labels, self.buckets)),
+        }
+
+
+class PasswordHasher:
+    """Runs passlib bcrypt calls on a dedicated executor.
+
+    bcrypt releases the GIL, so a handful of threads give real parallelism
+    while the event loop keeps serving other requests. Work beyond
+    ``queue_limit`` in-flight calls is rejected with 503 instead of queueing
+    without bound during login bursts.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT):
+        self.workers = max(1, workers)
+        self.queue_limit = max(self.workers, queue_limit)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwdhash")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {"hash": OperationStats(), "verify": OperationStats()}
+
+    async def _run(self, operation: str, fn, *args):
+        stats = self._stats[operation]
+        with self._lock:
+            if self._in_flight >= self.queue_limit:
+                stats.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Authentication service busy, please retry",
+                    headers={"Retry-After": "1"}
+                )
+            self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._in_flight -= 1
+                stats.observe(elapsed_ms)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run("verify", pwd_context.verify, password, hashed)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": self._in_flight,
+            "operations": {name: s.as_dict() for name, s in self._stats.items()},
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,68 @@
+"""
+Storefront product search backed by a MongoDB text index
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from pagination import decode_cursor, fetch_page, keyset_filter, page_from_rows
+
+SEARCH_INDEX_NAME = "product_search"
+
+# Relative field weights used for relevance ranking
+SEARCH_WEIGHTS = {
+    "name": 10,
+    "tags": 5,
+    "brand": 3,
+    "fabric": 2,
+    "description": 1,
+}
+
+# Catalogue browsing is newest first; search results are best match first
+BROWSE_SORT = [("created_at", -1), ("id", -1)]
+SEARCH_SORT = [("score", -1), ("id", 1)]
+
+
+def build_product_filter(
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    is_featured: Optional[bool] = None,
+    is_trending: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """Combine storefront filters and the text query into one Mongo filter"""
+    query: Dict[str, Any] = {}
+    if category:
+        query['category'] = category
+    if is_featured is not None:
+        query['is_featured'] = is_featured
+    if is_trending is not None:
+        query['is_trending'] = is_trending
+    if search and search.strip():
+        query['$text'] = {'$search': search.strip()}
+    return query
+
+
+async def search_products(
+    db,
+    query: Dict[str, Any],
+    limit: int,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Run a product query, ranking by text relevance when searching.
+
+    Returns one keyset page and the cursor for the next one.
+    """
+    if '$text' not in query:
+        return await fetch_page(db.products, query, BROWSE_SORT, limit, cursor)
+    
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": query},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+    if cursor:
+        values, _ = decode_cursor(cursor)
+        pipeline.append({"$match": keyset_filter(SEARCH_SORT, values)})
+    pipeline += [
+        {"$sort": dict(SEARCH_SORT)},
+        {"$limit": limit + 1},
+        {"$project": {"_id": 0}},
+    ]
+    rows = await db.products.aggregate(pipeline).to_list(limit + 1)
+    return page_from_rows(rows, SEARCH_SORT, limit)
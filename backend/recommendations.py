@@ -0,0 +1,254 @@
+"""
+Item-item co-occurrence recommendations built from orders and wishlists
+"""
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_REFRESH_SECONDS = float(os.environ.get('RECOMMENDATION_REFRESH_SECONDS', '300'))
+# Every Nth refresh recomputes the whole matrix instead of applying deltas
+RECOMMENDATION_FULL_REBUILD_EVERY = int(os.environ.get('RECOMMENDATION_FULL_REBUILD_EVERY', '12'))
+RECOMMENDATION_NEIGHBORS = int(os.environ.get('RECOMMENDATION_NEIGHBORS', '20'))
+RECOMMENDATION_HISTORY = int(os.environ.get('RECOMMENDATION_HISTORY', '20'))
+# Incremental refreshes rescan this far behind the newest timestamp seen:
+# an order is stamped before its transaction commits, so it can become
+# visible after a later-stamped one. Longer delays wait for a full rebuild.
+RECOMMENDATION_LATE_WRITE_SECONDS = float(os.environ.get('RECOMMENDATION_LATE_WRITE_SECONDS', '120'))
+
+
+class CoPurchaseModel:
+    """In-memory item-item model.
+
+    Each order and each wishlist is a basket. ``cooc`` holds pairwise basket
+    counts (B^T B without the diagonal) and ``freq`` the per-item basket
+    counts. Neighbour lists are cosine-normalised and precomputed per item,
+    so a request only merges a few short arrays.
+    """
+
+    def __init__(self, neighbors: int = RECOMMENDATION_NEIGHBORS, history: int = RECOMMENDATION_HISTORY):
+        self.max_neighbors = neighbors
+        self.max_history = history
+        self.product_ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.cooc = sp.csr_matrix((0, 0), dtype=np.float32)
+        self.freq = np.zeros(0, dtype=np.float32)
+        self.neighbors: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self.order_history: Dict[str, Deque[int]] = {}
+        self.wishlists: Dict[str, Set[int]] = {}
+
+    # ---- building ----
+
+    def _ids_to_indices(self, product_ids: Iterable[str]) -> List[int]:
+        out = []
+        for pid in product_ids:
+            i = self.index.get(pid)
+            if i is None:
+                i = self.index[pid] = len(self.product_ids)
+                self.product_ids.append(pid)
+            out.append(i)
+        return sorted(set(out))
+
+    def _basket_matrix(self, baskets: List[List[int]], n: int) -> sp.csr_matrix:
+        rows = np.repeat(np.arange(len(baskets)), [len(b) for b in baskets])
+        cols = np.fromiter((i for b in baskets for i in b), dtype=np.int64, count=len(rows))
+        data = np.ones(len(rows), dtype=np.float32)
+        return sp.csr_matrix((data, (rows, cols)), shape=(len(baskets), n))
+
+    def apply(self, orders: List[Tuple[str, List[str]]], wishlists: List[Tuple[str, List[str]]]) -> int:
+        """Fold new orders and changed wishlists into the matrix.
+
+        Returns the number of items whose neighbour lists were recomputed.
+        """
+        added: List[List[int]] = []
+        removed: List[List[int]] = []
+
+        for user_id, product_ids in orders:
+            basket = self._ids_to_indices(product_ids)
+            if not basket:
+                continue
+            added.append(basket)
+            history = self.order_history.setdefault(user_id, deque(maxlen=self.max_history))
+            history.extend(basket)
+
+        for user_id, product_ids in wishlists:
+            basket = self._ids_to_indices(product_ids)
+            old = self.wishlists.get(user_id)
+            if old:
+                removed.append(sorted(old))
+            if basket:
+                added.append(basket)
+                self.wishlists[user_id] = set(basket)
+            else:
+                self.wishlists.pop(user_id, None)
+
+        n = len(self.product_ids)
+        cooc = self.cooc.copy()
+        cooc.resize((n, n))
+        freq = np.zeros(n, dtype=np.float32)
+        freq[:len(self.freq)] = self.freq
+
+        touched: Set[int] = set()
+        for baskets, sign in ((added, 1.0), (removed, -1.0)):
+            if not baskets:
+                continue
+            b = self._basket_matrix(baskets, n)
+            delta = (b.T @ b).tocsr()
+            freq += sign * delta.diagonal()
+            delta.setdiag(0)
+            cooc = cooc + sign * delta
+            touched.update(i for basket in baskets for i in basket)
+        cooc.eliminate_zeros()
+
+        neighbors = dict(self.neighbors)
+        for i in touched:
+            neighbors[i] = self._top_neighbors(cooc, freq, i)
+
+        self.cooc, self.freq, self.neighbors = cooc.tocsr(), freq, neighbors
+        return len(touched)
+
+    def _top_neighbors(self, cooc: sp.csr_matrix, freq: np.ndarray, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = cooc.indptr[i], cooc.indptr[i + 1]
+        cols = cooc.indices[start:end]
+        counts = cooc.data[start:end]
+        if len(cols) == 0 or freq[i] <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = counts / np.sqrt(freq[i] * np.maximum(freq[cols], 1.0))
+        if len(cols) > self.max_neighbors:
+            keep = np.argpartition(-scores, self.max_neighbors)[:self.max_neighbors]
+            cols, scores = cols[keep], scores[keep]
+        return cols.astype(np.int64), scores.astype(np.float32)
+
+    # ---- serving ----
+
+    def recommend(self, user_id: str, k: int = 4) -> List[str]:
+        """Top-k products co-occurring with the user's orders and wishlist"""
+        seen = set(self.order_history.get(user_id, ())) | self.wishlists.get(user_id, set())
+        if not seen:
+            return []
+        scores: Dict[int, float] = {}
+        for i in seen:
+            cols, weights = self.neighbors.get(i, (None, None))
+            if cols is None:
+                continue
+            for j, w in zip(cols.tolist(), weights.tolist()):
+                if j not in seen:
+                    scores[j] = scores.get(j, 0.0) + w
+        best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [self.product_ids[j] for j, _ in best]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "products": len(self.product_ids),
+            "pairs": int(self.cooc.nnz),
+            "users": len(set(self.order_history) | set(self.wishlists)),
+        }
+
+
+class RecommendationEngine:
+    """Keeps a CoPurchaseModel fresh from a background task"""
+
+    def __init__(self, interval: float = RECOMMENDATION_REFRESH_SECONDS, full_every: int = RECOMMENDATION_FULL_REBUILD_EVERY,
+                 late_write_seconds: float = RECOMMENDATION_LATE_WRITE_SECONDS):
+        self.interval = interval
+        self.full_every = max(1, full_every)
+        self.late_write = timedelta(seconds=late_write_seconds)
+        self.model = CoPurchaseModel()
+        self._order_mark = None
+        self._wishlist_mark = None
+        # order id -> created_at for orders already applied inside the rescan window
+        self._recent_orders: Dict[str, datetime] = {}
+        self._refreshes = 0
+        self._task: Optional[asyncio.Task] = None
+        self.last_refresh_ms = 0.0
+        self.last_updated_items = 0
+
+    def start(self, db) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh(self, db, full: bool = False) -> None:
+        started = time.perf_counter()
+        if full:
+            model, order_mark, wishlist_mark, recent = CoPurchaseModel(), None, None, {}
+        else:
+            model, order_mark, wishlist_mark = self.model, self._order_mark, self._wishlist_mark
+            recent = dict(self._recent_orders)
+
+        order_query: Dict[str, Any] = {"order_status": {"$ne": "cancelled"}}
+        if order_mark is not None:
+            order_query["created_at"] = {"$gt": order_mark - self.late_write}
+        orders = []
+        async for order in db.orders.find(
+            order_query, {"_id": 0, "id": 1, "user_id": 1, "items.product_id": 1, "created_at": 1}
+        ).sort("created_at", 1):
+            order_mark = order['created_at']
+            # The rescan window overlaps the previous refresh
+            if order['id'] in recent:
+                continue
+            recent[order['id']] = order['created_at']
+            orders.append((order['user_id'], [item['product_id'] for item in order.get('items', [])]))
+        if order_mark is not None:
+            cutoff = order_mark - self.late_write
+            recent = {order_id: created_at for order_id, created_at in recent.items() if created_at > cutoff}
+
+        # Re-applying a wishlist replaces its basket, so overlap needs no de-duplication
+        wishlist_query: Dict[str, Any] = {}
+        if wishlist_mark is not None:
+            wishlist_query["updated_at"] = {"$gt": wishlist_mark - self.late_write}
+        wishlists = []
+        async for wishlist in db.wishlists.find(
+            wishlist_query, {"_id": 0, "user_id": 1, "product_ids": 1, "updated_at": 1}
+        ).sort("updated_at", 1):
+            wishlists.append((wishlist['user_id'], wishlist.get('product_ids', [])))
+            wishlist_mark = wishlist['updated_at']
+
+        if full:
+            # A fresh model is private to this task, so build it off the event loop
+            self.last_updated_items = await asyncio.to_thread(model.apply, orders, wishlists)
+        elif orders or wishlists:
+            # Deltas are small; applying them in-loop keeps readers consistent
+            self.last_updated_items = model.apply(orders, wishlists)
+        self.model, self._order_mark, self._wishlist_mark = model, order_mark, wishlist_mark
+        self._recent_orders = recent
+        self.last_refresh_ms = (time.perf_counter() - started) * 1000
+
+    async def _run(self, db) -> None:
+        while True:
+            try:
+                await self.refresh(db, full=self._refreshes % self.full_every == 0)
+                self._refreshes += 1
+            except Exception:
+                logger.exception("Recommendation refresh failed")
+            await asyncio.sleep(self.interval)
+
+    def recommend(self, user_id: str, k: int = 4) -> List[str]:
+        return self.model.recommend(user_id, k)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.model.stats(),
+            "refreshes": self._refreshes,
+            "last_refresh_ms": round(self.last_refresh_ms, 2),
+            "last_updated_items": self.last_updated_items,
+        }
+
+
+recommendation_engine = RecommendationEngine()
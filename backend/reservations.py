@@ -0,0 +1,181 @@
+"""
+Time-limited stock reservations (cart holds) with a background sweeper
+"""
+from pymongo import UpdateOne
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import uuid
+
+from transactions import run_in_transaction
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TTL_SECONDS = int(os.environ.get('RESERVATION_TTL_SECONDS', '600'))
+RESERVATION_SWEEP_INTERVAL_SECONDS = float(os.environ.get('RESERVATION_SWEEP_INTERVAL_SECONDS', '30'))
+# Claims older than this are assumed to belong to a crashed worker
+RESERVATION_STALE_CLAIM_SECONDS = int(os.environ.get('RESERVATION_STALE_CLAIM_SECONDS', '300'))
+
+# Holds live in their own collection; products carry a `reserved` counter so
+# available-to-sell is simply stock - reserved on the product document.
+
+
+def available_at_least(quantity: int) -> Dict[str, Any]:
+    """Filter matching products with at least ``quantity`` unreserved units"""
+    return {"$expr": {"$gte": [
+        {"$subtract": ["$stock", {"$ifNull": ["$reserved", 0]}]},
+        quantity
+    ]}}
+
+
+def available_to_sell(product: Dict[str, Any]) -> int:
+    return max(0, product.get('stock', 0) - product.get('reserved', 0))
+
+
+async def claim_holds(db, query: Dict[str, Any], token: str, session=None) -> Dict[str, int]:
+    """Mark unclaimed holds matching ``query`` as owned by ``token``.
+
+    Claiming first means a hold is released or converted exactly once even
+    when the sweeper and a checkout race for it. Returns product_id -> qty.
+    """
+    await db.stock_reservations.update_many(
+        {**query, "claimed_by": None},
+        {"$set": {"claimed_by": token, "claimed_at": datetime.now(timezone.utc)}},
+        session=session
+    )
+    held: Dict[str, int] = {}
+    async for hold in db.stock_reservations.find({"claimed_by": token}, {"_id": 0}, session=session):
+        held[hold['product_id']] = held.get(hold['product_id'], 0) + hold['quantity']
+    return held
+
+
+async def unclaim_holds(db, token: str) -> None:
+    """Give claimed holds back (e.g. after a failed checkout)"""
+    await db.stock_reservations.update_many(
+        {"claimed_by": token},
+        {"$set": {"claimed_by": None, "claimed_at": None}}
+    )
+
+
+async def release_claimed(db, token: str, held: Dict[str, int], session=None) -> None:
+    """Return claimed quantities to available stock and drop the holds"""
+    if held:
+        await db.products.bulk_write(
+            [UpdateOne({"id": pid}, {"$inc": {"reserved": -qty}}) for pid, qty in held.items()],
+            ordered=False,
+            session=session
+        )
+    await db.stock_reservations.delete_many({"claimed_by": token}, session=session)
+
+
+async def release_holds(db, user_id: str, product_ids: Optional[List[str]] = None, session=None) -> None:
+    """Release a user's holds, optionally only for some products"""
+    query: Dict[str, Any] = {"user_id": user_id}
+    if product_ids is not None:
+        query["product_id"] = {"$in": product_ids}
+    token = str(uuid.uuid4())
+    held = await claim_holds(db, query, token, session=session)
+    await release_claimed(db, token, held, session=session)
+
+
+async def hold_stock(client, db, user_id: str, quantities: Dict[str, int]) -> Tuple[Dict[str, int], List[str], datetime]:
+    """(Re)place holds for a user's cart lines.
+
+    Previous holds for the same products are released first, then each line
+    takes a guarded ``reserved`` increment. All of it, including inserting
+    the hold documents, commits in one transaction, so ``reserved`` never
+    counts units that no hold (and so no sweep) will give back.
+    Returns (held, failed, expires_at).
+    """
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(seconds=RESERVATION_TTL_SECONDS)
+    held: Dict[str, int] = {}
+    failed: List[str] = []
+
+    async def place_holds(session):
+        # Reset on each attempt: a transient error retries the whole callback
+        held.clear()
+        failed.clear()
+        await release_holds(db, user_id, list(quantities), session=session)
+        for pid, qty in quantities.items():
+            result = await db.products.update_one(
+                {"id": pid, **available_at_least(qty)},
+                {"$inc": {"reserved": qty}},
+                session=session
+            )
+            if result.modified_count:
+                held[pid] = qty
+            else:
+                failed.append(pid)
+
+        if held:
+            await db.stock_reservations.insert_many([{
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "product_id": pid,
+                "quantity": qty,
+                "expires_at": expires_at,
+                "claimed_by": None,
+                "created_at": now
+            } for pid, qty in held.items()], session=session)
+
+    await run_in_transaction(client, place_holds)
+    return held, failed, expires_at
+
+
+async def sweep_expired(db) -> int:
+    """Release every expired (or abandoned-claim) hold in bulk"""
+    now = datetime.now(timezone.utc)
+    token = str(uuid.uuid4())
+    await db.stock_reservations.update_many(
+        {"claimed_by": {"$ne": None}, "claimed_at": {"$lt": now - timedelta(seconds=RESERVATION_STALE_CLAIM_SECONDS)}},
+        {"$set": {"claimed_by": None, "claimed_at": None}}
+    )
+    held = await claim_holds(db, {"expires_at": {"$lt": now}}, token)
+    await release_claimed(db, token, held)
+    return sum(held.values())
+
+
+class ReservationSweeper:
+    """Background task that expires holds every ``interval`` seconds"""
+
+    def __init__(self, interval: float = RESERVATION_SWEEP_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.sweeps = 0
+        self.released_units = 0
+
+    def start(self, db) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, db) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.released_units += await sweep_expired(db)
+                self.sweeps += 1
+            except Exception:
+                logger.exception("Reservation sweep failed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl_seconds": RESERVATION_TTL_SECONDS,
+            "interval_seconds": self.interval,
+            "sweeps": self.sweeps,
+            "released_units": self.released_units,
+        }
+
+
+reservation_sweeper = ReservationSweeper()
@@ -29,7 +29,7 @@ async def seed_data():
             "mobile": "8999967710",
             "role": "admin",
             "is_active": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
         await db.users.insert_one(admin_user)
         print("✓ Admin user created (email: admin@fatima.com, password: admin123)")
@@ -45,7 +45,7 @@ async def seed_data():
             "phone": "+919876543211",
             "role": "customer",
             "is_active": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
         await db.users.insert_one(customer_user)
         print("✓ Test customer created (email: customer@test.com, password: customer123)")
@@ -71,8 +71,8 @@ async def seed_data():
                 "is_featured": True,
                 "is_trending": True,
                 "views": 0,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "created_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -91,8 +91,8 @@ async def seed_data():
                 "is_featured": True,
                 "is_trending": False,
                 "views": 0,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "created_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -111,8 +111,8 @@ async def seed_data():
                 "is_featured": False,
                 "is_trending": True,
                 "views": 0,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "created_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -131,8 +131,8 @@ async def seed_data():
                 "is_featured": True,
                 "is_trending": False,
                 "views": 0,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "created_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -151,8 +151,8 @@ async def seed_data():
                 "is_featured": False,
                 "is_trending": True,
                 "views": 0,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "created_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -171,8 +171,8 @@ async def seed_data():
                 "is_featured": False,
                 "is_trending": False,
                 "views": 0,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "created_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc)
             }
         ]
         
@@ -0,0 +1,116 @@
+"""
+Collision-free document numbering backed by an atomic counter collection
+"""
+from pymongo import ReturnDocument
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Union
+import asyncio
+import os
+
+SEQUENCE_BLOCK_SIZE = int(os.environ.get('SEQUENCE_BLOCK_SIZE', '20'))
+
+
+class Series:
+    """Numbering rules for one document type"""
+
+    def __init__(self, prefix: str, width: int = 5, fiscal_year: bool = True, separator: str = "/"):
+        self.prefix = prefix
+        self.width = width
+        self.fiscal_year = fiscal_year
+        self.separator = separator
+
+    def format(self, number: int, period: Optional[str]) -> str:
+        if period:
+            return f"{self.prefix}{self.separator}{period}{self.separator}{number:0{self.width}d}"
+        return f"{self.prefix}{number:0{self.width}d}"
+
+
+SERIES: Dict[str, Series] = {
+    # Legacy order numbers are FTC + six random digits (FTC100000-FTC999999);
+    # seven or more digits can never collide with them
+    "order": Series("FTC", width=7, fiscal_year=False),
+    "erp_sale": Series("INV"),
+    "erp_purchase": Series("BILL"),
+    "sales_voucher": Series("SV"),
+    "purchase_voucher": Series("PV"),
+    "payment_voucher": Series("PAY"),
+    "receipt_voucher": Series("RCT"),
+    "expense_voucher": Series("EXP"),
+    "journal_voucher": Series("JV"),
+    "contra_voucher": Series("CV"),
+}
+
+
+def fiscal_year(on: Union[date, datetime]) -> str:
+    """Indian fiscal year label (April-March), e.g. 2025-26"""
+    start = on.year if on.month >= 4 else on.year - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+
+class SequenceAllocator:
+    """Hands out numbers from blocks leased off the ``counters`` collection.
+
+    Each lease is a single atomic ``$inc`` of ``block_size``, so workers never
+    hand out the same number and most allocations never touch Mongo. Numbers
+    left in a worker's block when it exits are skipped, which leaves gaps
+    but never duplicates.
+    """
+
+    def __init__(self, block_size: int = SEQUENCE_BLOCK_SIZE):
+        self.block_size = max(1, block_size)
+        self._blocks: Dict[str, List[int]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def _lease(self, db, key: str) -> List[int]:
+        counter = await db.counters.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"value": self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        last = counter["value"]
+        return [last - self.block_size + 1, last]
+
+    async def next_value(self, db, key: str) -> int:
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            block = self._blocks.get(key)
+            if block is None or block[0] > block[1]:
+                block = self._blocks[key] = await self._lease(db, key)
+            value = block[0]
+            block[0] += 1
+            return value
+
+    async def next(self, db, series: str, on: Optional[Union[date, datetime]] = None) -> str:
+        """Allocate the next formatted number, restarting each fiscal year"""
+        rules = SERIES[series]
+        period = None
+        if rules.fiscal_year:
+            period = fiscal_year(on or datetime.now(timezone.utc))
+        key = f"{series}:{period}" if period else series
+        return rules.format(await self.next_value(db, key), period)
+
+    async def reserve(self, db, series: str, count: int, on: Optional[Union[date, datetime]] = None) -> List[str]:
+        """Allocate ``count`` consecutive numbers with one counter update.
+
+        For bulk imports; the numbers bypass this worker's block, so they
+        still never collide with ones handed out by ``next``.
+        """
+        if count <= 0:
+            return []
+        rules = SERIES[series]
+        period = None
+        if rules.fiscal_year:
+            period = fiscal_year(on or datetime.now(timezone.utc))
+        key = f"{series}:{period}" if period else series
+        counter = await db.counters.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"value": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        first = counter["value"] - count + 1
+        return [rules.format(number, period) for number in range(first, first + count)]
+
+
+sequence_allocator = SequenceAllocator()
@@ -1,9 +1,10 @@
-from fastapi import FastAPI, APIRouter, HTTPException, status, Depends, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, status, Depends, UploadFile, File, Query, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from contextlib import asynccontextmanager
 import os
 import logging
 from pathlib import Path
@@ -11,26 +12,67 @@ from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
 import jwt
 from jose import JWTError
-import random
 import shutil
+# database loads backend/.env, so it must come before modules reading settings
+from database import client, db, close_client, pool_monitor
+from user_cache import user_cache
+from password_pool import password_hasher
+from product_search import build_product_filter, search_products
+from pagination import NEXT_CURSOR_HEADER, fetch_page, set_next_cursor
+from fast_json import list_response
+from metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, metrics
+from slow_queries import list_slow_queries, slow_query_log, summarize_slow_queries
+from indexes import check_unique_indexes, create_indexes, index_report
+from erp.account_cache import account_cache
+from erp.day_book import ensure_register
+from erp.postings import ensure_postings
+from erp.ledger import ensure_checkpoints
+from erp.trial_balance import trial_balance_cache
+from view_counter import view_counter
+from transactions import run_in_transaction
+from sequences import sequence_allocator
+from recommendations import recommendation_engine
+from analytics_rollups import load_dashboard, rebuild_rollups, record_customer, record_order, record_status_change
+from reservations import (
+    available_at_least, available_to_sell, claim_holds, hold_stock,
+    release_holds, reservation_sweeper, unclaim_holds
+)
 
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: indexes, caches and background workers
+    await create_indexes(db)
+    await check_unique_indexes(db)
+    await account_cache.load(db)
+    # Backfills for data written before these collections existed; a
+    # failure leaves reports incomplete but must not stop the app
+    for backfill in (ensure_register, ensure_postings, ensure_checkpoints):
+        try:
+            await backfill(db)
+        except PyMongoError:
+            logger.exception("Startup backfill %s failed", backfill.__name__)
+    view_counter.start(db.products)
+    reservation_sweeper.start(db)
+    recommendation_engine.start(db)
+    await slow_query_log.start(db)
+    yield
+    # Shutdown: drain buffers before the shared client goes away
+    await view_counter.stop()
+    await reservation_sweeper.stop()
+    await recommendation_engine.stop()
+    await slow_query_log.stop()
+    password_hasher.shutdown()
+    close_client()
 
 # Create the main app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 SECRET_KEY = os.environ.get('JWT_SECRET', 'fatima-collection-secret-key-change-in-production')
 ALGORITHM = "HS256"
@@ -86,6 +128,7 @@ class Product(BaseModel):
     is_featured: bool = False
     is_trending: bool = False
     views: int = 0
+    reserved: int = 0  # units held by active cart reservations
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -122,7 +165,7 @@ class Cart(BaseModel):
 class Order(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    order_number: str = Field(default_factory=lambda: f"FTC{random.randint(100000, 999999)}")
+    order_number: str
     user_id: str
     items: List[Dict[str, Any]]
     total_amount: float
@@ -199,14 +242,17 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
     
-    if isinstance(user.get('created_at'), str):
-        user['created_at'] = datetime.fromisoformat(user['created_at'])
-    
-    return User(**user)
+    principal = User(**user)
+    user_cache.set(user_id, principal)
+    return principal
 
 async def get_current_admin(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
@@ -217,8 +263,9 @@ async def get_current_admin(current_user: User = Depends(get_current_user)):
 
 @api_router.post("/auth/register", response_model=Token)
 async def register(user_data: UserCreate):
-    # Check if user exists
-    existing = await db.users.find_one({"email": user_data.email}, {"_id": 0})
+    # Cheap pre-check so taken emails skip the bcrypt cost; the unique
+    # email index settles concurrent registrations
+    existing = await db.users.find_one({"email": user_data.email}, {"_id": 1})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -232,10 +279,13 @@ async def register(user_data: UserCreate):
     
     # Store user with hashed password
     user_doc = user.model_dump()
-    user_doc['created_at'] = user_doc['created_at'].isoformat()
-    user_doc['password'] = pwd_context.hash(user_data.password)
+    user_doc['password'] = await password_hasher.hash(user_data.password)
     
-    await db.users.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    await record_customer(db, user.created_at)
     
     # Create token
     token = create_access_token({"sub": user.id})
@@ -250,13 +300,9 @@ async def login(user_data: UserLogin):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Verify password
-    if not pwd_context.verify(user_data.password, user_doc['password']):
+    if not await password_hasher.verify(user_data.password, user_doc['password']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    # Convert datetime
-    if isinstance(user_doc.get('created_at'), str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
-    
     user = User(**user_doc)
     
     # Create token
@@ -318,6 +364,7 @@ async def update_profile(
     
     if update_fields:
         await db.users.update_one({"id": current_user.id}, {"$set": update_fields})
+        user_cache.invalidate(current_user.id)
     
     return {"message": "Profile updated successfully"}
 
@@ -342,6 +389,8 @@ async def upload_logo(
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
+    user_cache.invalidate(current_user.id)
+    
     return {"filename": filename, "url": f"/api/uploads/logos/{filename}"}
 
 @api_router.post("/users/change-password")
@@ -355,17 +404,18 @@ async def change_password(
         raise HTTPException(status_code=404, detail="User not found")
     
     # Verify current password
-    if not pwd_context.verify(password_data.current_password, user_doc['password']):
+    if not await password_hasher.verify(password_data.current_password, user_doc['password']):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     
     # Hash new password
-    hashed_password = pwd_context.hash(password_data.new_password)
+    hashed_password = await password_hasher.hash(password_data.new_password)
     
     # Update password
     await db.users.update_one(
         {"id": current_user.id},
         {"$set": {"password": hashed_password}}
     )
+    user_cache.invalidate(current_user.id)
     
     return {"message": "Password changed successfully"}
 
@@ -373,33 +423,17 @@ async def change_password(
 
 @api_router.get("/products", response_model=List[Product])
 async def get_products(
+    response: Response,
     category: Optional[str] = None,
     search: Optional[str] = None,
     is_featured: Optional[bool] = None,
     is_trending: Optional[bool] = None,
-    limit: int = 50
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None
 ):
-    query = {}
-    if category:
-        query['category'] = category
-    if is_featured is not None:
-        query['is_featured'] = is_featured
-    if is_trending is not None:
-        query['is_trending'] = is_trending
-    if search:
-        query['$or'] = [
-            {'name': {'$regex': search, '$options': 'i'}},
-            {'description': {'$regex': search, '$options': 'i'}},
-            {'tags': {'$regex': search, '$options': 'i'}}
-        ]
-    
-    products = await db.products.find(query, {"_id": 0}).limit(limit).to_list(limit)
-    
-    for p in products:
-        if isinstance(p.get('created_at'), str):
-            p['created_at'] = datetime.fromisoformat(p['created_at'])
-        if isinstance(p.get('updated_at'), str):
-            p['updated_at'] = datetime.fromisoformat(p['updated_at'])
+    query = build_product_filter(category, search, is_featured, is_trending)
+    products, next_cursor = await search_products(db, query, limit, cursor)
+    set_next_cursor(response, next_cursor)
     
     return products
 
@@ -409,17 +443,27 @@ async def get_product(product_id: str):
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Increment views
-    await db.products.update_one({"id": product_id}, {"$inc": {"views": 1}})
-    product['views'] = product.get('views', 0) + 1
-    
-    if isinstance(product.get('created_at'), str):
-        product['created_at'] = datetime.fromisoformat(product['created_at'])
-    if isinstance(product.get('updated_at'), str):
-        product['updated_at'] = datetime.fromisoformat(product['updated_at'])
+    # Count the view; the buffer writes increments back in bulk
+    view_counter.record(product_id)
+    product['views'] = product.get('views', 0) + view_counter.pending(product_id)
     
     return Product(**product)
 
+@api_router.get("/products/{product_id}/availability")
+async def get_product_availability(product_id: str):
+    """Available-to-sell straight from the product's stock/reserved counters"""
+    product = await db.products.find_one(
+        {"id": product_id}, {"_id": 0, "id": 1, "stock": 1, "reserved": 1}
+    )
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {
+        "product_id": product_id,
+        "stock": product.get('stock', 0),
+        "reserved": product.get('reserved', 0),
+        "available": available_to_sell(product)
+    }
+
 @api_router.post("/products", response_model=Product)
 async def create_product(
     product_data: ProductCreate,
@@ -428,8 +472,6 @@ async def create_product(
     product = Product(**product_data.model_dump())
     
     product_doc = product.model_dump()
-    product_doc['created_at'] = product_doc['created_at'].isoformat()
-    product_doc['updated_at'] = product_doc['updated_at'].isoformat()
     
     await db.products.insert_one(product_doc)
     
@@ -446,15 +488,11 @@ async def update_product(
         raise HTTPException(status_code=404, detail="Product not found")
     
     update_data = product_data.model_dump()
-    update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_data['updated_at'] = datetime.now(timezone.utc)
     
     await db.products.update_one({"id": product_id}, {"$set": update_data})
     
     updated_product = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if isinstance(updated_product.get('created_at'), str):
-        updated_product['created_at'] = datetime.fromisoformat(updated_product['created_at'])
-    if isinstance(updated_product.get('updated_at'), str):
-        updated_product['updated_at'] = datetime.fromisoformat(updated_product['updated_at'])
     
     return Product(**updated_product)
 
@@ -474,16 +512,19 @@ async def delete_product(
 async def get_cart(current_user: User = Depends(get_current_user)):
     cart = await db.carts.find_one({"user_id": current_user.id}, {"_id": 0})
     if not cart:
-        cart = Cart(user_id=current_user.id)
-        cart_doc = cart.model_dump()
-        cart_doc['updated_at'] = cart_doc['updated_at'].isoformat()
-        await db.carts.insert_one(cart_doc)
-    else:
-        if isinstance(cart.get('updated_at'), str):
-            cart['updated_at'] = datetime.fromisoformat(cart['updated_at'])
-        cart = Cart(**cart)
-    
-    return cart
+        cart = await create_cart(current_user.id)
+    
+    return Cart(**cart)
+
+async def create_cart(user_id: str) -> Dict[str, Any]:
+    """Empty cart for ``user_id``, or the one a concurrent request just made"""
+    return await db.carts.find_one_and_update(
+        {"user_id": user_id},
+        {"$setOnInsert": Cart(user_id=user_id).model_dump(exclude={"user_id"})},
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
 
 @api_router.post("/cart/add")
 async def add_to_cart(
@@ -491,31 +532,27 @@ async def add_to_cart(
     current_user: User = Depends(get_current_user)
 ):
     cart = await db.carts.find_one({"user_id": current_user.id}, {"_id": 0})
-    
     if not cart:
-        cart = Cart(user_id=current_user.id, items=[item])
-        cart_doc = cart.model_dump()
-        cart_doc['updated_at'] = cart_doc['updated_at'].isoformat()
-        await db.carts.insert_one(cart_doc)
-    else:
-        # Check if item exists
-        items = cart.get('items', [])
-        found = False
-        for i, existing_item in enumerate(items):
-            if (existing_item['product_id'] == item.product_id and 
-                existing_item.get('size') == item.size and 
-                existing_item.get('color') == item.color):
-                items[i]['quantity'] += item.quantity
-                found = True
-                break
-        
-        if not found:
-            items.append(item.model_dump())
-        
-        await db.carts.update_one(
-            {"user_id": current_user.id},
-            {"$set": {"items": items, "updated_at": datetime.now(timezone.utc).isoformat()}}
-        )
+        cart = await create_cart(current_user.id)
+    
+    # Check if item exists
+    items = cart.get('items', [])
+    found = False
+    for i, existing_item in enumerate(items):
+        if (existing_item['product_id'] == item.product_id and 
+            existing_item.get('size') == item.size and 
+            existing_item.get('color') == item.color):
+            items[i]['quantity'] += item.quantity
+            found = True
+            break
+    
+    if not found:
+        items.append(item.model_dump())
+    
+    await db.carts.update_one(
+        {"user_id": current_user.id},
+        {"$set": {"items": items, "updated_at": datetime.now(timezone.utc)}}
+    )
     
     return {"message": "Item added to cart"}
 
@@ -532,27 +569,51 @@ async def remove_from_cart(
     
     await db.carts.update_one(
         {"user_id": current_user.id},
-        {"$set": {"items": items, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"items": items, "updated_at": datetime.now(timezone.utc)}}
     )
+    await release_holds(db, current_user.id, [product_id])
     
     return {"message": "Item removed from cart"}
 
+@api_router.post("/cart/reserve")
+async def reserve_cart(current_user: User = Depends(get_current_user)):
+    """Hold stock for every cart line until checkout or expiry"""
+    cart = await db.carts.find_one({"user_id": current_user.id}, {"_id": 0})
+    if not cart or not cart.get('items'):
+        raise HTTPException(status_code=404, detail="Cart is empty")
+    
+    quantities: Dict[str, int] = {}
+    for item in cart['items']:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+    
+    held, failed, expires_at = await hold_stock(client, db, current_user.id, quantities)
+    return {
+        "held": held,
+        "unavailable": failed,
+        "expires_at": expires_at.isoformat()
+    }
+
+@api_router.delete("/cart/reserve")
+async def release_cart_reservation(current_user: User = Depends(get_current_user)):
+    await release_holds(db, current_user.id)
+    return {"message": "Reservation released"}
+
 # ============ WISHLIST ROUTES ============
 
 @api_router.get("/wishlist", response_model=Wishlist)
 async def get_wishlist(current_user: User = Depends(get_current_user)):
     wishlist = await db.wishlists.find_one({"user_id": current_user.id}, {"_id": 0})
     if not wishlist:
-        wishlist = Wishlist(user_id=current_user.id)
-        wishlist_doc = wishlist.model_dump()
-        wishlist_doc['updated_at'] = wishlist_doc['updated_at'].isoformat()
-        await db.wishlists.insert_one(wishlist_doc)
-    else:
-        if isinstance(wishlist.get('updated_at'), str):
-            wishlist['updated_at'] = datetime.fromisoformat(wishlist['updated_at'])
-        wishlist = Wishlist(**wishlist)
+        # Upsert so concurrent first visits share one wishlist
+        wishlist = await db.wishlists.find_one_and_update(
+            {"user_id": current_user.id},
+            {"$setOnInsert": Wishlist(user_id=current_user.id).model_dump(exclude={"user_id"})},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
     
-    return wishlist
+    return Wishlist(**wishlist)
 
 @api_router.post("/wishlist/add/{product_id}")
 async def add_to_wishlist(
@@ -563,7 +624,7 @@ async def add_to_wishlist(
         {"user_id": current_user.id},
         {
             "$addToSet": {"product_ids": product_id},
-            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+            "$set": {"updated_at": datetime.now(timezone.utc)}
         },
         upsert=True
     )
@@ -578,28 +639,92 @@ async def remove_from_wishlist(
         {"user_id": current_user.id},
         {
             "$pull": {"product_ids": product_id},
-            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+            "$set": {"updated_at": datetime.now(timezone.utc)}
         }
     )
     return {"message": "Removed from wishlist"}
 
 # ============ ORDER ROUTES ============
 
+async def take_stock(quantities: Dict[str, int], held: Dict[str, int], session=None) -> bool:
+    """Decrement stock for every product or for none of them.
+    
+    Units the buyer already holds are converted from ``reserved``; only the
+    remainder has to come out of other shoppers' available stock.
+    """
+    def guarded(pid, qty):
+        hold = held.get(pid, 0)
+        query = {"id": pid, "stock": {"$gte": qty}, **available_at_least(qty - hold)}
+        if hold:
+            query["reserved"] = {"$gte": hold}
+        return (
+            query,
+            {"$inc": {"stock": -qty, "reserved": -hold}}
+        )
+    
+    if session is not None:
+        result = await db.products.bulk_write(
+            [UpdateOne(*guarded(pid, qty)) for pid, qty in quantities.items()],
+            ordered=False,
+            session=session
+        )
+        # A short count aborts the surrounding transaction
+        return result.modified_count == len(quantities)
+    
+    # No transactions: apply guarded decrements one by one and undo on shortfall
+    taken = []
+    for pid, qty in quantities.items():
+        result = await db.products.update_one(*guarded(pid, qty))
+        if result.modified_count == 0:
+            if taken:
+                await db.products.bulk_write(
+                    [UpdateOne({"id": p}, {"$inc": {"stock": q, "reserved": held.get(p, 0)}}) for p, q in taken],
+                    ordered=False
+                )
+            return False
+        taken.append((pid, qty))
+    return True
+
 @api_router.post("/orders", response_model=Order)
 async def create_order(
     order_data: OrderCreate,
     current_user: User = Depends(get_current_user)
 ):
-    # Get product details and calculate total
+    # Total quantity per product across cart lines (sizes/colours share stock)
+    quantities: Dict[str, int] = {}
+    for cart_item in order_data.items:
+        quantities[cart_item.product_id] = quantities.get(cart_item.product_id, 0) + cart_item.quantity
+    
+    # One round trip for every product in the cart
+    products = await db.products.find(
+        {"id": {"$in": list(quantities)}}, {"_id": 0}
+    ).to_list(len(quantities))
+    products_by_id = {p['id']: p for p in products}
+    
+    # Convert this buyer's live cart holds; claiming keeps the sweeper off them
+    hold_token = str(uuid.uuid4())
+    held = await claim_holds(db, {
+        "user_id": current_user.id,
+        "product_id": {"$in": list(quantities)},
+        "expires_at": {"$gt": datetime.now(timezone.utc)}
+    }, hold_token)
+    try:
+        order = await _place_order(order_data, current_user, quantities, products_by_id, held, hold_token)
+    except Exception:
+        await unclaim_holds(db, hold_token)
+        raise
+    return order
+
+async def _place_order(order_data, current_user, quantities, products_by_id, held, hold_token):
     total = 0
     items = []
     
     for cart_item in order_data.items:
-        product = await db.products.find_one({"id": cart_item.product_id}, {"_id": 0})
+        product = products_by_id.get(cart_item.product_id)
         if not product:
             raise HTTPException(status_code=404, detail=f"Product {cart_item.product_id} not found")
         
-        if product['stock'] < cart_item.quantity:
+        if available_to_sell(product) + held.get(cart_item.product_id, 0) < quantities[cart_item.product_id]:
             raise HTTPException(status_code=400, detail=f"Insufficient stock for {product['name']}")
         
         price = product.get('sale_price') or product['price']
@@ -613,16 +738,12 @@ async def create_order(
             "quantity": cart_item.quantity,
             "size": cart_item.size,
             "color": cart_item.color,
-            "image": product['images'][0] if product['images'] else None
+            "image": product['images'][0] if product['images'] else None,
+            "category": product.get('category')
         })
-        
-        # Update stock
-        await db.products.update_one(
-            {"id": cart_item.product_id},
-            {"$inc": {"stock": -cart_item.quantity}}
-        )
     
     order = Order(
+        order_number=await sequence_allocator.next(db, "order"),
         user_id=current_user.id,
         items=items,
         total_amount=total,
@@ -631,34 +752,48 @@ async def create_order(
     )
     
     order_doc = order.model_dump()
-    order_doc['created_at'] = order_doc['created_at'].isoformat()
-    order_doc['updated_at'] = order_doc['updated_at'].isoformat()
     
-    await db.orders.insert_one(order_doc)
+    async def place_order(session):
+        # Guarded decrements make oversell impossible even under concurrent checkouts
+        if not await take_stock(quantities, held, session):
+            raise HTTPException(status_code=409, detail="Insufficient stock for one or more items")
+        
+        await db.stock_reservations.delete_many({"claimed_by": hold_token}, session=session)
+        await db.orders.insert_one(order_doc, session=session)
+        
+        # Clear cart
+        await db.carts.update_one(
+            {"user_id": current_user.id},
+            {"$set": {"items": [], "updated_at": datetime.now(timezone.utc)}},
+            session=session
+        )
     
-    # Clear cart
-    await db.carts.update_one(
-        {"user_id": current_user.id},
-        {"$set": {"items": [], "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+    await run_in_transaction(client, place_order)
+    # Outside the transaction so checkouts don't conflict on the rollup documents
+    try:
+        await record_order(db, order_doc)
+    except PyMongoError:
+        logger.exception("Rollup update for order %s failed; rebuild rollups to repair", order.order_number)
     
     return order
 
 @api_router.get("/orders", response_model=List[Order])
-async def get_orders(current_user: User = Depends(get_current_user)):
+async def get_orders(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     query = {"user_id": current_user.id}
     if current_user.role == "admin":
         query = {}  # Admin can see all orders
     
-    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
-    
-    for order in orders:
-        if isinstance(order.get('created_at'), str):
-            order['created_at'] = datetime.fromisoformat(order['created_at'])
-        if isinstance(order.get('updated_at'), str):
-            order['updated_at'] = datetime.fromisoformat(order['updated_at'])
+    orders, next_cursor = await fetch_page(
+        db.orders, query, [("created_at", -1), ("id", -1)], limit, cursor
+    )
+    set_next_cursor(response, next_cursor)
     
-    return orders
+    return list_response(response, Order, orders)
 
 @api_router.get("/orders/{order_id}", response_model=Order)
 async def get_order(order_id: str, current_user: User = Depends(get_current_user)):
@@ -669,11 +804,6 @@ async def get_order(order_id: str, current_user: User = Depends(get_current_user
     if order['user_id'] != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Access denied")
     
-    if isinstance(order.get('created_at'), str):
-        order['created_at'] = datetime.fromisoformat(order['created_at'])
-    if isinstance(order.get('updated_at'), str):
-        order['updated_at'] = datetime.fromisoformat(order['updated_at'])
-    
     return Order(**order)
 
 @api_router.patch("/orders/{order_id}/status")
@@ -682,37 +812,44 @@ async def update_order_status(
     order_status: str,
     current_user: User = Depends(get_current_admin)
 ):
-    result = await db.orders.update_one(
+    previous = await db.orders.find_one_and_update(
         {"id": order_id},
-        {"$set": {"order_status": order_status, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"order_status": order_status, "updated_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0}
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Order not found")
     
+    await record_status_change(db, previous, previous.get('order_status'), order_status)
+    
     return {"message": "Order status updated"}
 
 # ============ AI ROUTES (MOCKED) ============
 
 @api_router.get("/ai/recommendations", response_model=AIRecommendation)
 async def get_ai_recommendations(current_user: User = Depends(get_current_user)):
-    # Mock AI: Get random trending products
-    products = await db.products.find({"is_trending": True}, {"_id": 0}).limit(4).to_list(4)
+    # Co-purchase model lookup; falls back to trending for users with no history
+    product_ids = recommendation_engine.recommend(current_user.id, k=4)
+    reason = "Customers who bought or saved the same pieces as you also loved these."
+    products = []
+    if product_ids:
+        found = await db.products.find({"id": {"$in": product_ids}}, {"_id": 0}).to_list(len(product_ids))
+        rank = {pid: i for i, pid in enumerate(product_ids)}
+        products = sorted(found, key=lambda p: rank[p['id']])
     
     if not products:
-        products = await db.products.find({}, {"_id": 0}).limit(4).to_list(4)
+        reason = "Based on your browsing history and trending styles, we recommend these elegant pieces for you."
+        products = await db.products.find({"is_trending": True}, {"_id": 0}).limit(4).to_list(4)
     
-    for p in products:
-        if isinstance(p.get('created_at'), str):
-            p['created_at'] = datetime.fromisoformat(p['created_at'])
-        if isinstance(p.get('updated_at'), str):
-            p['updated_at'] = datetime.fromisoformat(p['updated_at'])
+    if not products:
+        products = await db.products.find({}, {"_id": 0}).limit(4).to_list(4)
     
     products = [Product(**p) for p in products]
     
     return AIRecommendation(
         products=products,
-        reason="Based on your browsing history and trending styles, we recommend these elegant pieces for you."
+        reason=reason
     )
 
 @api_router.post("/ai/chat", response_model=ChatResponse)
@@ -739,12 +876,6 @@ async def ai_chat(chat_msg: ChatMessage):
         products = await db.products.find({"is_featured": True}, {"_id": 0}).limit(3).to_list(3)
         response = "Welcome to Fatima Collection! I'm here to help you find the perfect outfit. What are you looking for today?"
     
-    for p in products:
-        if isinstance(p.get('created_at'), str):
-            p['created_at'] = datetime.fromisoformat(p['created_at'])
-        if isinstance(p.get('updated_at'), str):
-            p['updated_at'] = datetime.fromisoformat(p['updated_at'])
-    
     products = [Product(**p) for p in products]
     
     return ChatResponse(response=response, products=products)
@@ -753,23 +884,90 @@ async def ai_chat(chat_msg: ChatMessage):
 
 @api_router.get("/analytics/dashboard")
 async def get_analytics(current_user: User = Depends(get_current_admin)):
-    total_orders = await db.orders.count_documents({})
-    total_products = await db.products.count_documents({})
-    total_customers = await db.users.count_documents({"role": "customer"})
-    
-    # Mock revenue calculation
-    orders = await db.orders.find({"payment_status": "completed"}, {"_id": 0}).to_list(1000)
-    total_revenue = sum(order.get('total_amount', 0) for order in orders)
+    # Figures come from rollups maintained at order time, not from scanning orders
+    rollups = await load_dashboard(db)
+    total = rollups['total']
+    top_categories = rollups['top_categories']
+    total_products = await db.products.estimated_document_count()
+    
+    insight = "Not enough sales history yet."
+    monthly = rollups['monthly']
+    if len(monthly) >= 2 and monthly[-2]['revenue'] > 0:
+        change = (monthly[-1]['revenue'] - monthly[-2]['revenue']) / monthly[-2]['revenue'] * 100
+        insight = f"Sales {'increased' if change >= 0 else 'decreased'} by {abs(change):.0f}% this month."
+        if top_categories:
+            insight += f" {top_categories[0]['category']} is the top category."
     
     return {
-        "total_orders": total_orders,
+        "total_orders": total.get('orders', 0),
         "total_products": total_products,
-        "total_customers": total_customers,
-        "total_revenue": total_revenue,
-        "top_selling_category": "kurti",  # Mock
-        "ai_insights": "Sales increased by 25% this month. Kurtis are trending!"
+        "total_customers": total.get('customers', 0),
+        "total_revenue": total.get('revenue', 0),
+        "top_selling_category": top_categories[0]['category'] if top_categories else None,
+        "top_categories": top_categories,
+        "daily": rollups['daily'],
+        "monthly": rollups['monthly'],
+        "ai_insights": insight
     }
 
+@api_router.post("/analytics/rollups/rebuild")
+async def rebuild_analytics(current_user: User = Depends(get_current_admin)):
+    """Recompute rollups from orders/users (initial backfill or repair)"""
+    buckets = await rebuild_rollups(db)
+    return {"message": "Rollups rebuilt", "buckets": buckets}
+
+# ============ ADMIN STATS ============
+
+@api_router.get("/admin/stats")
+async def get_runtime_stats(current_user: User = Depends(get_current_admin)):
+    """Per-worker cache and pool counters"""
+    return {
+        "user_cache": user_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "view_counter": view_counter.stats(),
+        "reservations": reservation_sweeper.stats(),
+        "recommendations": recommendation_engine.stats(),
+        "mongo_pool": pool_monitor.stats(),
+        "slow_queries": slow_query_log.stats(),
+        "account_cache": account_cache.stats(),
+        "trial_balance": trial_balance_cache.stats()
+    }
+
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(
+    collection: Optional[str] = None,
+    plan: Optional[str] = Query(None, description="e.g. COLLSCAN or IXSCAN"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_admin)
+):
+    """Most recent slow Mongo operations with their explain summaries"""
+    return await list_slow_queries(db, collection, plan, limit)
+
+@api_router.get("/admin/slow-queries/summary")
+async def get_slow_query_summary(
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_admin)
+):
+    """Slow operations grouped by collection and filter shape"""
+    return await summarize_slow_queries(db, limit)
+
+@api_router.get("/admin/indexes")
+async def get_index_report(current_user: User = Depends(get_current_admin)):
+    """Registered vs existing indexes, $indexStats usage and COLLSCAN shapes"""
+    return await index_report(db)
+
+@api_router.post("/admin/indexes/apply")
+async def apply_indexes(current_user: User = Depends(get_current_admin)):
+    """Create any registered index that is missing"""
+    return await create_indexes(db)
+
+# ============ METRICS ============
+
+@api_router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint (per worker)"""
+    return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 # ============ MARKETING DESIGNER ============
 
 @api_router.post("/marketing/upload-background")
@@ -823,7 +1021,6 @@ async def save_design(
     )
     
     design_doc = design.model_dump()
-    design_doc['created_at'] = design_doc['created_at'].isoformat()
     
     await db.marketing_designs.insert_one(design_doc)
     
@@ -836,10 +1033,6 @@ async def get_designs(current_user: User = Depends(get_current_admin)):
         {"_id": 0}
     ).sort("created_at", -1).to_list(100)
     
-    for design in designs:
-        if isinstance(design.get('created_at'), str):
-            design['created_at'] = datetime.fromisoformat(design['created_at'])
-    
     return designs
 
 @api_router.get("/marketing/designs/{design_id}", response_model=MarketingDesign)
@@ -851,9 +1044,6 @@ async def get_design(
     if not design:
         raise HTTPException(status_code=404, detail="Design not found")
     
-    if isinstance(design.get('created_at'), str):
-        design['created_at'] = datetime.fromisoformat(design['created_at'])
-    
     return MarketingDesign(**design)
 
 @api_router.delete("/marketing/designs/{design_id}")
@@ -894,14 +1084,12 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
+app.add_middleware(MetricsMiddleware)
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
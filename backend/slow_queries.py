@@ -0,0 +1,281 @@
+"""
+Slow Mongo operation log with asynchronously captured explain plans
+"""
+from pymongo import monitoring
+from pymongo.errors import CollectionInvalid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+from metrics import current_usage
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '100'))
+SLOW_QUERY_LOG_BYTES = int(os.environ.get('SLOW_QUERY_LOG_BYTES', str(16 * 1024 * 1024)))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+# The same filter shape is explained at most once per interval (per worker)
+SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS = float(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS', '300'))
+
+SLOW_QUERY_COLLECTION = "slow_queries"
+
+# command name -> where its filter lives
+WATCHED_COMMANDS = {
+    "find": "filter",
+    "aggregate": "pipeline",
+    "update": "updates",
+    "delete": "deletes",
+    "findAndModify": "query",
+    "count": "query",
+    "distinct": "query",
+}
+
+# Session/transport fields that explain rejects or that mean nothing to it
+_NOT_EXPLAINABLE = {
+    "lsid", "$db", "$clusterTime", "txnNumber", "autocommit", "startTransaction",
+    "$readPreference", "readConcern", "writeConcern", "ordered", "bypassDocumentValidation",
+}
+
+
+def redact(value: Any) -> Any:
+    """Keep field names and operators, replace every value with '?'"""
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) and value and all(isinstance(item, dict) for item in value):
+        return [redact(item) for item in value]
+    return "?"
+
+
+def filter_of(command_name: str, command: Dict[str, Any]) -> Any:
+    field = WATCHED_COMMANDS[command_name]
+    value = command.get(field)
+    if command_name in ("update", "delete"):
+        # Bulk statements usually share a shape; the first one stands for all
+        return (value or [{}])[0].get("q", {})
+    return value or {}
+
+
+def _find_all(doc: Any, key: str) -> Iterator[Any]:
+    if isinstance(doc, dict):
+        for k, v in doc.items():
+            if k == key:
+                yield v
+            yield from _find_all(v, key)
+    elif isinstance(doc, list):
+        for item in doc:
+            yield from _find_all(item, key)
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """COLLSCAN/IXSCAN verdict plus examined-vs-returned counts"""
+    stages = set()
+    indexes = set()
+    for plan in _find_all(explain, "winningPlan"):
+        stages.update(s for s in _find_all(plan, "stage") if isinstance(s, str))
+        indexes.update(i for i in _find_all(plan, "indexName") if isinstance(i, str))
+    stats = next(_find_all(explain, "executionStats"), {}) or {}
+    if "COLLSCAN" in stages:
+        plan = "COLLSCAN"
+    elif "IXSCAN" in stages or "EXPRESS_IXSCAN" in stages or "IDHACK" in stages:
+        plan = "IXSCAN"
+    else:
+        plan = sorted(stages)[0] if stages else "UNKNOWN"
+    return {
+        "plan": plan,
+        "stages": sorted(stages),
+        "indexes": sorted(indexes),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "returned": stats.get("nReturned"),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
+
+
+def explainable(command_name: str, command: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The command as an explain can run it, or None if it should not be"""
+    cmd = {k: v for k, v in command.items() if k not in _NOT_EXPLAINABLE}
+    if command_name == "aggregate":
+        # executionStats would actually run $out/$merge
+        if any("$out" in stage or "$merge" in stage for stage in cmd.get("pipeline", [])):
+            return None
+    if command_name in ("update", "delete"):
+        cmd[WATCHED_COMMANDS[command_name]] = cmd[WATCHED_COMMANDS[command_name]][:1]
+    return cmd
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Records watched commands slower than ``threshold_ms``.
+
+    Listener callbacks run on Motor's executor threads, so they only hand a
+    record to the event loop; explaining and writing happen in a worker task
+    and the command itself is never slowed down.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS, explain: bool = SLOW_QUERY_EXPLAIN):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self._started: Dict[Tuple[Any, int], Tuple[str, Dict[str, Any]]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._db = None
+        self._explained_at: Dict[str, float] = {}
+        self.captured = 0
+        self.dropped = 0
+        self.explains = 0
+        self.explain_failures = 0
+
+    # ---- listener (executor threads) ----
+
+    def started(self, event):
+        if event.command_name in WATCHED_COMMANDS and self._loop is not None:
+            collection = event.command.get(event.command_name)
+            if collection != SLOW_QUERY_COLLECTION:
+                self._started[(event.connection_id, event.request_id)] = (event.database_name, event.command)
+
+    def succeeded(self, event):
+        self._finish(event, None)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure.get("errmsg", "failed")))
+
+    def _finish(self, event, error: Optional[str]) -> None:
+        started = self._started.pop((event.connection_id, event.request_id), None)
+        loop = self._loop
+        if started is None or loop is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+        database, command = started
+        usage = current_usage.get()
+        record = {
+            "id": str(uuid.uuid4()),
+            "at": datetime.now(timezone.utc),
+            "command": event.command_name,
+            "database": database,
+            "collection": command.get(event.command_name),
+            "filter_shape": json.dumps(redact(filter_of(event.command_name, command)), sort_keys=True),
+            "sort_shape": json.dumps(command.get("sort")) if command.get("sort") else None,
+            "duration_ms": round(duration_ms, 2),
+            "path": usage.path if usage else None,
+            "error": error,
+            "explain": None,
+        }
+        try:
+            loop.call_soon_threadsafe(self._enqueue, record, command)
+        except RuntimeError:
+            # Loop already closed (shutdown)
+            pass
+
+    def _enqueue(self, record: Dict[str, Any], command: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait((record, command))
+            self.captured += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    # ---- worker (event loop) ----
+
+    async def start(self, db) -> None:
+        self._db = db
+        try:
+            await db.create_collection(SLOW_QUERY_COLLECTION, capped=True, size=SLOW_QUERY_LOG_BYTES)
+        except CollectionInvalid:
+            pass
+        except Exception:
+            logger.exception("Could not create the slow query log")
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=1000)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._loop = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _explain(self, record: Dict[str, Any], command: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        key = f"{record['collection']}:{record['command']}:{record['filter_shape']}"
+        now = time.monotonic()
+        if now - self._explained_at.get(key, float("-inf")) < SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS:
+            return None
+        self._explained_at[key] = now
+        cmd = explainable(record["command"], command)
+        if cmd is None:
+            return None
+        try:
+            result = await self._db.client[record["database"]].command(
+                {"explain": cmd, "verbosity": "executionStats"}
+            )
+        except Exception as e:
+            self.explain_failures += 1
+            logger.warning("Explain failed for slow %s on %s: %s", record["command"], record["collection"], e)
+            return None
+        self.explains += 1
+        return summarize_explain(result)
+
+    async def _run(self) -> None:
+        while True:
+            record, command = await self._queue.get()
+            try:
+                if self.explain and record["error"] is None:
+                    record["explain"] = await self._explain(record, command)
+                await self._db[SLOW_QUERY_COLLECTION].insert_one(record)
+            except Exception:
+                logger.exception("Could not record slow query")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "explains": self.explains,
+            "explain_failures": self.explain_failures,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+
+slow_query_log = SlowQueryLog()
+
+
+async def list_slow_queries(db, collection: Optional[str] = None, plan: Optional[str] = None,
+                            limit: int = 100) -> List[Dict[str, Any]]:
+    """Newest records first (capped collections keep insertion order)"""
+    query: Dict[str, Any] = {}
+    if collection:
+        query["collection"] = collection
+    if plan:
+        query["explain.plan"] = plan
+    return await db[SLOW_QUERY_COLLECTION].find(query, {"_id": 0}).sort("$natural", -1).to_list(limit)
+
+
+async def summarize_slow_queries(db, limit: int = 50) -> List[Dict[str, Any]]:
+    """Group records by collection and filter shape, worst total time first"""
+    pipeline = [
+        {"$group": {
+            "_id": {"collection": "$collection", "command": "$command", "filter_shape": "$filter_shape"},
+            "count": {"$sum": 1},
+            "total_ms": {"$sum": "$duration_ms"},
+            "max_ms": {"$max": "$duration_ms"},
+            "last_seen": {"$max": "$at"},
+            "explain": {"$last": "$explain"},
+        }},
+        {"$sort": {"total_ms": -1}},
+        {"$limit": limit},
+    ]
+    rows = await db[SLOW_QUERY_COLLECTION].aggregate(pipeline).to_list(limit)
+    for row in rows:
+        row.update(row.pop("_id"))
+        row["avg_ms"] = round(row["total_ms"] / row["count"], 2)
+    return rows
@@ -0,0 +1,33 @@
+"""
+Multi-document transaction helper with a standalone-server fallback
+"""
+from typing import Any, Awaitable, Callable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+_supported: Optional[bool] = None
+
+
+async def transactions_supported(client) -> bool:
+    """True when connected to a replica set or sharded cluster (cached)"""
+    global _supported
+    if _supported is None:
+        hello = await client.admin.command("hello")
+        _supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        if not _supported:
+            logger.warning("MongoDB is standalone; multi-document transactions are unavailable")
+    return _supported
+
+
+async def run_in_transaction(client, callback: Callable[[Any], Awaitable[Any]]) -> Any:
+    """Await ``callback(session)`` inside a transaction.
+
+    Transient transaction errors are retried by ``with_transaction``. On a
+    standalone server the callback gets ``session=None`` and must make its
+    own writes safe without rollback.
+    """
+    if not await transactions_supported(client):
+        return await callback(None)
+    async with await client.start_session() as session:
+        return await session.with_transaction(callback)
@@ -0,0 +1,120 @@
+"""
+Write-behind buffer for product view counters
+"""
+from pymongo import UpdateOne
+from typing import Any, Dict, Optional
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+VIEW_FLUSH_INTERVAL_SECONDS = float(os.environ.get('VIEW_FLUSH_INTERVAL_SECONDS', '5'))
+VIEW_FLUSH_THRESHOLD = int(os.environ.get('VIEW_FLUSH_THRESHOLD', '500'))
+
+
+class ViewCounterBuffer:
+    """Aggregates product views in memory and flushes them with one bulk_write.
+
+    Increments are flushed every ``interval`` seconds, as soon as
+    ``threshold`` distinct products are pending, and once more on shutdown.
+    """
+
+    def __init__(self, interval: float = VIEW_FLUSH_INTERVAL_SECONDS, threshold: int = VIEW_FLUSH_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._pending: Dict[str, int] = {}
+        self._collection = None
+        self._task: Optional[asyncio.Task] = None
+        self._early_flush: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.failures = 0
+        self.flushed_views = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self, collection) -> None:
+        self._collection = collection
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._early_flush is not None:
+            await asyncio.gather(self._early_flush, return_exceptions=True)
+        await self.flush()
+
+    def record(self, product_id: str) -> None:
+        """Count one view; triggers an early flush past the size threshold"""
+        self._pending[product_id] = self._pending.get(product_id, 0) + 1
+        if len(self._pending) >= self.threshold and not self._flush_lock.locked():
+            if self._early_flush is None or self._early_flush.done():
+                # Keep a reference so the task is not garbage-collected mid-flush
+                self._early_flush = asyncio.create_task(self.flush())
+                self._early_flush.add_done_callback(self._early_flush_done)
+
+    def _early_flush_done(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Early view counter flush failed", exc_info=task.exception())
+
+    def pending(self, product_id: str) -> int:
+        """Views recorded for a product but not yet written"""
+        return self._pending.get(product_id, 0)
+
+    async def flush(self) -> None:
+        if self._collection is None:
+            return
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            started = time.perf_counter()
+            try:
+                await self._collection.bulk_write(
+                    [UpdateOne({"id": pid}, {"$inc": {"views": n}}) for pid, n in batch.items()],
+                    ordered=False
+                )
+            except Exception:
+                # Put the counts back so the next flush retries them
+                self.failures += 1
+                for pid, n in batch.items():
+                    self._pending[pid] = self._pending.get(pid, 0) + n
+                logger.exception("Failed to flush product view counters")
+                return
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.flushed_views += sum(batch.values())
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_products": len(self._pending),
+            "pending_views": sum(self._pending.values()),
+            "interval_seconds": self.interval,
+            "threshold": self.threshold,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "flushed_views": self.flushed_views,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+        }
+
+
+view_counter = ViewCounterBuffer()
@@ -0,0 +1,158 @@
+"""
+Concurrent voucher posting against a real MongoDB.
+
+Needs MONGO_URL; skipped when it is unset or the server cannot be reached.
+Uses and then drops the database "<DB_NAME>_posting_test". On a replica
+set the vouchers commit in transactions; on a standalone server they take
+the sequential fallback.
+
+Run from the repository root:  MONGO_URL=mongodb://localhost:27017 python -m pytest tests
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+import asyncio
+import os
+import random
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+from pymongo.errors import PyMongoError  # noqa: E402
+
+from erp.ledger import CHECKPOINT_COLLECTION, month_start  # noqa: E402
+from erp.posting import VoucherPosting, balance_delta, commit_postings  # noqa: E402
+from erp.postings import POSTINGS_COLLECTION  # noqa: E402
+
+VOUCHERS = 1000
+
+ACCOUNTS = [
+    {"code": "1001", "name": "Cash", "account_type": "asset"},
+    {"code": "1002", "name": "Bank", "account_type": "asset"},
+    {"code": "2005", "name": "GST Payable", "account_type": "liability"},
+    {"code": "4001", "name": "Sales", "account_type": "income"},
+    {"code": "5001", "name": "Purchases", "account_type": "expense"},
+]
+
+# A few customers, so party ledgers and checkpoints see contention too
+PARTIES = [str(uuid.uuid4()) for _ in range(5)]
+
+MONTHS = [datetime(2024, month, 1, tzinfo=timezone.utc) for month in (4, 5, 6)]
+
+
+def line(account_id: str, name: str, debit: float = 0.0, credit: float = 0.0) -> SimpleNamespace:
+    return SimpleNamespace(account_id=account_id, account_name=name, debit=debit, credit=credit)
+
+
+def make_posting(number: int, rng: random.Random, ids: dict) -> VoucherPosting:
+    # Quarter-rupee amounts are exact in binary, so totals do not depend on
+    # the order the increments land in
+    amount = rng.randint(4, 40000) / 4
+    tax = rng.randint(0, 800) / 4
+    entry_date = rng.choice(MONTHS).replace(day=rng.randint(1, 28))
+    if rng.random() < 0.5:
+        party = rng.choice(PARTIES)
+        lines = [line(party, "Customer", debit=amount + tax),
+                 line(ids["4001"], "Sales", credit=amount), line(ids["2005"], "GST Payable", credit=tax)]
+    else:
+        party = None
+        lines = [line(ids["5001"], "Purchases", debit=amount), line(ids["1002"], "Bank", credit=amount)]
+
+    voucher_id = str(uuid.uuid4())
+    posting = VoucherPosting("journal_vouchers", {
+        "id": voucher_id,
+        "voucher_number": f"JV{number:05d}",
+        "voucher_date": entry_date,
+        "total_debit": sum(entry.debit for entry in lines),
+        "narration": "posting test",
+    })
+    if party:
+        posting.add_ledger_entry({
+            "date": entry_date,
+            "party_id": party,
+            "voucher_type": "journal",
+            "voucher_number": f"JV{number:05d}",
+            "debit": amount + tax,
+            "credit": 0.0,
+        })
+    posting.set_journal({
+        "id": str(uuid.uuid4()),
+        "voucher_id": voucher_id,
+        "voucher_type": "journal",
+        "entry_date": entry_date,
+        "lines": [vars(entry) for entry in lines],
+    }, lines)
+    return posting
+
+
+async def connect():
+    url = os.environ.get("MONGO_URL")
+    if not url:
+        pytest.skip("MONGO_URL is not set")
+    client = AsyncIOMotorClient(url, tz_aware=True, serverSelectionTimeoutMS=2000)
+    try:
+        await client.admin.command("ping")
+    except PyMongoError as e:
+        client.close()
+        pytest.skip(f"MongoDB unreachable: {e}")
+    return client
+
+
+async def post_concurrently() -> None:
+    client = await connect()
+    db = client[f"{os.environ.get('DB_NAME', 'test_database')}_posting_test"]
+    try:
+        await client.drop_database(db.name)
+        accounts = [{**a, "id": str(uuid.uuid4()), "current_balance": 0.0} for a in ACCOUNTS]
+        await db.accounts.insert_many([dict(a) for a in accounts])
+        ids = {a["code"]: a["id"] for a in accounts}
+        types = {a["id"]: a["account_type"] for a in accounts}
+
+        rng = random.Random(17)
+        postings = [make_posting(number, rng, ids) for number in range(VOUCHERS)]
+        await asyncio.gather(*(commit_postings(client, db, [posting]) for posting in postings))
+
+        balances = {account_id: 0.0 for account_id in types}
+        # (field, entity id, month) -> increase - decrease
+        movements = {}
+        for posting in postings:
+            month = month_start(posting.journal["entry_date"])
+            for entry in posting.lines:
+                field = "account_id" if entry.account_id in types else None
+                if field:
+                    balances[entry.account_id] += balance_delta(types[entry.account_id], entry.debit, entry.credit)
+                    key = (field, entry.account_id, month)
+                    movements[key] = movements.get(key, 0.0) + entry.debit - entry.credit
+            for entry in posting.ledger_entries:
+                key = ("party_id", entry["party_id"], month)
+                movements[key] = movements.get(key, 0.0) + entry["debit"] - entry["credit"]
+
+        actual = {a["id"]: a["current_balance"] async for a in db.accounts.find({}, {"_id": 0})}
+        assert actual == balances
+
+        assert await db.voucher_register.count_documents({}) == VOUCHERS
+        lines = sum(len(posting.lines) for posting in postings)
+        assert await db[POSTINGS_COLLECTION].count_documents({}) == lines
+        assert await db[POSTINGS_COLLECTION].count_documents({"account_id": {"$exists": True}}) == \
+            sum(1 for posting in postings for entry in posting.lines if entry.account_id in types)
+        posted = await db[POSTINGS_COLLECTION].aggregate([
+            {"$group": {"_id": None, "debit": {"$sum": "$debit"}, "credit": {"$sum": "$credit"}}},
+        ]).to_list(1)
+        assert posted[0]["debit"] == posted[0]["credit"]
+
+        checkpoints = {
+            (row["field"], row["entity_id"], row["month"]): row["increase"] - row["decrease"]
+            async for row in db[CHECKPOINT_COLLECTION].find({}, {"_id": 0})
+        }
+        assert checkpoints == movements
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+def test_concurrent_postings_are_exact():
+    asyncio.run(post_concurrently())